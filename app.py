@@ -1,13 +1,16 @@
 import streamlit as st
-import pandas as pd
 import extra_streamlit_components as stx
 import datetime
+import functools
 import time
+import numpy as np
+import pandas as pd
 
 # --- Custom Modules ---
 import utils_data as ud
 import utils_style as us
 import utils_chart as uc
+import utils_perf as perf
 
 # --- 1. Page Initialization ---
 st.set_page_config(page_title="戰略指揮中心", layout="wide", page_icon="🏯")
@@ -19,6 +22,10 @@ cookie_manager = stx.CookieManager()
 # Initialize Session State
 if 'last_selected_member' not in st.session_state:
     st.session_state.last_selected_member = None
+if 'radar_presets' not in st.session_state:
+    st.session_state.radar_presets = {}
+
+SEARCH_LIMIT = 100  # 側欄搜尋結果的上限 (依相關程度排序)
 
 DEFAULT_FILTERS = {
     'q_merit_op': '大於 >=', 'q_merit_val': 0,
@@ -44,9 +51,11 @@ def update_font_cookie():
     cookie_manager.set("font_size", st.session_state.font_size_slider)
     st.session_state.font_size = st.session_state.font_size_slider
 
-def update_frontline_cookie():
-    cookie_manager.set("frontline_regions", ",".join(st.session_state.frontline_select))
-    st.session_state.frontline_regions = st.session_state.frontline_select
+def update_frontline_cookie(options):
+    # 目前分組篩選下看不到的地區不在選項內，保留原本的勾選
+    hidden = [r for r in st.session_state.frontline_regions if r not in options]
+    st.session_state.frontline_regions = hidden + st.session_state.frontline_select
+    cookie_manager.set("frontline_regions", ",".join(st.session_state.frontline_regions))
 
 # --- 3. Authentication ---
 def check_password():
@@ -82,10 +91,12 @@ def check_password():
             st.stop()
 
 check_password()
+perf.begin('rerun')
 
 # --- 4. Helper Functions (Interaction) ---
-def set_preset(preset_type):
-    config = ud.RADAR_CONFIG.get(preset_type, {})
+def set_preset(preset_type, config=None):
+    if config is None:
+        config = ud.RADAR_CONFIG.get(preset_type, {})
     updates = {
         'q_merit_op': config.get('merit_op', '大於 >='),
         'q_merit_val': config.get('merit_val', 0),
@@ -100,19 +111,26 @@ def set_preset(preset_type):
     for key, value in updates.items():
         st.session_state[key] = value
 
+def save_radar_preset():
+    name = st.session_state.radar_preset_name.strip()
+    if not name:
+        return
+    st.session_state.radar_presets[name] = {
+        'desc': name,
+        'merit_op': st.session_state.q_merit_op, 'merit_val': st.session_state.q_merit_val,
+        'power_op': st.session_state.q_power_op, 'power_val': st.session_state.q_power_val,
+        'eff_op': st.session_state.q_eff_op, 'eff_val': st.session_state.q_eff_val,
+    }
+    st.session_state.radar_preset_name = ""
+
 @st.dialog("王牌戰略檔案", width="large")
-def show_member_popup(member_name, raw_df, g_max_m, g_max_p, g_min_p, merit_threshold):
-    # Calculate individual history
-    member_data = raw_df[raw_df['成員'] == member_name].copy()
-    member_data['date_only'] = member_data['紀錄時間'].dt.date
-    history = member_data.sort_values('紀錄時間').groupby('date_only').tail(1)
-    
-    # Calculate differences
-    history['time_diff'] = history['紀錄時間'].diff().dt.total_seconds() / 86400
-    history['merit_diff'] = history['戰功總量'].diff()
-    history['power_diff'] = history['勢力值'].diff()
-    history['daily_merit_growth'] = (history['merit_diff'] / history['time_diff']).fillna(0)
-    history['daily_power_growth'] = (history['power_diff'] / history['time_diff']).fillna(0)
+def show_member_popup(member_name, member_index, g_max_m, g_max_p, g_min_p, merit_threshold):
+    # Individual history (indexed daily velocity, precomputed per data version)
+    history = member_index.history(member_name)
+    if history.empty:
+        st.markdown(f"## {member_name}")
+        st.info("查無此成員的歷史資料")
+        return
     
     current_stats = history.iloc[-1]
     
@@ -140,223 +158,414 @@ def show_member_popup(member_name, raw_df, g_max_m, g_max_p, g_min_p, merit_thre
 st.sidebar.title("🎛️ 指揮台")
 uploaded_files = st.sidebar.file_uploader("📥 上傳", type=['csv'], accept_multiple_files=True)
 if uploaded_files:
-    if sum([ud.save_uploaded_file(f) for f in uploaded_files]):
-        st.sidebar.success("已存檔")
-
-raw_df = ud.load_data_from_folder()
-if raw_df.empty:
+    # 上傳元件在每次 rerun 都會回傳同一批檔案，只匯入尚未處理過的
+    ingested_ids = st.session_state.setdefault('ingested_upload_ids', set())
+    new_uploads = [f for f in uploaded_files if f.file_id not in ingested_ids]
+    if new_uploads:
+        ingested_count = ud.ingest_uploaded_files(new_uploads)
+        ingested_ids.update(f.file_id for f in new_uploads)
+        if ingested_count:
+            st.sidebar.success(f"已匯入 {ingested_count} 個快照")
+if st.sidebar.button("♻️ 重建快取", help="清除已解析的快照快取並重新讀取所有 CSV"):
+    ud.rebuild_snapshot_cache()
+
+# 全程序共用的唯讀資料集；本 session 只保存篩選與選取狀態
+dataset = ud.get_dataset()
+# 載入報告須在資料集載入之後讀取，冷啟動時才看得到本次載入的檔案；無資料時也顯示，方便排查解析失敗
+with st.sidebar.expander("📂 已載入快照"):
+    st.dataframe(ud.get_load_report(), hide_index=True, use_container_width=True)
+if dataset.empty:
     st.warning("無資料 - 請上傳 CSV 至 '盟戰資料庫'")
+    perf.log_run(perf.end())
     st.stop()
 
-latest_df = raw_df[raw_df['紀錄時間'] == raw_df['紀錄時間'].max()].copy()
+data_version = dataset.version
+latest_df = dataset.latest
 latest_time_str = latest_df['紀錄時間'].iloc[0].strftime('%Y/%m/%d %H:%M')
 st.sidebar.caption(f"📅 {latest_time_str}")
 
 st.sidebar.markdown("---")
 st.sidebar.markdown(f"<div style='text-align: center; color: #666; font-size: 0.8rem;'>戰略指揮中心 v57.0 (Refactor)<br>Updated: {latest_time_str}</div>", unsafe_allow_html=True)
 
-all_groups = list(latest_df['分組'].unique())
+all_groups = dataset.groups
 selected_groups = st.sidebar.multiselect("分組", all_groups, default=all_groups)
-filtered_df = latest_df[latest_df['分組'].isin(selected_groups)]
+filtered_df = dataset.filtered(selected_groups)
+group_key = dataset.group_filter(selected_groups)
+
+# 門檻由各分組的分位數摘要合併而得 (相對誤差 ≤ 1%)，不必每次排序最新快照
+MERIT_THRESHOLD_95 = dataset.sketches.quantile(0.95, '戰功總量', groups=group_key)
+velocity_tables = dataset.velocity
+member_index = dataset.member_index
+G_MAX_M, G_MAX_P, G_MIN_P = dataset.global_max
 
-MERIT_THRESHOLD_95 = filtered_df['戰功總量'].quantile(0.95)
-G_MAX_M, G_MAX_P, G_MIN_P = ud.get_individual_global_max(raw_df)
+with st.sidebar.expander("🧠 記憶體"):
+    shared_report = dataset.memory_report()
+    st.caption(f"共用資料 {shared_report['bytes'].sum() / 1e6:.2f} MB | 本連線 {ud.session_memory_bytes(st.session_state) / 1e3:.1f} KB")
+    st.dataframe(shared_report, hide_index=True, use_container_width=True)
+
+show_perf = st.sidebar.toggle("⏱️ 效能", key="perf_overlay", help="顯示本次 rerun 各區段耗時、快取命中與列數")
+perf_slot = st.sidebar.empty()
 
 st.sidebar.markdown("---")
 search_keyword = st.sidebar.text_input("搜索", placeholder="關鍵字...")
-target_member = None
 
 if search_keyword:
-    matched_members = filtered_df[filtered_df['成員'].str.contains(search_keyword, na=False)]['成員'].unique()
+    # 名稱索引依資料版本建立一次；照字面比對 (不是正規表示式)，繁簡字視為相同
+    matched_members = dataset.member_search.search(search_keyword, limit=SEARCH_LIMIT, groups=selected_groups)
     if len(matched_members) > 0:
         selected_member = st.sidebar.selectbox("結果", matched_members)
         if st.sidebar.button("調用"):
-            show_member_popup(selected_member, raw_df, G_MAX_M, G_MAX_P, G_MIN_P, MERIT_THRESHOLD_95)
+            show_member_popup(selected_member, member_index, G_MAX_M, G_MAX_P, G_MIN_P, MERIT_THRESHOLD_95)
     else:
         st.sidebar.warning("無結果")
 
 st.markdown("<h2 style='color:#DDD;'>🏯 戰略指揮中心</h2>", unsafe_allow_html=True)
 
 # --- KPI Section ---
-avg_efficiency = filtered_df['戰功效率'].mean()
+# KPI、集團軍情報與戰區人數都由預先彙總的 cube 合併格子取得，不必掃描成員
+cube = dataset.cube
+kpi = cube.totals(groups=group_key)
+avg_efficiency = kpi['eff_mean']
 eff_class = us.get_eff_class(avg_efficiency)
 
 kpi1, kpi2, kpi3, kpi4 = st.columns(4)
-with kpi1: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>總戰功</div><div class='kpi-value'>{us.format_k(filtered_df['戰功總量'].sum())}</div></div>", unsafe_allow_html=True)
-with kpi2: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>總勢力</div><div class='kpi-value'>{us.format_k(filtered_df['勢力值'].sum())}</div></div>", unsafe_allow_html=True)
-with kpi3: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>活躍人數</div><div class='kpi-value'>{len(filtered_df):,}</div></div>", unsafe_allow_html=True)
+with kpi1: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>總戰功</div><div class='kpi-value'>{us.format_k(int(kpi['merit_sum']))}</div></div>", unsafe_allow_html=True)
+with kpi2: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>總勢力</div><div class='kpi-value'>{us.format_k(int(kpi['power_sum']))}</div></div>", unsafe_allow_html=True)
+with kpi3: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>活躍人數</div><div class='kpi-value'>{kpi['count']:,}</div></div>", unsafe_allow_html=True)
 with kpi4: st.markdown(f"<div class='kpi-card'><div class='kpi-label'>平均效率</div><div class='kpi-value {eff_class}'>{avg_efficiency:.2f}</div></div>", unsafe_allow_html=True)
 
 st.markdown(f"""<div class="version-tag">v57.0 | {latest_time_str}</div>""", unsafe_allow_html=True)
 
+# --- Dashboard Cards ---
+# 每張卡片都是獨立的 fragment：卡片內的元件變動只重跑該卡片，
+# 參數即為卡片所需的全部輸入，側欄篩選改變時才會整頁重跑。
+popup_ctx = (member_index, G_MAX_M, G_MAX_P, G_MIN_P, MERIT_THRESHOLD_95)
+
+def open_member_popup(target_member, popup_ctx):
+    if target_member and target_member != st.session_state.last_selected_member:
+        st.session_state.last_selected_member = target_member
+        show_member_popup(target_member, *popup_ctx)
+
+def perf_card(name):
+    """卡片計時：整頁 rerun 時併入該次紀錄；fragment 單獨重跑時自成一筆並顯示在卡片底部。"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with perf.section(f"card:{name}") as run:
+                fn(*args, **kwargs)
+            if run is not None and st.session_state.get('perf_overlay'):
+                st.caption(perf.summary(run))
+        return wrapper
+    return decorator
+
 # --- Strategic Velocity Section ---
-velocity_all_data = ud.calculate_daily_velocity(raw_df, group_col='分組')
-grp_max_m = velocity_all_data['daily_merit_growth'].max()
-grp_max_p = velocity_all_data['daily_power_growth'].max()
-grp_min_p = velocity_all_data['daily_power_growth'].min()
-
-avg_velocity_data = ud.calculate_daily_velocity(raw_df)
-av_max_m = avg_velocity_data['daily_merit_growth'].max()
-av_max_p = avg_velocity_data['daily_power_growth'].max()
-av_min_p = avg_velocity_data['daily_power_growth'].min()
-
-st.markdown("<div class='dashboard-card card-cyan'>", unsafe_allow_html=True)
-st.markdown("### 📈 戰略動能")
-chart_col1, chart_col2 = st.columns(2)
-with chart_col1:
-    st.caption("🌍 全盟")
-    st.altair_chart(uc.get_dual_axis_growth_chart(avg_velocity_data, av_max_m, av_max_p, av_min_p).configure_legend(orient='top').interactive(), use_container_width=True)
-with chart_col2:
-    st.caption("🚩 分組")
-    target_group = st.selectbox("分組", all_groups, key="target_group_select", label_visibility="collapsed")
-    group_velocity = velocity_all_data[velocity_all_data['分組'] == target_group]
-    st.altair_chart(uc.get_dual_axis_growth_chart(group_velocity, grp_max_m, grp_max_p, grp_min_p).configure_legend(orient='top').interactive(), use_container_width=True)
-st.markdown("</div>", unsafe_allow_html=True)
+@st.fragment
+@perf_card("velocity")
+def render_velocity_card(velocity_tables, all_groups):
+    velocity_all_data = velocity_tables.group
+    grp_max_m = velocity_all_data['daily_merit_growth'].max()
+    grp_max_p = velocity_all_data['daily_power_growth'].max()
+    grp_min_p = velocity_all_data['daily_power_growth'].min()
+
+    avg_velocity_data = velocity_tables.alliance
+    av_max_m = avg_velocity_data['daily_merit_growth'].max()
+    av_max_p = avg_velocity_data['daily_power_growth'].max()
+    av_min_p = avg_velocity_data['daily_power_growth'].min()
+
+    st.markdown("<div class='dashboard-card card-cyan'>", unsafe_allow_html=True)
+    header_col1, header_col2 = st.columns([4, 1])
+    with header_col1: st.markdown("### 📈 戰略動能")
+    with header_col2: full_res = st.toggle("🔍 完整", key="velocity_full_res", help="完整解析度：只載入選定區間的資料，不降採樣")
+
+    # 預設降採樣；完整解析度模式改以區間分段載入原始點
+    max_points = uc.MAX_CHART_POINTS
+    times = avg_velocity_data['紀錄時間']
+    if full_res and times.nunique() > 1:
+        t_min, t_max = times.min().to_pydatetime(), times.max().to_pydatetime()
+        default_start = max(t_min, t_max - datetime.timedelta(days=14))
+        window = st.slider("區間", min_value=t_min, max_value=t_max, value=(default_start, t_max), format="MM/DD", key="velocity_window", label_visibility="collapsed")
+        avg_velocity_data = uc.time_window(avg_velocity_data, *window)
+        velocity_all_data = uc.time_window(velocity_all_data, *window)
+        max_points = None
+
+    chart_col1, chart_col2 = st.columns(2)
+    with chart_col1:
+        st.caption("🌍 全盟")
+        chart = uc.get_dual_axis_growth_chart(avg_velocity_data, av_max_m, av_max_p, av_min_p, max_points).configure_legend(orient='top').interactive()
+        with perf.timer("st.altair_chart"): st.altair_chart(chart, use_container_width=True)
+    with chart_col2:
+        st.caption("🚩 分組")
+        target_group = st.selectbox("分組", all_groups, key="target_group_select", label_visibility="collapsed")
+        group_velocity = velocity_all_data[velocity_all_data['分組'] == target_group]
+        chart = uc.get_dual_axis_growth_chart(group_velocity, grp_max_m, grp_max_p, grp_min_p, max_points).configure_legend(orient='top').interactive()
+        with perf.timer("st.altair_chart"): st.altair_chart(chart, use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
 
 # --- Group Intelligence Section ---
-st.markdown("<div class='dashboard-card card-red'>", unsafe_allow_html=True)
-header_col1, header_col2 = st.columns([4, 1])
-with header_col1: st.markdown("### 🏳️ 集團軍情報")
-with header_col2: font_size = st.slider("字體", 14, 30, value=st.session_state.font_size, key="font_size_slider", on_change=update_font_cookie, label_visibility="collapsed")
-
-group_stats = filtered_df.groupby('分組').agg(
-    n=('成員','count'), 
-    wm=('戰功總量','sum'), 
-    awm=('戰功總量','mean'), 
-    p=('勢力值','sum'), 
-    ap=('勢力值','mean')
-).reset_index().sort_values('wm', ascending=False)
-
-html_content = f"<style>.clean-table td, .clean-table th {{ font-size: {font_size}px; }}</style><table class='clean-table'><thead><tr><th>分組</th><th>人數</th><th>總戰功</th><th>平均戰功</th><th>總勢力</th><th>平均勢力</th></tr></thead><tbody>"
-for _, row in group_stats.iterrows():
-    html_content += f"<tr><td>{row['分組']}</td><td>{row['n']}</td><td>{us.format_k(row['wm'])}</td><td>{us.format_k(row['awm'])}</td><td>{us.format_k(row['p'])}</td><td>{us.format_k(row['ap'])}</td></tr>"
-html_content += "</tbody></table>"
-st.markdown(html_content, unsafe_allow_html=True)
-st.markdown("</div>", unsafe_allow_html=True)
+@st.fragment
+@perf_card("group")
+def render_group_card(cube, data_version, selected_groups):
+    st.markdown("<div class='dashboard-card card-red'>", unsafe_allow_html=True)
+    header_col1, header_col2 = st.columns([4, 1])
+    with header_col1: st.markdown("### 🏳️ 集團軍情報")
+    with header_col2: font_size = st.slider("字體", 14, 30, value=st.session_state.font_size, key="font_size_slider", on_change=update_font_cookie, label_visibility="collapsed")
+
+    html_content = us.get_group_table_html(cube, data_version, tuple(selected_groups), font_size)
+    st.markdown(html_content, unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
 
 # --- Key Personnel Section ---
-st.markdown("<div class='dashboard-card card-blue'>", unsafe_allow_html=True)
-header_col1, header_col2 = st.columns([4, 1])
-with header_col1: st.markdown("### 🏆 重點人員")
-with header_col2: num_rows = st.number_input("行數", 5, 50, 10, step=5, label_visibility="collapsed")
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.caption("🔥 十大戰功")
-    top_merit = filtered_df.nlargest(num_rows, '戰功總量')[['成員','分組','戰功總量']]
-    if not top_merit.empty:
-        styled_merit = us.style_df_full(top_merit, MERIT_THRESHOLD_95)
-        event_merit = st.dataframe(styled_merit, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key="table_merit")
-        if len(event_merit.selection['rows']): target_member = top_merit.iloc[event_merit.selection['rows'][0]]['成員']
-
-with col2:
-    st.caption("⚡ 十大效率")
-    top_efficiency = filtered_df[filtered_df['勢力值']>10000].nlargest(num_rows, '戰功效率')[['成員','分組','戰功效率']]
-    if not top_efficiency.empty:
-        styled_eff = top_efficiency.style.format({"戰功效率": "{:.2f}"}).map(us.get_eff_style, subset=pd.IndexSlice[:, ['戰功效率']])
-        event_eff = st.dataframe(styled_eff, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key="table_eff")
-        if len(event_eff.selection['rows']): target_member = top_efficiency.iloc[event_eff.selection['rows'][0]]['成員']
-
-st.markdown("</div>", unsafe_allow_html=True)
+@st.fragment
+@perf_card("personnel")
+def render_personnel_card(filtered_df, merit_threshold, popup_ctx):
+    target_member = None
+    st.markdown("<div class='dashboard-card card-blue'>", unsafe_allow_html=True)
+    header_col1, header_col2 = st.columns([4, 1])
+    with header_col1: st.markdown("### 🏆 重點人員")
+    with header_col2: num_rows = st.number_input("行數", 5, 50, 10, step=5, label_visibility="collapsed")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.caption("🔥 十大戰功")
+        top_merit = filtered_df.nlargest(num_rows, '戰功總量')[['成員','分組','戰功總量']]
+        if not top_merit.empty:
+            styled_merit = us.style_df_full(top_merit, merit_threshold)
+            with perf.timer("st.dataframe"): event_merit = st.dataframe(styled_merit, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key="table_merit")
+            if len(event_merit.selection['rows']): target_member = top_merit.iloc[event_merit.selection['rows'][0]]['成員']
+
+    with col2:
+        st.caption("⚡ 十大效率")
+        top_efficiency = filtered_df[filtered_df['勢力值']>10000].nlargest(num_rows, '戰功效率')[['成員','分組','戰功效率']]
+        if not top_efficiency.empty:
+            styled_eff = us.style_df_full(top_efficiency, merit_threshold)
+            with perf.timer("st.dataframe"): event_eff = st.dataframe(styled_eff, hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key="table_eff")
+            if len(event_eff.selection['rows']): target_member = top_efficiency.iloc[event_eff.selection['rows'][0]]['成員']
+
+    st.markdown("</div>", unsafe_allow_html=True)
+    open_member_popup(target_member, popup_ctx)
 
 # --- Tactical Radar Section ---
-st.markdown("<div class='dashboard-card card-purple'>", unsafe_allow_html=True)
-st.markdown("### 🛰️ 戰術雷達")
-
-# Preset Buttons
-preset_col1, preset_col2, preset_col3, preset_col4 = st.columns(4)
-with preset_col1:
-    if st.button(ud.RADAR_CONFIG['slave']['desc'], use_container_width=True): set_preset('slave')
-with preset_col2:
-    if st.button(ud.RADAR_CONFIG['newbie']['desc'], use_container_width=True): set_preset('newbie')
-with preset_col3:
-    if st.button(ud.RADAR_CONFIG['elite']['desc'], use_container_width=True): set_preset('elite')
-with preset_col4:
-    if st.button(ud.RADAR_CONFIG['reset']['desc'], use_container_width=True): set_preset('reset')
-
-st.markdown("---")
-
-# Filter Controls
-filter_col1, filter_col2, filter_col3, filter_col4 = st.columns([1.2, 1.2, 0.8, 0.8])
-with filter_col1: 
-    st.caption("戰功")
-    st.selectbox("", ["大於 >=", "小於 <="], key="q_merit_op", label_visibility="collapsed")
-    st.number_input("", step=10000, key="q_merit_val", label_visibility="collapsed")
-with filter_col2: 
-    st.caption("勢力")
-    st.selectbox("", ["大於 >=", "小於 <="], key="q_power_op", label_visibility="collapsed")
-    st.number_input("", step=5000, key="q_power_val", label_visibility="collapsed")
-with filter_col3: 
-    st.caption("效率")
-    st.selectbox("", ["大於 >=", "小於 <="], key="q_eff_op", label_visibility="collapsed")
-    st.number_input("", step=1.0, key="q_eff_val", label_visibility="collapsed")
-with filter_col4: 
-    st.caption("Top N")
-    st.number_input("", step=10, key="q_rank", label_visibility="collapsed")
-
-# Apply Filters
-query_df = filtered_df.copy()
-
-if "大於" in st.session_state.q_merit_op:
-    query_df = query_df[query_df['戰功總量'] >= st.session_state.q_merit_val]
-else:
-    query_df = query_df[query_df['戰功總量'] <= st.session_state.q_merit_val]
-
-if "大於" in st.session_state.q_power_op:
-    query_df = query_df[query_df['勢力值'] >= st.session_state.q_power_val]
-else:
-    query_df = query_df[query_df['勢力值'] <= st.session_state.q_power_val]
-
-if "大於" in st.session_state.q_eff_op:
-    query_df = query_df[query_df['戰功效率'] >= st.session_state.q_eff_val]
-else:
-    query_df = query_df[query_df['戰功效率'] <= st.session_state.q_eff_val]
-
-query_df = query_df[query_df['貢獻排行'] <= st.session_state.q_rank].sort_values('貢獻排行')
-
-st.markdown(f"<div style='margin-top:10px;color:#AAA'>🎯 鎖定 {len(query_df)} 目標</div>", unsafe_allow_html=True)
-if not query_df.empty:
-    display_cols = ['成員', '分組', '貢獻排行', '戰功總量', '勢力值', '戰功效率']
-    query_display_df = query_df[display_cols].copy()
-    event_query = st.dataframe(us.style_df_full(query_display_df, MERIT_THRESHOLD_95), use_container_width=True, hide_index=True, on_select="rerun", selection_mode="single-row", key="table_query")
-    if len(event_query.selection['rows']): target_member = query_df.iloc[event_query.selection['rows'][0]]['成員']
-st.markdown("</div>", unsafe_allow_html=True)
+@st.fragment
+@perf_card("radar")
+def render_radar_card(radar_index, selected_groups, merit_threshold, popup_ctx):
+    target_member = None
+    st.markdown("<div class='dashboard-card card-purple'>", unsafe_allow_html=True)
+    st.markdown("### 🛰️ 戰術雷達")
+
+    # Preset Buttons
+    preset_col1, preset_col2, preset_col3, preset_col4 = st.columns(4)
+    with preset_col1:
+        if st.button(ud.RADAR_CONFIG['slave']['desc'], use_container_width=True): set_preset('slave')
+    with preset_col2:
+        if st.button(ud.RADAR_CONFIG['newbie']['desc'], use_container_width=True): set_preset('newbie')
+    with preset_col3:
+        if st.button(ud.RADAR_CONFIG['elite']['desc'], use_container_width=True): set_preset('elite')
+    with preset_col4:
+        if st.button(ud.RADAR_CONFIG['reset']['desc'], use_container_width=True): set_preset('reset')
+
+    # Saved Presets (本次連線自訂，結果與內建預設一樣由索引記住)
+    saved_presets = st.session_state.radar_presets
+    if saved_presets:
+        radar_index.prepare(saved_presets.values())
+        saved_cols = st.columns(min(len(saved_presets), 4))
+        for i, (name, config) in enumerate(saved_presets.items()):
+            with saved_cols[i % len(saved_cols)]:
+                if st.button(f"⭐ {name}", key=f"radar_preset_{name}", use_container_width=True): set_preset(name, config)
+    with st.expander("💾 儲存目前條件"):
+        save_col1, save_col2 = st.columns([3, 1])
+        with save_col1: st.text_input("名稱", key="radar_preset_name", placeholder="預設名稱...", label_visibility="collapsed")
+        with save_col2: st.button("儲存", on_click=save_radar_preset, use_container_width=True)
+
+    st.markdown("---")
+
+    # Filter Controls
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns([1.2, 1.2, 0.8, 0.8])
+    with filter_col1: 
+        st.caption("戰功")
+        st.selectbox("", ["大於 >=", "小於 <="], key="q_merit_op", label_visibility="collapsed")
+        st.number_input("", step=10000, key="q_merit_val", label_visibility="collapsed")
+    with filter_col2: 
+        st.caption("勢力")
+        st.selectbox("", ["大於 >=", "小於 <="], key="q_power_op", label_visibility="collapsed")
+        st.number_input("", step=5000, key="q_power_val", label_visibility="collapsed")
+    with filter_col3: 
+        st.caption("效率")
+        st.selectbox("", ["大於 >=", "小於 <="], key="q_eff_op", label_visibility="collapsed")
+        st.number_input("", step=1.0, key="q_eff_val", label_visibility="collapsed")
+    with filter_col4: 
+        st.caption("Top N")
+        st.number_input("", step=10, key="q_rank", label_visibility="collapsed")
+
+    # Apply Filters
+    radar_filter = ud.RadarFilter(
+        st.session_state.q_merit_op, st.session_state.q_merit_val,
+        st.session_state.q_power_op, st.session_state.q_power_val,
+        st.session_state.q_eff_op, st.session_state.q_eff_val,
+    )
+    query_df = radar_index.query(radar_filter, rank_cap=st.session_state.q_rank, groups=selected_groups)
+
+    st.markdown(f"<div style='margin-top:10px;color:#AAA'>🎯 鎖定 {len(query_df)} 目標</div>", unsafe_allow_html=True)
+    if not query_df.empty:
+        display_cols = ['成員', '分組', '貢獻排行', '戰功總量', '勢力值', '戰功效率']
+        query_display_df = query_df[display_cols]
+        with perf.timer("st.dataframe"): event_query = st.dataframe(**us.table_view(query_display_df, merit_threshold), use_container_width=True, hide_index=True, on_select="rerun", selection_mode="single-row", key="table_query")
+        if len(event_query.selection['rows']): target_member = query_df.iloc[event_query.selection['rows'][0]]['成員']
+    st.markdown("</div>", unsafe_allow_html=True)
+    open_member_popup(target_member, popup_ctx)
 
 # --- Warzone Monitoring Section ---
-st.markdown("<div class='dashboard-card card-gold'>", unsafe_allow_html=True)
-st.markdown("### 🗺️ 戰區監控")
-war_col1, war_col2 = st.columns([1, 2])
-all_regions = list(filtered_df['所屬勢力'].unique())
-
-with war_col1: 
-    st.caption("📍 前線")
-    frontline_regions = st.multiselect("", all_regions, key="frontline_select", default=st.session_state.frontline_regions, on_change=update_frontline_cookie, label_visibility="collapsed")
-
-with war_col2:
-    region_counts = filtered_df['所屬勢力'].value_counts().reset_index()
-    region_counts.columns = ['地區', '人數']
-    region_counts['狀態'] = region_counts['地區'].apply(lambda x: '🔥 前線' if x in frontline_regions else '💤 後方')
-    st.altair_chart(uc.get_warzone_bar_chart(region_counts), use_container_width=True)
-    
-if frontline_regions:
-    in_frontline = filtered_df[filtered_df['所屬勢力'].isin(frontline_regions)]
-    not_in_frontline = filtered_df[~filtered_df['所屬勢力'].isin(frontline_regions)]
-    participation_rate = len(in_frontline) / len(filtered_df) * 100
-    
-    metric_col1, metric_col2 = st.columns(2)
-    metric_col1.metric("前線", f"{len(in_frontline)}", delta=f"{participation_rate:.1f}%")
-    metric_col2.metric("滯留", f"{len(not_in_frontline)}", delta="-未到", delta_color="inverse")
-    
-    with st.expander(f"📋 滯留名單 ({len(not_in_frontline)}人)"): 
-        slacker_data = not_in_frontline[['成員', '分組', '所屬勢力', '勢力值']].copy()
-        if not slacker_data.empty:
-            st.dataframe(slacker_data.style.format({"勢力值": us.format_k}).map(us.get_power_style, subset=pd.IndexSlice[:, ['勢力值']]), use_container_width=True, hide_index=True)
-else:
-    st.info("請勾選前線")
-st.markdown("</div>", unsafe_allow_html=True)
-
-# --- Final Popup Trigger ---
-if target_member and target_member != st.session_state.last_selected_member:
-    st.session_state.last_selected_member = target_member
-    show_member_popup(target_member, raw_df, G_MAX_M, G_MAX_P, G_MIN_P, MERIT_THRESHOLD_95)
\ No newline at end of file
+@st.fragment
+@perf_card("warzone")
+def render_warzone_card(filtered_df, cube, group_key, region_stays):
+    st.markdown("<div class='dashboard-card card-gold'>", unsafe_allow_html=True)
+    st.markdown("### 🗺️ 戰區監控")
+    war_col1, war_col2 = st.columns([1, 2])
+    region_stats = cube.by('所屬勢力', groups=group_key)
+    all_regions = region_stats['所屬勢力'].tolist()
+
+    with war_col1: 
+        st.caption("📍 前線")
+        frontline_default = [r for r in st.session_state.frontline_regions if r in all_regions]
+        frontline_regions = st.multiselect("", all_regions, key="frontline_select", default=frontline_default, on_change=update_frontline_cookie, args=(all_regions,), label_visibility="collapsed")
+
+    with war_col2:
+        is_front = region_stats['所屬勢力'].isin(frontline_regions).to_numpy()
+        region_counts = pd.DataFrame({
+            '地區': region_stats['所屬勢力'],
+            '人數': region_stats['count'],
+            '狀態': np.where(is_front, '🔥 前線', '💤 後方'),
+        })
+        chart = uc.get_warzone_bar_chart(region_counts)
+        with perf.timer("st.altair_chart"): st.altair_chart(chart, use_container_width=True)
+        
+    if frontline_regions:
+        n_total = cube.totals(groups=group_key)['count']
+        n_front = int(region_stats['count'].to_numpy()[is_front].sum())
+        n_behind = n_total - n_front
+        participation_rate = n_front / n_total * 100
+        
+        metric_col1, metric_col2 = st.columns(2)
+        metric_col1.metric("前線", f"{n_front}", delta=f"{participation_rate:.1f}%")
+        metric_col2.metric("滯留", f"{n_behind}", delta="-未到", delta_color="inverse")
+        
+        with st.expander(f"📋 滯留名單 ({n_behind}人)"): 
+            # 名單本身需要逐一列出成員，只有這裡才掃描快照
+            in_frontline = filtered_df['所屬勢力'].isin(frontline_regions).to_numpy()
+            slacker_data = filtered_df.loc[~in_frontline, ['成員', '分組', '所屬勢力', '勢力值']]
+            if not slacker_data.empty:
+                with perf.timer("st.dataframe"): st.dataframe(**us.table_view(slacker_data), use_container_width=True, hide_index=True)
+    else:
+        st.info("請勾選前線")
+    st.markdown("</div>", unsafe_allow_html=True)
+    # 與戰區監控同一個 fragment，前線勾選變動時一起更新
+    render_frontline_trend(region_stays, frontline_regions, group_key)
+
+MOVER_WINDOWS = {"最新": None, "24 小時": pd.Timedelta(hours=24), "7 天": pd.Timedelta(days=7)}
+
+def render_frontline_trend(region_stays, frontline_regions, group_key):
+    st.markdown("<div class='dashboard-card card-gold'>", unsafe_allow_html=True)
+    header_col1, header_col2 = st.columns([4, 1])
+    with header_col1: st.markdown("### 🧭 前線動向")
+    with header_col2: window = st.selectbox("範圍", list(MOVER_WINDOWS), key="mover_window", label_visibility="collapsed")
+    if not frontline_regions:
+        st.info("請勾選前線")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    # 人數由各成員的地區停留區段預先累加，整季歷史也不必掃描成員資料
+    headcount = region_stays.headcount(frontline_regions, group_key)
+    chart = uc.get_frontline_trend_chart(headcount).interactive()
+    with perf.timer("st.altair_chart"): st.altair_chart(chart, use_container_width=True)
+
+    latest_time = pd.Timestamp(region_stays.times[-1])
+    span = MOVER_WINDOWS[window]
+    # span 為 None 時只看最新快照的進出
+    movers = region_stays.recent_moves(since=latest_time - span if span is not None else None, regions=frontline_regions, groups=group_key)
+    arrived = movers['到'].isin(frontline_regions).to_numpy()
+    st.caption(f"🔥 抵達 {int(arrived.sum())} | 💨 撤離 {int((~arrived).sum())}")
+    if not movers.empty:
+        movers_view = pd.DataFrame({
+            '時間': movers['紀錄時間'].dt.strftime('%m/%d %H:%M'),
+            '成員': movers['成員'],
+            '分組': movers['分組'],
+            '動向': np.where(arrived, '🔥 抵達', '💨 撤離'),
+            '從': movers['從'].astype(object).fillna('（新加入）'),
+            '到': movers['到'].astype(object).fillna('（離開）'),
+        })
+        with perf.timer("st.dataframe"): st.dataframe(movers_view, hide_index=True, use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+# --- Snapshot Diff Section ---
+DIFF_VIEWS = {
+    "⚔️ 戰功": (['成員', '分組', '戰功增加', '戰功總量', '排名變化'], '戰功增加', False),
+    "📉 排名": (['成員', '分組', '貢獻排行', '排名變化', '戰功增加'], '排名變化', True),
+    "🚚 換區": (['成員', '分組', '原勢力', '現勢力', '勢力值'], '勢力值', False),
+    "👋 進出": (['成員', '分組', '狀態', '原勢力', '現勢力', '勢力值'], '狀態', True),
+}
+
+@st.fragment
+@perf_card("diff")
+def render_diff_card(dataset, group_key, merit_threshold, popup_ctx):
+    target_member = None
+    st.markdown("<div class='dashboard-card card-cyan'>", unsafe_allow_html=True)
+    st.markdown("### 🔄 快照對比")
+    times = [pd.Timestamp(t) for t in dataset.snapshot_times]
+    if len(times) < 2:
+        st.info("至少需要兩個快照")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    # 預設比較上週日晚上 (本週一之前的最後一個快照) 與最新快照
+    week_start = times[-1].normalize() - pd.Timedelta(days=times[-1].dayofweek)
+    default_before = dataset.as_of(week_start - pd.Timedelta(microseconds=1))
+    if default_before == times[-1]:
+        default_before = times[-2]
+    t1, t2 = st.select_slider("區間", options=times, value=(default_before, times[-1]), format_func=lambda t: t.strftime('%m/%d %H:%M'), key="diff_window", label_visibility="collapsed")
+
+    # 成員以預先建立的鍵值對齊，結果依 (t1, t2) 快取；這裡只剩分組篩選
+    diff = dataset.diff(t1, t2)
+    if group_key is not None:
+        diff = diff[diff['分組'].isin(group_key)]
+    stayed = diff[diff['狀態'] == '留任']
+
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+    metric_col1.metric("戰功增加", us.format_k(stayed['戰功增加'].sum()))
+    metric_col2.metric("換區", f"{int(diff['換區'].sum())}")
+    metric_col3.metric("新加入", f"{int((diff['狀態'] == '新加入').sum())}")
+    metric_col4.metric("離開", f"{int((diff['狀態'] == '離開').sum())}")
+
+    view = st.radio("檢視", list(DIFF_VIEWS), horizontal=True, key="diff_view", label_visibility="collapsed")
+    columns, sort_col, ascending = DIFF_VIEWS[view]
+    if view == "🚚 換區":
+        rows = diff[diff['換區']]
+    elif view == "👋 進出":
+        rows = diff[diff['狀態'] != '留任']
+    else:
+        rows = stayed
+    rows = rows.sort_values(sort_col, ascending=ascending)[columns]
+    if view != "👋 進出":
+        # 留任者前後都有數值，差值以整數顯示
+        rows = rows.astype({col: 'int64' for col in columns if col not in ('成員', '分組', '原勢力', '現勢力')})
+    if not rows.empty:
+        with perf.timer("st.dataframe"): event_diff = st.dataframe(**us.table_view(rows, merit_threshold), hide_index=True, use_container_width=True, on_select="rerun", selection_mode="single-row", key="table_diff")
+        if len(event_diff.selection['rows']): target_member = rows.iloc[event_diff.selection['rows'][0]]['成員']
+    else:
+        st.caption("無變化")
+    st.markdown("</div>", unsafe_allow_html=True)
+    open_member_popup(target_member, popup_ctx)
+
+render_velocity_card(velocity_tables, all_groups)
+render_group_card(cube, data_version, selected_groups)
+render_personnel_card(filtered_df, MERIT_THRESHOLD_95, popup_ctx)
+render_radar_card(dataset.radar_index, selected_groups, MERIT_THRESHOLD_95, popup_ctx)
+render_warzone_card(filtered_df, cube, group_key, dataset.region_stays)
+render_diff_card(dataset, group_key, MERIT_THRESHOLD_95, popup_ctx)
+
+# --- Performance Overlay ---
+perf_run = perf.end()
+perf.log_run(perf_run)
+if show_perf and perf_run is not None:
+    with perf_slot.container():
+        st.caption(perf.summary(perf_run))
+        st.dataframe(perf_run.rows(), hide_index=True, use_container_width=True)
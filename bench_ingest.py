@@ -0,0 +1,74 @@
+"""比較序列與平行讀取快照的冷啟動時間。
+
+用法: python bench_ingest.py [--snapshots 300] [--workers 8]
+以 盟戰資料庫 內的樣本 CSV 複製出指定數量的快照 (時間戳依序遞增) 後量測。
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+import utils_core as core
+
+
+def build_folder(target: str, n_snapshots: int) -> None:
+    samples = sorted(f for f in os.listdir(core.DATA_FOLDER) if f.endswith('.csv'))
+    if not samples:
+        raise SystemExit(f"找不到樣本 CSV: {core.DATA_FOLDER}")
+    start = datetime.datetime(2025, 1, 1)
+    for i in range(n_snapshots):
+        ts = start + datetime.timedelta(hours=i)
+        name = ts.strftime("同盟統計%Y年%m月%d日%H时%M分%S秒.csv")
+        shutil.copyfile(os.path.join(core.DATA_FOLDER, samples[i % len(samples)]), os.path.join(target, name))
+
+
+def run(folder: str, workers: int, cache_dir: str, columns=None) -> tuple:
+    core.CACHE_FOLDER = cache_dir
+    core._ENCODING_CACHE.clear()
+    store = core.SnapshotStore(folder, workers=workers, columns=columns)
+    t0 = time.perf_counter()
+    df = store.sync(force=True)
+    elapsed = time.perf_counter() - t0
+    return elapsed, df, store.version
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshots', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=core.LOAD_WORKERS)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='slg_bench_')
+    try:
+        folder = os.path.join(root, 'data')
+        os.makedirs(folder)
+        build_folder(folder, args.snapshots)
+        print(f"--- {args.snapshots} snapshots, {args.workers} workers ---")
+
+        results = {}
+        for label, workers in [('serial', 1), ('parallel', args.workers)]:
+            cold, df, version = run(folder, workers, os.path.join(root, f'cache_{label}'))
+            warm, _, _ = run(folder, workers, os.path.join(root, f'cache_{label}'))
+            results[label] = (df, version)
+            print(f"{label:>8}: cold {cold:.3f}s | warm (parquet) {warm:.3f}s | rows {len(df):,}")
+
+        same = results['serial'][0].reset_index(drop=True).equals(results['parallel'][0].reset_index(drop=True))
+        print(f"[{'OK' if same else 'FAIL'}] serial and parallel results identical")
+
+        cache_dir = os.path.join(root, 'cache_projected')
+        cold, df, _ = run(folder, args.workers, cache_dir, core.DASHBOARD_COLUMNS)
+        warm, _, _ = run(folder, args.workers, cache_dir, core.DASHBOARD_COLUMNS)
+        full_mb = results['parallel'][0].memory_usage(deep=True).sum() / 1e6
+        proj_mb = df.memory_usage(deep=True).sum() / 1e6
+        print(f"projected: cold {cold:.3f}s | warm (parquet) {warm:.3f}s | {len(df.columns)} cols | {proj_mb:.1f} MB vs {full_mb:.1f} MB")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
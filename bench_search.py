@@ -0,0 +1,60 @@
+"""比較側欄搜尋的 str.contains 掃描與 MemberSearch 索引。
+
+用法: python bench_search.py [--members 200 5000 50000] [--repeat 5]
+名稱以 gen_synthetic_data 產生 (含「分組．暱稱」格式)，查詢取自名稱片段，
+並確認兩種方式找到的成員集合相同 (索引關閉繁簡比對時)。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+import gen_synthetic_data as gen
+from utils_search import MemberSearch
+
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, nargs='+', default=[200, 5_000, 50_000])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for n_members in args.members:
+        rng = np.random.default_rng(args.seed)
+        names = gen.make_names(n_members, rng, rng.integers(0, len(gen.GROUPS), n_members))
+        series = pd.Series(names).astype('category')
+        # 查詢：名稱中隨機的 1~3 字片段
+        queries = []
+        for name in rng.choice(names, args.queries):
+            start = int(rng.integers(0, len(name)))
+            queries.append(name[start:start + int(rng.integers(1, 4))])
+
+        t0 = time.perf_counter()
+        index = MemberSearch(names, variants=False)
+        build = time.perf_counter() - t0
+
+        same = all(set(series[series.str.contains(q, regex=False)]) == set(index.search(q)) for q in queries)
+        scan = timed(lambda: [series[series.str.contains(q, na=False)].unique() for q in queries], args.repeat) / len(queries)
+        lookup = timed(lambda: [index.search(q, limit=100) for q in queries], args.repeat) / len(queries)
+        print(f"{n_members:>7,} members: build {build * 1000:.1f} ms | str.contains {scan * 1e3:.3f} ms | "
+              f"index {lookup * 1e3:.3f} ms | x{scan / lookup:.0f} | [{'OK' if same else 'FAIL'}] same matches")
+
+
+if __name__ == '__main__':
+    main()
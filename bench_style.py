@@ -0,0 +1,107 @@
+"""比較逐格 (Styler.map) 與整欄 (style_df_full) 樣式的渲染時間，以及大表格改送原始資料的效果。
+
+用法: python bench_style.py [--rows 300 3000 30000] [--repeat 3]
+前三欄量測建立 Styler、_compute 與 _translate；floor 為未加任何格式與樣式的 Styler，
+代表 pandas 逐格產生表格本體的固定成本，兩種樣式寫法都省不掉。
+最後兩欄是 st.dataframe 實際的序列化 (marshall_styler + Arrow)：整張表走 Styler，
+以及 table_view 的結果 (超過 STYLER_MAX_ROWS 列時為原始資料表加分級標記欄)。
+Styler 的時間以 floor 為主，整欄預先計算只能省下格式化與上色判斷的部分。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+from pandas.io.formats.style import Styler
+from streamlit import dataframe_util
+from streamlit.elements.lib.pandas_styler_utils import marshall_styler
+from streamlit.proto.ArrowData_pb2 import ArrowData as ArrowProto
+
+import utils_style as us
+
+
+def legacy_style(df: pd.DataFrame, merit_threshold: float):
+    """改寫前的逐格版本，作為基準與結果比對用。"""
+    fmt = {}
+    if '戰功總量' in df.columns: fmt['戰功總量'] = us.format_k
+    if '勢力值' in df.columns: fmt['勢力值'] = us.format_k
+    if '戰功效率' in df.columns: fmt['戰功效率'] = "{:.2f}"
+    s = df.style.format(fmt)
+    if '戰功總量' in df.columns:
+        s = s.map(lambda x: us.get_merit_style(x, merit_threshold), subset=pd.IndexSlice[:, ['戰功總量']])
+    if '勢力值' in df.columns:
+        s = s.map(us.get_power_style, subset=pd.IndexSlice[:, ['勢力值']])
+    if '戰功效率' in df.columns:
+        s = s.map(us.get_eff_style, subset=pd.IndexSlice[:, ['戰功效率']])
+    return s
+
+
+def build_frame(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    merit = rng.integers(0, 3_000_000, n_rows).astype(np.int32)
+    merit[::5] = rng.integers(0, 1_000, len(merit[::5]))  # 涵蓋未滿 1K 的格式
+    return pd.DataFrame({
+        '成員': [f"成員{i}" for i in range(n_rows)],
+        '分組': pd.Categorical(rng.choice(['速農', '攻城', '守備'], n_rows)),
+        '貢獻排行': np.arange(1, n_rows + 1, dtype=np.int32),
+        '戰功總量': merit,
+        '勢力值': rng.integers(0, 60_000, n_rows).astype(np.int32),
+        '戰功效率': (rng.random(n_rows) * 20).astype(np.float32),
+    })
+
+
+def marshal(data) -> None:
+    """st.dataframe 對 data 的序列化：Styler 另需產生顯示值與 CSS。"""
+    proto = ArrowProto()
+    if isinstance(data, Styler):
+        marshall_styler(proto, data, 'bench')
+        data = data.data
+    proto.data = dataframe_util.convert_anything_to_arrow_bytes(data)
+
+
+def render(styler) -> dict:
+    styler._compute()
+    return styler._translate(False, False)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def same_output(a: dict, b: dict) -> bool:
+    cells = lambda d: [(c.get('display_value'), c.get('id')) for row in d['body'] for c in row]
+    styles = lambda d: sorted((tuple(s['props']), tuple(s['selectors'])) for s in d['cellstyle'])
+    return cells(a) == cells(b) and styles(a) == styles(b)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[300, 3_000, 30_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_rows in args.rows:
+        df = build_frame(n_rows)
+        threshold = df['戰功總量'].quantile(0.95)
+        same = same_output(render(legacy_style(df, threshold)), render(us.style_df_full(df, threshold)))
+        floor = timed(lambda: render(df.style), args.repeat)
+        old = timed(lambda: render(legacy_style(df, threshold)), args.repeat)
+        new = timed(lambda: render(us.style_df_full(df, threshold)), args.repeat)
+        styled = timed(lambda: marshal(us.style_df_full(df, threshold)), args.repeat)
+        view = timed(lambda: marshal(us.table_view(df, threshold)['data']), args.repeat)
+        print(f"{n_rows:>7,} rows: floor {floor:.3f}s | per-cell {old:.3f}s | column-wise {new:.3f}s | x{old / new:.2f} | "
+              f"st.dataframe styler {styled:.3f}s table_view {view:.3f}s | [{'OK' if same else 'FAIL'}] identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""資料層效能測試：以模擬資料量測載入、日均成長、全域極值與個人歷史查詢。
+
+用法: python bench_suite.py [--members 200 5000 50000] [--snapshots 10 500 5000]
+                            [--max-rows 3000000] [--repeat 3] [--out bench_results.json]
+每個 (成員數, 快照數) 組合以 gen_synthetic_data 產生一季資料 (快照平均分佈在
+--season-days 天內)；列數超過 --max-rows 的組合會記錄為 skipped。
+結果存成 JSON，可用來比較不同版本。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.getcwd())
+
+import gen_synthetic_data as gen
+import utils_core as core
+
+GRANULARITIES = [None, '分組', '成員', '所屬勢力']
+HISTORY_SAMPLE = 200
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def timed(fn, repeat: int, setup=None) -> float:
+    """重複 repeat 次取最短時間；setup 在每次量測前執行且不計時。"""
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_case(root: str, n_members: int, n_snapshots: int, args) -> dict:
+    folder = os.path.join(root, 'data')
+    t0 = time.perf_counter()
+    gen.generate(folder, n_members, n_snapshots, interval_hours=args.season_days * 24 / n_snapshots, seed=args.seed)
+    generate_s = time.perf_counter() - t0
+
+    cache_dirs = iter(os.path.join(root, f"cache_{i}") for i in range(args.repeat))
+
+    def load(cache_dir: str):
+        core.CACHE_FOLDER = cache_dir
+        core._ENCODING_CACHE.clear()
+        store = core.SnapshotStore(folder, workers=args.workers)
+        return store.sync(force=True), store.version, store
+
+    timings = {}
+    timings['load_data_from_folder_cold'] = timed(lambda: load(next(cache_dirs)), args.repeat)
+    warm_dir = os.path.join(root, 'cache_warm')
+    df, version, store = load(warm_dir)
+    # 實際落地的快取大小與保存列數 (delta 模式為變動集)，與完整歷史列數比較
+    cache_bytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(warm_dir) for f in files)
+    stored_rows, history_rows = store.stored_rows(), len(store.history(['成員']))
+    timings['load_data_from_folder_warm'] = timed(lambda: load(warm_dir), args.repeat)
+
+    # 衍生計算皆有快取，每次量測前清空以取得冷啟動成本
+    def clear_derived():
+        core.get_velocity_tables.clear()
+        core.get_member_index.clear()
+        core.get_individual_global_max.clear()
+
+    for group_col in GRANULARITIES:
+        label = group_col or '全盟'
+        timings[f'calculate_daily_velocity[{label}]'] = timed(
+            lambda: core.calculate_daily_velocity(df, version, group_col), args.repeat, clear_derived)
+    timings['get_individual_global_max'] = timed(
+        lambda: core.get_individual_global_max(df, version), args.repeat, clear_derived)
+    timings['member_index_build'] = timed(lambda: core.get_member_index(df, version), args.repeat, clear_derived)
+
+    index = core.get_member_index(df, version)
+    rng = np.random.default_rng(args.seed)
+    names = rng.choice(index.members(), min(HISTORY_SAMPLE, len(index)), replace=False)
+    per_lookup = timed(lambda: [index.history(name) for name in names], args.repeat) / max(len(names), 1)
+    timings['member_history_per_lookup'] = per_lookup
+
+    # 門檻：最新快照排序取分位數 vs 合併各分組的摘要 (摘要在匯入時建立，不計入)
+    latest = core.get_latest_snapshot(df, version)
+    sketches = core.SketchIndex.from_frame(df)
+    timings['merit_threshold_exact'] = timed(lambda: latest['戰功總量'].quantile(0.95), args.repeat)
+    timings['merit_threshold_sketch'] = timed(lambda: sketches.quantile(0.95, '戰功總量'), args.repeat)
+
+    # 地區停留區段 (每個資料版本建立一次) 與前線人數查詢
+    timings['region_stays_build'] = timed(lambda: core.RegionStays(df[core.HISTORY_COLS]), args.repeat)
+    stays = core.RegionStays(df[core.HISTORY_COLS])
+    frontline = list(stays.regions[:2])
+    timings['frontline_headcount'] = timed(lambda: stays.headcount(frontline), args.repeat)
+
+    return {
+        'members': n_members,
+        'snapshots': n_snapshots,
+        'rows': len(df),
+        'history_rows': history_rows,
+        'stored_rows': stored_rows,
+        'cache_mb': round(cache_bytes / 1e6, 2),
+        'memory_mb': round(df.memory_usage(deep=True).sum() / 1e6, 2),
+        'generate_s': round(generate_s, 3),
+        'timings_s': {k: round(v, 6) for k, v in timings.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, nargs='+', default=[200, 5_000, 50_000])
+    parser.add_argument('--snapshots', type=int, nargs='+', default=[10, 500, 5_000])
+    parser.add_argument('--max-rows', type=int, default=3_000_000, help='成員數 x 快照數超過此值的組合略過')
+    parser.add_argument('--season-days', type=float, default=90)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=core.LOAD_WORKERS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='bench_results.json')
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'storage_mode': core.STORAGE_MODE,
+            'workers': args.workers,
+            'repeat': args.repeat,
+            'max_rows': args.max_rows,
+        },
+        'cases': [],
+    }
+
+    root = tempfile.mkdtemp(prefix='slg_suite_')
+    try:
+        for n_members in args.members:
+            for n_snapshots in args.snapshots:
+                if n_members * n_snapshots > args.max_rows:
+                    print(f"{n_members:>7,} members x {n_snapshots:>6,} snapshots: skipped (> {args.max_rows:,} rows)")
+                    results['cases'].append({'members': n_members, 'snapshots': n_snapshots, 'skipped': 'max_rows'})
+                    continue
+                case_root = os.path.join(root, f"{n_members}_{n_snapshots}")
+                case = bench_case(case_root, n_members, n_snapshots, args)
+                shutil.rmtree(case_root, ignore_errors=True)
+                results['cases'].append(case)
+                t = case['timings_s']
+                print(f"{n_members:>7,} members x {n_snapshots:>6,} snapshots: {case['rows']:,} rows | "
+                      f"stored {case['stored_rows']:,}/{case['history_rows']:,} rows, cache {case['cache_mb']:.2f} MB | "
+                      f"load cold {t['load_data_from_folder_cold']:.3f}s warm {t['load_data_from_folder_warm']:.3f}s | "
+                      f"velocity {t['calculate_daily_velocity[成員]']:.3f}s | "
+                      f"history {t['member_history_per_lookup'] * 1e6:.0f}us | "
+                      f"p95 exact {t['merit_threshold_exact'] * 1e6:.0f}us sketch {t['merit_threshold_sketch'] * 1e6:.0f}us | "
+                      f"stays {t['region_stays_build']:.3f}s headcount {t['frontline_headcount'] * 1e3:.2f}ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"saved -> {args.out}")
+
+
+if __name__ == '__main__':
+    main()
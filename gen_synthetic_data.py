@@ -0,0 +1,163 @@
+"""產生模擬的同盟統計快照 CSV，供效能測試使用。
+
+用法: python gen_synthetic_data.py OUT_DIR [--members 200] [--snapshots 10] [--interval-hours 6] [--seed 0]
+快照依序輪替 utf-8-sig / Big5 / GBK 編碼，並混入千分位數字、
+簡體與英文別名標題，以及成員加入、離開與換地區等變動。
+"""
+import argparse
+import csv
+import datetime
+import io
+import os
+
+import numpy as np
+
+ENCODINGS = ['utf-8-sig', 'big5', 'gbk']
+HEADERS = ['成員', '貢獻排行', '貢獻本週', '戰功本週', '助攻本週', '捐獻本週',
+           '貢獻總量', '戰功總量', '助攻總量', '捐獻總量', '勢力值', '所屬勢力', '分組']
+TEXT_COLUMNS = {'成員', '所屬勢力', '分組'}
+# 別名標題 (須能被 utils_core.COLUMN_MAPPING 對應回正式名稱)
+HEADER_ALIASES = {
+    'simplified': {'成員': '成员', '戰功總量': '战功总量', '勢力值': '势力值', '所屬勢力': '所属势力', '分組': '分组'},
+    'english': {'成員': 'Member', '戰功總量': 'Merit', '勢力值': 'Power', '所屬勢力': 'Region', '分組': 'Group'},
+}
+# 每種編碼可用的標題寫法 (Big5 無法編碼簡體字)
+ENCODING_HEADERS = {'utf-8-sig': [None, 'english'], 'big5': [None], 'gbk': ['simplified', None]}
+GROUPS = ['速農', '七劍', '梟', '天農', '賊', '鐵衛', '風雲', '夜行']
+REGIONS = ['東平國', '魯國', '山陽西郡', '北海國', '南陽郡', '陳留郡', '河內郡', '潁川郡']
+NAME_POOL = '雲風花月山河星辰龍虎鷹狼劍刀弓槍火水木金土天地玄黃宇宙洪荒日夜春秋冬夏東南西北青紅白黑小大老少燒餅衛斯理柯夢'
+NAME_SEPARATOR = '．'  # 丨 無法以 Big5 編碼
+
+
+def _encodable(text: str) -> str:
+    """只保留三種編碼都能表示的字元，確保同一成員在各檔案中名稱一致。"""
+    return ''.join(c for c in text if all(c.encode(enc, errors='ignore') for enc in ENCODINGS))
+
+
+def make_names(n_members: int, rng: np.random.Generator, groups: np.ndarray) -> np.ndarray:
+    pool = np.array(list(_encodable(NAME_POOL)))
+    names, seen = [], set()
+    for i in range(n_members):
+        name = ''.join(rng.choice(pool, rng.integers(2, 5)))
+        if rng.random() < 0.3:
+            name = f"{GROUPS[groups[i]]}{NAME_SEPARATOR}{name}"
+        while name in seen:
+            name += rng.choice(pool)
+        seen.add(name)
+        names.append(name)
+    return np.array(names, dtype=object)
+
+
+class Season:
+    """以向量方式推進所有成員的累計數值，每次呼叫 step 產生一個快照。"""
+
+    def __init__(self, n_members: int, rng: np.random.Generator):
+        self.rng = rng
+        self.groups = rng.integers(0, len(GROUPS), n_members)
+        self.names = make_names(n_members, rng, self.groups)
+        self.regions = rng.integers(0, len(REGIONS), n_members)
+        self.power = rng.lognormal(9.8, 0.5, n_members)
+        self.merit_rate = rng.lognormal(9.0, 1.2, n_members)  # 每日戰功
+        self.merit = np.zeros(n_members)
+        self.assist = np.zeros(n_members)
+        self.donate = np.zeros(n_members)
+        self.contrib = rng.lognormal(15.0, 0.6, n_members)
+        self.week_base = np.zeros((4, n_members))  # 本週起點 (貢獻, 戰功, 助攻, 捐獻)
+        self.present = rng.random(n_members) < 0.95
+
+    def step(self, days: float, new_week: bool) -> dict:
+        rng, n = self.rng, len(self.names)
+        activity = rng.random(n) < 0.8
+        self.merit += activity * self.merit_rate * days * rng.uniform(0.2, 1.8, n)
+        self.assist += activity * rng.poisson(50 * days, n)
+        self.donate += (rng.random(n) < 0.05 * days) * rng.integers(1_000, 50_000, n)
+        self.contrib += activity * rng.lognormal(11.0, 0.8, n) * days
+        self.power = np.maximum(self.power * rng.normal(1 + 0.004 * days, 0.01, n), 1_000)
+        # 少量成員換地區、離開或回歸
+        move = rng.random(n) < 0.02
+        self.regions[move] = rng.integers(0, len(REGIONS), int(move.sum()))
+        toggle = rng.random(n) < 0.003
+        self.present ^= toggle
+
+        totals = np.vstack([self.contrib, self.merit, self.assist, self.donate])
+        if new_week:
+            self.week_base = totals.copy()
+        weekly = totals - self.week_base
+
+        idx = np.flatnonzero(self.present)
+        order = idx[np.argsort(-self.contrib[idx], kind='stable')]
+        return {
+            '成員': self.names[order],
+            '貢獻排行': np.arange(1, len(order) + 1),
+            '貢獻本週': weekly[0, order], '戰功本週': weekly[1, order],
+            '助攻本週': weekly[2, order], '捐獻本週': weekly[3, order],
+            '貢獻總量': totals[0, order], '戰功總量': totals[1, order],
+            '助攻總量': totals[2, order], '捐獻總量': totals[3, order],
+            '勢力值': self.power[order],
+            '所屬勢力': np.array(REGIONS, dtype=object)[self.regions[order]],
+            '分組': np.array(GROUPS, dtype=object)[self.groups[order]],
+        }
+
+
+def render_csv(columns: dict, header_style, thousands: bool) -> str:
+    headers = [HEADER_ALIASES.get(header_style, {}).get(h, h) for h in HEADERS]
+    values = []
+    for h in HEADERS:
+        col = columns[h]
+        if col.dtype.kind in 'if':
+            col = col.astype(np.int64)
+            col = [f"{v:,}" for v in col] if thousands else col.astype(str)
+        values.append(col)
+    if thousands:
+        # 千分位數字需加引號，交給 csv 模組處理；文字欄位仍保留匯出格式的前導空白
+        headers = headers[:1] + [f" {h}" for h in headers[1:]]
+        values = values[:1] + [[f" {x}" for x in v] if h in TEXT_COLUMNS else v for h, v in zip(HEADERS[1:], values[1:])]
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        writer.writerow(headers)
+        writer.writerows(zip(*values))
+        return buf.getvalue()
+    # 與遊戲匯出相同的 ", " 分隔格式
+    lines = [', '.join(headers)] + [', '.join(row) for row in zip(*values)]
+    return '\n'.join(lines) + '\n'
+
+
+def generate(out_dir: str, n_members: int, n_snapshots: int, interval_hours: float = 6.0,
+             seed: int = 0, start: datetime.datetime = datetime.datetime(2025, 1, 6)) -> list:
+    """寫出 n_snapshots 個快照檔，回傳檔案路徑清單。"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    season = Season(n_members, rng)
+    paths, last_week = [], None
+    for i in range(n_snapshots):
+        ts = start + datetime.timedelta(hours=interval_hours * i, seconds=int(rng.integers(0, 600)))
+        week = (ts - start) // datetime.timedelta(days=7)
+        columns = season.step(interval_hours / 24, week != last_week)
+        last_week = week
+
+        encoding = ENCODINGS[i % len(ENCODINGS)]
+        styles = ENCODING_HEADERS[encoding]
+        header_style = styles[(i // len(ENCODINGS)) % len(styles)]
+        text = render_csv(columns, header_style, thousands=bool(i % 2))
+
+        path = os.path.join(out_dir, ts.strftime("同盟統計%Y年%m月%d日%H时%M分%S秒.csv"))
+        with open(path, 'wb') as f:
+            f.write(text.encode(encoding))
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_dir')
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--snapshots', type=int, default=10)
+    parser.add_argument('--interval-hours', type=float, default=6.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    paths = generate(args.out_dir, args.members, args.snapshots, args.interval_hours, args.seed)
+    print(f"wrote {len(paths)} snapshots x {args.members} members -> {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,60 @@
 import altair as alt
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence
 
-def get_dual_axis_growth_chart(data, max_merit, max_power, min_power):
+import utils_perf as perf
+
+# --- Downsampling ---
+# 圖表資料在伺服器端先降採樣再嵌入 Vega-Lite spec，瀏覽器收到的點數有上限
+MAX_CHART_POINTS = 400  # 每條序列的點數預算
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets：挑出最能保留折線形狀的 n_out 個點 (含首尾)。"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    edges = np.floor(np.arange(n_out - 1) * every).astype(np.int64) + 1
+    edges = np.append(edges, n)
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2]
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+@perf.timed()
+def downsample(data: pd.DataFrame, max_points: Optional[int] = MAX_CHART_POINTS,
+               value_cols: Sequence[str] = ('daily_power_growth', 'daily_merit_growth')) -> pd.DataFrame:
+    """只保留圖表用到的欄位，並以 LTTB 將每條序列降到 max_points 點以內。
+
+    各序列挑出的點取聯集，兩軸共用同一組時間點；max_points 為 None 時不降採樣。
+    """
+    data = data[['紀錄時間', *value_cols]]
+    if max_points is None or len(data) <= max_points:
+        return data
+    x = data['紀錄時間'].to_numpy().astype('datetime64[ns]').astype(np.int64).astype(float)
+    keep = np.unique(np.concatenate([
+        lttb_indices(x, data[col].to_numpy(dtype=float), max_points) for col in value_cols
+    ]))
+    return data.iloc[keep]
+
+def time_window(data: pd.DataFrame, start, end) -> pd.DataFrame:
+    """取出 [start, end] 區間的資料，供完整解析度模式分段載入。"""
+    times = data['紀錄時間']
+    return data[(times >= pd.Timestamp(start)) & (times <= pd.Timestamp(end))]
+
+@perf.timed()
+def get_dual_axis_growth_chart(data, max_merit, max_power, min_power, max_points=MAX_CHART_POINTS):
     """繪製勢力(線)與戰功(面)的雙軸圖"""
+    data = downsample(data, max_points)
     base = alt.Chart(data).encode(x=alt.X('紀錄時間', axis=alt.Axis(format='%m/%d', title=None)))
     
     line = base.mark_line(interpolate='basis', color='#00FF55', strokeWidth=2).encode(
@@ -16,8 +69,10 @@ def get_dual_axis_growth_chart(data, max_merit, max_power, min_power):
     
     return (line + area).resolve_scale(y='independent')
 
-def get_ace_profile_chart(history, g_max_m, g_max_p, g_min_p):
+@perf.timed()
+def get_ace_profile_chart(history, g_max_m, g_max_p, g_min_p, max_points=MAX_CHART_POINTS):
     """王牌個人檔案的詳細圖表"""
+    history = downsample(history, max_points)
     base = alt.Chart(history).encode(x=alt.X('紀錄時間', axis=alt.Axis(format='%m/%d', title=None)))
     
     line = base.mark_line(interpolate='basis', color='#00FF55', strokeWidth=3).encode(
@@ -32,6 +87,7 @@ def get_ace_profile_chart(history, g_max_m, g_max_p, g_min_p):
     
     return (line + area).resolve_scale(y='independent').properties(height=600, padding={"left": 20, "right": 20, "top": 10, "bottom": 10}).interactive()
 
+@perf.timed()
 def get_warzone_bar_chart(rc):
     """戰區分佈長條圖"""
     chart = alt.Chart(rc).mark_bar().encode(
@@ -40,4 +96,16 @@ def get_warzone_bar_chart(rc):
         color=alt.Color('狀態', scale=alt.Scale(domain=['🔥 前線', '💤 後方'], range=['#D4AF37', '#444']), legend=None), 
         tooltip=['地區', '人數']
     ).properties(height=150)
-    return chart
\ No newline at end of file
+    return chart
+
+@perf.timed()
+def get_frontline_trend_chart(headcount, max_points=MAX_CHART_POINTS):
+    """前線人數(面)與總人數(線)隨快照的變化"""
+    data = downsample(headcount, max_points, value_cols=('前線', '總人數'))
+    base = alt.Chart(data).encode(x=alt.X('紀錄時間', axis=alt.Axis(format='%m/%d', title=None)))
+    area = base.mark_area(interpolate='step-after', color='#D4AF37', opacity=0.6).encode(
+        y=alt.Y('前線', title=None),
+        tooltip=['紀錄時間', alt.Tooltip('前線', title='前線人數'), alt.Tooltip('總人數', title='總人數')]
+    )
+    line = base.mark_line(interpolate='step-after', color='#444', strokeDash=[4, 2]).encode(y='總人數')
+    return (area + line).properties(height=150)
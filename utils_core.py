@@ -0,0 +1,1250 @@
+"""資料核心：快照解析、儲存與衍生計算，不依賴 Streamlit。
+
+可直接在排程、背景工作或測試中使用。解析時遇到的問題以 Diagnostic 回報
+(預設寫入 logging，SnapshotStore 會另外收集供介面顯示)；衍生計算透過
+cached() 快取，後端可用 set_cache_backend() 抽換 (預設為程序內 LRU)。
+Streamlit 介面請使用 utils_data。
+"""
+import numpy as np
+import pandas as pd
+import os
+import re
+import codecs
+import functools
+import hashlib
+import importlib.util
+import inspect
+import json
+import logging
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import utils_perf as perf
+from utils_delta import DeltaStore, concat_aligned
+from utils_sql import SqliteHistory
+from utils_cube import GroupRegionCube
+from utils_diff import MemberKeys, diff_snapshots
+from utils_migration import FIRST_COL, HISTORY_COLS, LAST_COL, RUN_COLS, RegionStays
+from utils_radar import RadarFilter, RadarIndex
+from utils_search import MemberSearch
+from utils_sketch import SketchIndex, sketch_snapshot
+
+# pyarrow 匯入較慢，只檢查是否存在，實際讀寫 Parquet 時才載入
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+DATA_FOLDER = "盟戰資料庫"
+CACHE_FOLDER = ".snapshot_cache"
+SNAPSHOT_CACHE_VERSION = 3  # 解析/清洗邏輯變動時遞增，使舊快取失效
+STORAGE_MODE = os.environ.get('SLG_STORAGE_MODE', 'full')  # 'full'、'delta' 或 'sqlite'
+# delta 模式的變動集區塊數超過此值時整份重寫成一個區塊，避免冷啟動要讀太多小檔
+DELTA_MAX_CHUNKS = 64
+LOAD_WORKERS = int(os.environ.get('SLG_LOAD_WORKERS', min(8, os.cpu_count() or 1)))
+EXCLUDE_GROUPS = ['小號', '未分組']
+REQUIRED_COLS = ['勢力值', '戰功總量', '分組']
+ENCODING_CANDIDATES = ['utf-8', 'big5', 'gbk']
+ENCODING_SNIFF_BYTES = 64 * 1024
+BOM_ENCODINGS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+COLUMN_MAPPING = {
+    '势力值': '勢力值', '势力': '勢力值', 'Power': '勢力值',
+    '战功总量': '戰功總量', '战功': '戰功總量', 'Merit': '戰功總量',
+    '分组': '分組', 'Group': '分組',
+    '成员': '成員', 'Member': '成員',
+    '所属势力': '所屬勢力', 'Region': '所屬勢力'
+}
+# 載入時的欄位型別：名稱欄位用共用字典的類別型別，計數欄位用 int32
+COLUMN_SCHEMA = {
+    '成員': 'category', '分組': 'category', '所屬勢力': 'category',
+    '貢獻排行': 'int32',
+    '貢獻本週': 'int32', '戰功本週': 'int32', '助攻本週': 'int32', '捐獻本週': 'int32',
+    '貢獻總量': 'int32', '戰功總量': 'int32', '助攻總量': 'int32', '捐獻總量': 'int32',
+    '勢力值': 'int32',
+    '戰功效率': 'float32'
+}
+KNOWN_HEADERS = set(COLUMN_MAPPING) | set(COLUMN_SCHEMA) | set(REQUIRED_COLS)
+# 儀表板實際用到的欄位；其餘欄位在需要時才透過 ensure_columns 載入
+DASHBOARD_COLUMNS = ['成員', '分組', '所屬勢力', '貢獻排行', '戰功總量', '勢力值']
+PROJECTION_BASE_COLS = ['成員'] + REQUIRED_COLS  # 清洗與排除分組一定要用到的欄位
+DERIVED_COLS = ['紀錄時間', '戰功效率']
+CATEGORY_COLS = [col for col, dtype in COLUMN_SCHEMA.items() if dtype == 'category']
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+RADAR_CONFIG = {
+    'slave':  {'desc': '👮‍♂️ 抓地奴', 'merit_op': '小於 <=', 'merit_val': 10000, 'power_op': '大於 >=', 'power_val': 25000, 'eff_op': '小於 <=', 'eff_val': 2.0},
+    'elite':  {'desc': '⚔️ 找戰神', 'merit_op': '大於 >=', 'merit_val': 100000, 'power_op': '大於 >=', 'power_val': 0, 'eff_op': '大於 >=', 'eff_val': 10.0},
+    'newbie': {'desc': '👶 找萌新', 'merit_op': '小於 <=', 'merit_val': 5000, 'power_op': '小於 <=', 'power_val': 10000, 'eff_op': '大於 >=', 'eff_val': 0.0},
+    'reset':  {'desc': '🔄 重置', 'merit_op': '大於 >=', 'merit_val': 0, 'power_op': '大於 >=', 'power_val': 0, 'eff_op': '大於 >=', 'eff_val': 0.0}
+}
+
+# --- Diagnostics ---
+class Diagnostic(NamedTuple):
+    """載入過程中的問題回報，由呼叫端決定如何呈現。"""
+    level: str              # 'warning' 或 'error'
+    source: str             # 檔名
+    message: str
+    details: Tuple[str, ...] = ()
+
+Reporter = Callable[[Diagnostic], None]
+
+def log_diagnostic(diagnostic: Diagnostic) -> None:
+    """預設的回報方式：寫入 logging。"""
+    level = logging.ERROR if diagnostic.level == 'error' else logging.WARNING
+    logger.log(level, "%s: %s%s", diagnostic.source, diagnostic.message,
+               "".join(f"\n  {line}" for line in diagnostic.details))
+
+# --- IO Functions ---
+def save_uploaded_file(uploaded_file, folder: str = DATA_FOLDER, report: Reporter = log_diagnostic) -> bool:
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    try:
+        file_path = os.path.join(folder, uploaded_file.name)
+        with open(file_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+        return True
+    except Exception as e:
+        report(Diagnostic('error', uploaded_file.name, f"Error saving file {uploaded_file.name}: {e}"))
+        return False
+
+# --- Snapshot Cache ---
+# 每個 CSV 解析、清洗後的結果以 Parquet 存放，鍵值為 (檔名, 大小, 修改時間)。
+# 重新載入時只解析新增或變更的檔案，其餘直接 memory-map 讀回。
+def _snapshot_cache_key(filename: str, stat: os.stat_result) -> str:
+    raw = f"{SNAPSHOT_CACHE_VERSION}|{filename}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _cached_snapshot_info(key: str) -> Optional[Tuple[List[str], bool]]:
+    """只讀 Parquet 檔尾的 schema，回傳 (已快取欄位, 是否為完整解析)。"""
+    if not PARQUET_AVAILABLE:
+        return None
+    cache_path = os.path.join(CACHE_FOLDER, f"{key}.parquet")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(cache_path, memory_map=True)
+    except Exception:
+        return None
+    attrs = json.loads((schema.metadata or {}).get(b'PANDAS_ATTRS', b'{}'))
+    return list(schema.names), bool(attrs.get('complete', False))
+
+def _read_cached_snapshot(key: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    if not PARQUET_AVAILABLE:
+        return None
+    cache_path = os.path.join(CACHE_FOLDER, f"{key}.parquet")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        return pd.read_parquet(cache_path, columns=columns, memory_map=True)
+    except Exception:
+        # 快取損毀時視同未命中，交由重新解析覆寫
+        return None
+
+def _write_cached_snapshot(key: str, df: pd.DataFrame) -> None:
+    if not PARQUET_AVAILABLE:
+        return
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        cache_path = os.path.join(CACHE_FOLDER, f"{key}.parquet")
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        # 快取只是加速用，寫入失敗不影響載入
+        pass
+
+def _prune_snapshot_cache(valid_keys: set) -> None:
+    if not os.path.exists(CACHE_FOLDER):
+        return
+    for name in os.listdir(CACHE_FOLDER):
+        # DeltaStore 的變動集存在 delta_*.chunks 資料夾內，不受影響
+        if name.endswith('.parquet') and name[:-len('.parquet')] not in valid_keys:
+            try:
+                os.remove(os.path.join(CACHE_FOLDER, name))
+            except OSError:
+                pass
+
+# --- Encoding Detection ---
+_ENCODING_CACHE: Dict[str, Optional[str]] = {}
+
+def _header_score(header_line: str) -> int:
+    return sum(1 for col in header_line.split(',') if col.strip() in KNOWN_HEADERS)
+
+def _sniff_encoding(prefix: bytes, truncated: bool) -> Optional[str]:
+    for bom, enc in BOM_ENCODINGS:
+        if prefix.startswith(bom):
+            return enc
+
+    best_enc, best_score = None, -1
+    for enc in ENCODING_CANDIDATES:
+        try:
+            # 前綴可能截在多位元組字元中間，用增量解碼器忽略尾端未完成的字元
+            text = codecs.getincrementaldecoder(enc)().decode(prefix, final=not truncated)
+        except UnicodeDecodeError:
+            continue
+        # 嚴格 UTF-8 解碼成功幾乎不會是巧合
+        if enc.startswith('utf-8'):
+            return enc
+        # Big5 與 GBK 常常都能解碼成功，以標題列能對上的已知欄位數來判斷
+        score = _header_score(text.splitlines()[0] if text else '')
+        if score > best_score:
+            best_enc, best_score = enc, score
+    return best_enc
+
+def detect_encoding(file_path: str) -> Optional[str]:
+    """由 BOM 與檔案前段位元組判斷編碼，結果依 (檔名, 大小, 修改時間) 記住。"""
+    key = _snapshot_cache_key(os.path.basename(file_path), os.stat(file_path))
+    if key not in _ENCODING_CACHE:
+        with open(file_path, 'rb') as f:
+            prefix = f.read(ENCODING_SNIFF_BYTES + 1)
+        truncated = len(prefix) > ENCODING_SNIFF_BYTES
+        _ENCODING_CACHE[key] = _sniff_encoding(prefix[:ENCODING_SNIFF_BYTES], truncated)
+    return _ENCODING_CACHE[key]
+
+# --- Parsing ---
+def _canonical_column(name: str) -> str:
+    name = name.strip()
+    return COLUMN_MAPPING.get(name, name)
+
+def _resolve_projection(columns: Optional[List[str]]) -> Optional[set]:
+    """把要求的欄位補上清洗必需的欄位；衍生欄位不需要從 CSV 讀。"""
+    if columns is None:
+        return None
+    return (set(columns) | set(PROJECTION_BASE_COLS)) - set(DERIVED_COLS)
+
+def _parse_snapshot_file(file_path: str, wanted: Optional[set] = None, report: Reporter = log_diagnostic) -> Optional[pd.DataFrame]:
+    filename = os.path.basename(file_path)
+
+    # 1. 讀取時間戳 (檔名沒時間，跳過)
+    match = re.search(r'(\d{4})年(\d{2})月(\d{2})日(\d{2})[时|時](\d{2})分(\d{2})秒', filename)
+    if not match:
+        return None
+    dt_str = f"{match.group(1)}-{match.group(2)}-{match.group(3)} {match.group(4)}:{match.group(5)}:{match.group(6)}"
+
+    # 2. 先偵測編碼，只解析一次；偵測失準時才依序改用其他候選編碼
+    detected = detect_encoding(file_path)
+    encodings_to_try = ([detected] + [enc for enc in ENCODING_CANDIDATES if enc != detected]) if detected else list(ENCODING_CANDIDATES)
+    df = pd.DataFrame()
+    errors = []
+    for enc in encodings_to_try:
+        try:
+            # 欄位投影：標題經別名對應後不在需求中的欄位直接不解析
+            usecols = None if wanted is None else (lambda col: _canonical_column(col) in wanted)
+            df = pd.read_csv(file_path, encoding=enc, usecols=usecols)
+            df.attrs['source_encoding'] = enc
+            df.attrs['complete'] = wanted is None
+            break
+        except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+            errors.append(f"{enc}: {e}")
+            continue
+
+    if df.empty:
+        report(Diagnostic('warning', filename, f"無法讀取檔案 {filename} (編碼失敗)", tuple(errors)))
+        return None
+
+    # 3. 清洗欄位名稱 (去除空白)
+    df.columns = df.columns.str.strip()
+
+    # 4. 欄位別名自動對應 (Mapping)
+    # 如果 CSV 是簡體或別名，自動轉回標準名稱
+    df.rename(columns=COLUMN_MAPPING, inplace=True)
+    df['紀錄時間'] = pd.to_datetime(dt_str)
+
+    # 5. 最終檢查與除錯輸出
+    missing_cols = [col for col in REQUIRED_COLS if col not in df.columns]
+    if missing_cols:
+        report(Diagnostic('error', filename, f"CSV 欄位讀取失敗: {filename}", (
+            f"缺少的欄位: {missing_cols}",
+            f"實際讀到的欄位 (前5個): {list(df.columns)[:5]} ...",
+        )))
+        return None
+
+    # Data Cleaning
+    numeric_cols = [col for col, dtype in COLUMN_SCHEMA.items() if dtype in ('int32', 'float32') and col in df.columns]
+    for col in numeric_cols:
+        # 已被 read_csv 解析成數值的欄位不必再經過字串清洗
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
+        df[col] = df[col].fillna(0)
+
+    df['勢力值'] = df['勢力值'].replace(0, 1)
+    df['戰功效率'] = (df['戰功總量'] / df['勢力值']).round(2)
+    df = df[~df['分組'].isin(EXCLUDE_GROUPS)]
+    return apply_schema(df.reset_index(drop=True))
+
+# --- Schema ---
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """依 COLUMN_SCHEMA 轉換欄位型別；超出 int32 範圍的欄位保留 int64 以免溢位。"""
+    for col, dtype in COLUMN_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'int32':
+            values = df[col]
+            fits = values.empty or (values.min() >= INT32_MIN and values.max() <= INT32_MAX)
+            df[col] = values.astype('int32' if fits else 'int64')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def _concat_snapshots(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """串接快照並讓名稱欄位共用同一份類別字典，避免退化成 object。"""
+    return concat_aligned(frames)
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """比較目前型別與未精簡型別 (object 字串 / 64 位元數值) 的記憶體用量。"""
+    rows = []
+    for col in df.columns:
+        compact = df[col].memory_usage(index=False, deep=True)
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            loose = df[col].astype(object).memory_usage(index=False, deep=True)
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            loose = len(df) * 8
+        else:
+            loose = compact
+        rows.append({'欄位': col, '型別': str(df[col].dtype), '原始 bytes': loose, '精簡 bytes': compact})
+    report = pd.DataFrame(rows)
+    total = pd.DataFrame([{'欄位': '合計', '型別': '', '原始 bytes': report['原始 bytes'].sum(), '精簡 bytes': report['精簡 bytes'].sum()}])
+    report = pd.concat([report, total], ignore_index=True)
+    report['倍數'] = (report['原始 bytes'] / report['精簡 bytes'].clip(lower=1)).round(2)
+    return report
+
+def _project(df: pd.DataFrame, wanted: Optional[set]) -> pd.DataFrame:
+    if wanted is None:
+        return df
+    return df[[col for col in df.columns if col in wanted or col in DERIVED_COLS]]
+
+def load_snapshot(file_path: str, columns: Optional[List[str]] = None, report: Reporter = log_diagnostic,
+                  cache: bool = True) -> Optional[pd.DataFrame]:
+    """讀取單一快照，優先使用 Parquet 快取；columns 指定時只解析並保留這些欄位。
+
+    cache=False 時不讀也不寫單檔快取 (delta 模式的變動集本身就是快取)。
+    """
+    key = _snapshot_cache_key(os.path.basename(file_path), os.stat(file_path))
+    wanted = _resolve_projection(columns)
+    parse_cols = wanted
+
+    info = _cached_snapshot_info(key) if cache else None
+    if info is not None:
+        available, complete = info
+        if complete or (wanted is not None and wanted <= set(available)):
+            read_cols = None if wanted is None else [col for col in available if col in wanted or col in DERIVED_COLS]
+            df = _read_cached_snapshot(key, read_cols)
+            if df is not None:
+                return df
+        # 快取缺少要求的欄位時，連同已快取的欄位一起重新解析，讓快取逐步補齊
+        if wanted is not None:
+            parse_cols = wanted | (set(available) - set(DERIVED_COLS))
+
+    df = _parse_snapshot_file(file_path, parse_cols, report)
+    if df is None:
+        return None
+    if cache:
+        _write_cached_snapshot(key, df)
+    return _project(df, wanted)
+
+def load_snapshots(file_paths: List[str], workers: int = LOAD_WORKERS, columns: Optional[List[str]] = None,
+                   report: Reporter = log_diagnostic, cache: bool = True) -> List[Optional[pd.DataFrame]]:
+    """以執行緒池平行讀取多個快照，回傳順序與 file_paths 相同。report 可能在工作執行緒中被呼叫。"""
+    if workers <= 1 or len(file_paths) <= 1:
+        return [load_snapshot(path, columns, report, cache) for path in file_paths]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(file_paths))) as pool:
+        return list(pool.map(lambda path: load_snapshot(path, columns, report, cache), file_paths))
+
+# --- Snapshot Store ---
+class SnapshotStore:
+    """程序內共用的快照資料集。
+
+    以檔名記錄每個已載入的快照，資料夾重新掃描時只處理變動的檔案；
+    上傳的檔案透過 ingest() 直接併入，不需重建整個資料集。
+    columns 為欄位投影 (None 表示全部)，之後可用 ensure_columns() 補載其他欄位。
+    storage_mode='delta' 時只保留基準快照加變動集 (DeltaStore)，df 為每日最後快照組成的資料集，
+    完整快照與個人歷史由 snapshot_at() / member_history() 直接從變動集回答；
+    磁碟上只存變動集 (不另存單檔快取)，新快照以追加區塊寫入。
+    storage_mode='sqlite' 時所有快照寫入 SQLite 檔 (SqliteHistory)，df 只有最新快照，
+    每日成長與個人歷史都由資料庫查詢取得。
+    每次內容變動都會產生新的 version，供衍生計算作為快取鍵值。
+    每個檔案載入時順便建立各分組的分位數摘要，新增快照時只需處理新檔案 (sketch_index())。
+    解析或存檔遇到的問題除了寫入 logging，也會暫存起來，由 drain_diagnostics() 取出顯示。
+    """
+
+    def __init__(self, folder: str, scan_interval: float = 300, workers: int = LOAD_WORKERS,
+                 columns: Optional[List[str]] = None, storage_mode: str = STORAGE_MODE):
+        self.folder = folder
+        self.scan_interval = scan_interval
+        self.workers = workers
+        self.columns = list(columns) if columns is not None else None
+        self.storage_mode = storage_mode
+        self._lock = threading.RLock()
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._keys: Dict[str, str] = {}
+        self._meta: Dict[str, dict] = {}
+        self._sketches: Dict[str, tuple] = {}
+        self._delta: Optional[DeltaStore] = None
+        self._sql_db: Optional[SqliteHistory] = None
+        self._sql_path = self._cache_path('history', 'sqlite')
+        self._df = pd.DataFrame()
+        self._version = self._fingerprint()
+        self._last_scan = 0.0
+        self._diagnostics: List[Diagnostic] = []
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    @property
+    def is_delta(self) -> bool:
+        return self.storage_mode == 'delta'
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.storage_mode == 'sqlite'
+
+    @property
+    def sql(self) -> SqliteHistory:
+        if self._sql_db is None:
+            self._sql_db = SqliteHistory(self._sql_path)
+        return self._sql_db
+
+    def _fingerprint(self, keys: Optional[Dict[str, str]] = None) -> str:
+        keys = self._keys if keys is None else keys
+        raw = "|".join(f"{name}:{key}" for name, key in sorted(keys.items()))
+        if self.columns is not None:
+            raw += "|" + ",".join(sorted(self.columns))
+        raw += f"|{self.storage_mode}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+    def _cache_path(self, prefix: str, ext: str) -> str:
+        raw = os.path.abspath(self.folder) + "|" + ",".join(sorted(self.columns or []))
+        return os.path.join(CACHE_FOLDER, f"{prefix}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]}.{ext}")
+
+    def _delta_path(self) -> str:
+        """變動集區塊所在的資料夾 (見 DeltaStore.save / save_tail)。"""
+        return self._cache_path('delta', 'chunks')
+
+    def _report(self, diagnostic: Diagnostic) -> None:
+        # 可能由載入的工作執行緒呼叫；list.append 本身是執行緒安全的
+        log_diagnostic(diagnostic)
+        self._diagnostics.append(diagnostic)
+
+    def drain_diagnostics(self) -> List[Diagnostic]:
+        """取出並清空目前累積的問題回報。"""
+        with self._lock:
+            diagnostics, self._diagnostics = self._diagnostics, []
+        return diagnostics
+
+    def _remember(self, name: str, df: pd.DataFrame, key: str) -> None:
+        self._keys[name] = key
+        self._meta[name] = {
+            '紀錄時間': df['紀錄時間'].iloc[0] if not df.empty else pd.NaT,
+            '編碼': df.attrs.get('source_encoding', ''),
+            '筆數': len(df),
+        }
+        self._sketches[name] = (self._meta[name]['紀錄時間'], sketch_snapshot(df))
+        if self.is_sqlite:
+            self.sql.replace_file(name, key, df, self._meta[name])
+        else:
+            # delta 模式只暫存到併入變動集為止 (_append / _rebuild 後清空)
+            self._frames[name] = df
+
+    def _forget(self, name: str) -> bool:
+        if self.is_sqlite and name in self._keys:
+            self.sql.delete_file(name)
+        self._frames.pop(name, None)
+        self._meta.pop(name, None)
+        self._sketches.pop(name, None)
+        return self._keys.pop(name, None) is not None
+
+    def _load_all(self) -> Dict[str, pd.DataFrame]:
+        names = sorted(self._keys)
+        loaded = load_snapshots([os.path.join(self.folder, name) for name in names], self.workers, self.columns, self._report,
+                                cache=not self.is_delta)
+        return {name: df for name, df in zip(names, loaded) if df is not None}
+
+    def _publish(self, full_df: Optional[pd.DataFrame] = None) -> None:
+        if self.is_sqlite:
+            latest = self.sql.latest_snapshot()
+            self._df = apply_schema(latest) if not latest.empty else latest
+        elif self.is_delta:
+            if self._delta is None or len(self._delta.times) == 0:
+                self._df = pd.DataFrame()
+            else:
+                self._df = self._delta.to_frame(self._delta.daily_snapshot_ids())
+        else:
+            self._df = full_df if full_df is not None else pd.DataFrame()
+        self._version = self._fingerprint()
+
+    def _save_delta(self, start_sid: int = 0, names: Optional[List[str]] = None) -> None:
+        """把變動集寫入磁碟：start_sid > 0 時只追加 names 這些新檔案的區塊，否則整份重寫。"""
+        if not PARQUET_AVAILABLE:
+            return
+        path = self._delta_path()
+        try:
+            if self._delta is None:
+                DeltaStore.clear_chunks(path)
+                return
+            if start_sid <= 0 or len(DeltaStore.chunk_paths(path)) >= DELTA_MAX_CHUNKS:
+                start_sid, names = 0, sorted(self._keys)
+            attrs = {
+                'fingerprint': self._fingerprint(),
+                'keys': {name: self._keys[name] for name in names},
+                'meta': {name: {**self._meta[name], '紀錄時間': str(self._meta[name].get('紀錄時間', ''))} for name in names},
+            }
+            if start_sid > 0:
+                self._delta.save_tail(path, start_sid, **attrs)
+            else:
+                self._delta.save(path, **attrs)
+        except Exception:
+            # 與單檔快取相同，寫入失敗只影響下次冷啟動的速度
+            pass
+
+    def _rebuild_delta(self, reload: bool = False) -> None:
+        """刪除或取代檔案後重建變動集：保留的快照由現有變動集展開，只有新載入的檔案需要解析。"""
+        if reload:
+            frames = list(self._load_all().values())
+        else:
+            frames = []
+            if self._delta is not None and len(self._delta.times):
+                kept_times = [self._meta[name]['紀錄時間'] for name in self._keys if name not in self._frames]
+                history = self._delta.to_frame()
+                frames.append(history[history['紀錄時間'].isin(kept_times)])
+            frames += [self._frames[name] for name in sorted(self._frames)]
+        frames = [f for f in frames if not f.empty]
+        if frames:
+            self._delta = DeltaStore.from_frame(_concat_snapshots(frames).sort_values('紀錄時間', kind='stable'))
+        else:
+            self._delta = None
+        self._frames.clear()
+        self._save_delta()
+        self._publish()
+
+    def _rebuild(self, reload: bool = False) -> None:
+        if self.is_sqlite:
+            # 資料已在 _remember/_forget 時寫入資料庫，只有欄位變動才需要全部重寫
+            if reload:
+                self.sql.clear()
+                for name, df in self._load_all().items():
+                    self.sql.replace_file(name, self._keys[name], df, self._meta[name])
+            self._publish()
+            return
+        if self.is_delta:
+            self._rebuild_delta(reload)
+            return
+        if reload:
+            self._frames = self._load_all()
+        frames = [self._frames[name] for name in sorted(self._frames)]
+        if frames:
+            full_df = _concat_snapshots(frames).sort_values('紀錄時間', kind='stable')
+        else:
+            full_df = pd.DataFrame()
+        self._publish(full_df)
+
+    def _append(self, new_frames: List[pd.DataFrame]) -> None:
+        if self.is_sqlite:
+            self._publish()
+            return
+        new_df = _concat_snapshots(new_frames).sort_values('紀錄時間', kind='stable')
+        if self.is_delta:
+            names = sorted(self._frames)
+            if self._delta is None or len(self._delta.times) == 0:
+                self._delta, start_sid = DeltaStore.from_frame(new_df), 0
+            else:
+                # 新快照晚於現有資料時只追加新區塊；較早的快照會改動其後的變動列，整份重寫
+                start_sid = len(self._delta.times) if new_df['紀錄時間'].iloc[0] > self._delta.times[-1] else 0
+                self._delta = self._delta.append(new_df)
+            self._frames.clear()
+            self._save_delta(start_sid, names)
+            self._publish()
+            return
+
+        if self._df.empty:
+            full_df = new_df
+        else:
+            full_df = _concat_snapshots([self._df, new_df])
+            # 新快照通常晚於既有資料，此時串接結果已經有序
+            if new_df['紀錄時間'].iloc[0] < self._df['紀錄時間'].iloc[-1]:
+                full_df = full_df.sort_values('紀錄時間', kind='stable')
+        self._publish(full_df)
+
+    def _restore_delta(self) -> bool:
+        """delta 模式冷啟動時載入磁碟上的變動集與其對應的檔案；之後的變動由 sync 照常處理。"""
+        path = self._delta_path()
+        if not (PARQUET_AVAILABLE and DeltaStore.chunk_paths(path)):
+            return False
+        try:
+            delta, chunk_attrs = DeltaStore.load(path)
+        except Exception:
+            return False
+        keys, meta = {}, {}
+        for attrs in chunk_attrs:
+            keys.update(attrs.get('keys', {}))
+            meta.update(attrs.get('meta', {}))
+        # 區塊缺漏或屬於其他欄位組合時，最後一個區塊記下的版本會對不上
+        if chunk_attrs[-1].get('fingerprint') != self._fingerprint(keys):
+            return False
+        self._keys = keys
+        self._meta = {name: {**meta.get(name, {}), '紀錄時間': pd.Timestamp(meta.get(name, {}).get('紀錄時間'))} for name in keys}
+        self._delta = delta
+        return True
+
+    def sync(self, force: bool = False) -> pd.DataFrame:
+        """重新掃描資料夾，只載入新增或變更的檔案，並移除已刪除的檔案。"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_scan and now - self._last_scan < self.scan_interval:
+                return self._df
+            self._last_scan = now
+
+            if not os.path.exists(self.folder):
+                changed = bool(self._keys)
+                for name in list(self._keys):
+                    self._forget(name)
+                if changed:
+                    self._rebuild()
+                return self._df
+
+            current_keys = {}
+            for filename in os.listdir(self.folder):
+                if filename.endswith('.csv'):
+                    file_path = os.path.join(self.folder, filename)
+                    current_keys[filename] = _snapshot_cache_key(filename, os.stat(file_path))
+
+            restored = False
+            if self.is_sqlite and not self._keys:
+                # 冷啟動時沿用資料庫內已匯入的檔案，只處理之後變動的部分
+                files = self.sql.files()
+                self._keys = {name: info.pop('cache_key') for name, info in files.items()}
+                self._meta = files
+                restored = bool(files)
+            elif self.is_delta and not self._keys and self._delta is None:
+                # 同樣沿用磁碟上的變動集，新增的檔案之後只追加區塊
+                restored = self._restore_delta()
+
+            removed = [name for name in self._keys if name not in current_keys]
+            changed = sorted(name for name, key in current_keys.items() if self._keys.get(name) != key)
+            if not removed and not changed:
+                if restored:
+                    self._publish()
+                return self._df
+
+            for name in removed:
+                self._forget(name)
+
+            new_frames = []
+            loaded = load_snapshots([os.path.join(self.folder, name) for name in changed], self.workers, self.columns, self._report,
+                                    cache=not self.is_delta)
+            for name, df in zip(changed, loaded):
+                replaced = self._forget(name)
+                if df is not None:
+                    self._remember(name, df, current_keys[name])
+                    if not replaced:
+                        new_frames.append(df)
+                if replaced:
+                    removed.append(name)
+
+            # 移除已刪除或已變更檔案所留下的舊快取
+            _prune_snapshot_cache(set(current_keys.values()))
+
+            if removed:
+                self._rebuild()
+            elif new_frames:
+                self._append(new_frames)
+            return self._df
+
+    def ingest(self, uploaded_files) -> int:
+        """將上傳的 CSV 存檔並只解析這些檔案，直接併入現有資料集。"""
+        with self._lock:
+            new_frames = []
+            replaced = False
+            for uploaded_file in uploaded_files:
+                if not save_uploaded_file(uploaded_file, self.folder, self._report):
+                    continue
+                name = uploaded_file.name
+                file_path = os.path.join(self.folder, name)
+                df = load_snapshot(file_path, self.columns, self._report, cache=not self.is_delta)
+                if df is None:
+                    continue
+                replaced = self._forget(name) or replaced
+                self._remember(name, df, _snapshot_cache_key(name, os.stat(file_path)))
+                new_frames.append(df)
+
+            if replaced:
+                self._rebuild()
+            elif new_frames:
+                self._append(new_frames)
+            return len(new_frames)
+
+    def ensure_columns(self, columns: List[str]) -> pd.DataFrame:
+        """確保資料集包含指定欄位，缺少的欄位才從快取或 CSV 補載。"""
+        with self._lock:
+            if self.columns is None:
+                return self._df
+            missing = [col for col in columns if col not in self.columns and col not in DERIVED_COLS]
+            if not missing:
+                return self._df
+            self.columns = self.columns + missing
+            self._rebuild(reload=True)
+            return self._df
+
+    # --- History Queries ---
+    def snapshot_times(self) -> np.ndarray:
+        """所有快照時間 (遞增)。"""
+        if self.is_sqlite:
+            return self.sql.snapshot_times().to_numpy()
+        if self.is_delta:
+            return self._delta.times if self._delta is not None else np.array([], dtype='datetime64[us]')
+        if self._df.empty:
+            return np.array([], dtype='datetime64[us]')
+        return np.unique(self._df['紀錄時間'].to_numpy())
+
+    def snapshot_at(self, when) -> pd.DataFrame:
+        """不晚於 when 的最後一次快照 (as-of)。"""
+        times = self.snapshot_times()
+        if len(times) == 0:
+            return pd.DataFrame()
+        if self.is_sqlite:
+            return apply_schema(self.sql.snapshot(when))
+        sid = max(int(np.searchsorted(times, np.datetime64(pd.Timestamp(when)), side='right')) - 1, 0)
+        if self.is_delta:
+            return self._delta.snapshot(sid)
+        # 完整模式的資料依紀錄時間排序，同一快照是連續區段
+        record_times = self._df['紀錄時間'].to_numpy()
+        lo, hi = np.searchsorted(record_times, times[sid], 'left'), np.searchsorted(record_times, times[sid], 'right')
+        return self._df.iloc[lo:hi]
+
+    def history(self, columns: List[str]) -> pd.DataFrame:
+        """所有快照 (delta/sqlite 模式也包含非每日最後一次的快照) 的指定欄位。"""
+        if self.is_sqlite:
+            return self.sql.history(columns)
+        if self.is_delta:
+            return self._delta.to_frame(columns=columns) if self._delta is not None else pd.DataFrame(columns=columns)
+        return self._df[columns] if not self._df.empty else pd.DataFrame(columns=columns)
+
+    def history_runs(self, columns: List[str]) -> Tuple[np.ndarray, pd.DataFrame]:
+        """(快照時間, 區段)：每位成員在 columns 不變的期間壓縮成一列，見 RegionStays.from_runs。
+
+        delta 模式直接沿用變動集、sqlite 模式在資料庫內合併，都不必展開完整歷史；
+        完整模式每列即為一個單快照的區段。
+        """
+        times = self.snapshot_times()
+        if self.is_sqlite:
+            runs = self.sql.runs(columns)
+        elif self.is_delta:
+            runs = self._delta.runs(columns) if self._delta is not None else pd.DataFrame()
+        elif not self._df.empty:
+            sid = np.searchsorted(times, self._df['紀錄時間'].to_numpy())
+            runs = self._df[columns].assign(**{FIRST_COL: sid, LAST_COL: sid})
+        else:
+            runs = pd.DataFrame()
+        if runs.empty:
+            runs = pd.DataFrame({col: pd.Series(dtype=object) for col in columns + [FIRST_COL, LAST_COL]})
+        return times, runs
+
+    def stored_rows(self) -> int:
+        """實際保存的列數：delta 模式為變動集列數，其餘模式為所有快照的列數。"""
+        if self.is_delta:
+            return len(self._delta.changes) if self._delta is not None else 0
+        return len(self.history(['成員']))
+
+    def member_daily_rows(self) -> pd.DataFrame:
+        """每位成員每天自己的最後一筆 (delta 模式的 df 只有全盟每日最後快照，改由變動集展開)。"""
+        if self.is_delta:
+            return self._delta.member_daily_last() if self._delta is not None else pd.DataFrame()
+        return _member_daily_last_rows(self._df)
+
+    def member_history(self, member_name: str) -> pd.DataFrame:
+        """單一成員在所有快照中的資料列。"""
+        if self.is_sqlite:
+            return self.sql.member_history(member_name)
+        if self.is_delta:
+            if self._delta is None:
+                return pd.DataFrame()
+            return self._delta.member_history(member_name)
+        return self._df[self._df['成員'] == member_name]
+
+    def sketch_index(self) -> SketchIndex:
+        """各快照 × 分組的分位數摘要。
+
+        摘要在檔案載入時建立；冷啟動直接沿用變動集或資料庫的檔案時沒有經過載入，
+        這些快照在第一次呼叫時才從 snapshot_at() 補算。
+        """
+        with self._lock:
+            covered = {when for when, _ in self._sketches.values()}
+            for name in self._keys:
+                when = self._meta.get(name, {}).get('紀錄時間', pd.NaT)
+                if name in self._sketches or pd.isna(when) or when in covered:
+                    continue
+                self._sketches[name] = (when, sketch_snapshot(self.snapshot_at(when)))
+                covered.add(when)
+            return SketchIndex(self._sketches.values())
+
+    def load_report(self) -> pd.DataFrame:
+        """每個已載入檔案的快照時間、偵測到的編碼與列數。"""
+        with self._lock:
+            rows = [{'檔案': name, **self._meta.get(name, {})} for name in sorted(self._keys)]
+        return pd.DataFrame(rows, columns=['檔案', '紀錄時間', '編碼', '筆數'])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._frames.clear()
+            self._keys.clear()
+            self._meta.clear()
+            self._sketches.clear()
+            self._delta = None
+            if self._sql_db is not None:
+                self._sql_db.close()
+                self._sql_db = None
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(self._sql_path + suffix):
+                        os.remove(self._sql_path + suffix)
+            if self.is_delta:
+                shutil.rmtree(self._delta_path(), ignore_errors=True)
+            self._df = pd.DataFrame()
+            self._version = self._fingerprint()
+            self._last_scan = 0.0
+
+_STORE = SnapshotStore(DATA_FOLDER, columns=DASHBOARD_COLUMNS)
+
+def get_store() -> SnapshotStore:
+    return _STORE
+
+def get_data_version() -> str:
+    """目前資料集的版本指紋，內容變動時才會改變。"""
+    return _STORE.version
+
+def load_data_from_folder() -> pd.DataFrame:
+    return _STORE.sync()
+
+@perf.timed()
+def load_dataset() -> Tuple[pd.DataFrame, str]:
+    """同時取得資料集與其版本，確保兩者對應同一份內容。
+
+    回傳的資料集依儲存模式而定 (完整歷史 / 每日最後快照 / 最新快照)，
+    都足以供下方以版本為鍵值的衍生計算使用。
+    """
+    with _STORE._lock:
+        return _STORE.sync(), _STORE.version
+
+@perf.timed()
+def ensure_columns(columns: List[str]) -> Tuple[pd.DataFrame, str]:
+    """供需要額外欄位的畫面使用，回傳補齊欄位後的資料集與版本。"""
+    with _STORE._lock:
+        _STORE.sync()
+        return _STORE.ensure_columns(columns), _STORE.version
+
+def get_load_report() -> pd.DataFrame:
+    return _STORE.load_report()
+
+def drain_diagnostics() -> List[Diagnostic]:
+    return _STORE.drain_diagnostics()
+
+@perf.timed()
+def ingest_uploaded_files(uploaded_files) -> int:
+    """匯入上傳檔案並立即反映在資料集，回傳成功匯入的檔案數。"""
+    return _STORE.ingest(uploaded_files)
+
+def clear_snapshot_cache() -> None:
+    """刪除所有快取的快照，並清除記憶體中的資料集。"""
+    _STORE.reset()
+    if os.path.exists(CACHE_FOLDER):
+        shutil.rmtree(CACHE_FOLDER, ignore_errors=True)
+
+@perf.timed()
+def rebuild_snapshot_cache() -> pd.DataFrame:
+    """清空快取後重新解析所有 CSV。"""
+    clear_snapshot_cache()
+    return _STORE.sync(force=True)
+
+# --- Derived Cache ---
+# 與 st.cache_resource 相同的約定：開頭底線的參數不列入鍵值，結果直接共用同一物件。
+# 後端是 (fn, max_entries) -> 具 clear() 的包裝函式，介面層可換成 Streamlit 的快取。
+CacheBackend = Callable[[Callable, int], Callable]
+
+def lru_backend(fn: Callable, max_entries: int) -> Callable:
+    """程序內的 LRU 快取，同一函式的計算以鎖序列化，避免多個執行緒重複計算。"""
+    signature = inspect.signature(fn)
+    entries: OrderedDict = OrderedDict()
+    lock = threading.RLock()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = tuple((name, value) for name, value in bound.arguments.items() if not name.startswith('_'))
+        with lock:
+            if key in entries:
+                entries.move_to_end(key)
+                return entries[key]
+            value = fn(*args, **kwargs)
+            entries[key] = value
+            if len(entries) > max_entries:
+                entries.popitem(last=False)
+            return value
+
+    wrapper.clear = entries.clear
+    return wrapper
+
+class _Cached:
+    """延遲到第一次呼叫才以目前的後端包裝，讓 set_cache_backend 可在匯入後才設定。"""
+
+    def __init__(self, fn: Callable, max_entries: int):
+        functools.update_wrapper(self, fn)
+        self._max_entries = max_entries
+        self._impl: Optional[Callable] = None
+
+        # 真正執行計算時才會呼叫，藉此區分快取命中與未命中
+        @functools.wraps(fn)
+        def compute(*args, **kwargs):
+            perf.mark_miss()
+            return fn(*args, **kwargs)
+        self._fn = compute
+
+    def __call__(self, *args, **kwargs):
+        impl = self._impl
+        if impl is None:
+            with _CACHE_LOCK:
+                if self._impl is None:
+                    self._impl = _CACHE_BACKEND(self._fn, self._max_entries)
+                impl = self._impl
+        if not perf.active():
+            return impl(*args, **kwargs)
+        with perf.timer(self.__name__) as span:
+            span.cache = 'hit'
+            result = impl(*args, **kwargs)
+            span.rows = perf.row_count(result)
+        return result
+
+    def clear(self) -> None:
+        if self._impl is not None:
+            self._impl.clear()
+
+_CACHE_BACKEND: CacheBackend = lru_backend
+_CACHE_LOCK = threading.Lock()
+_CACHED: List[_Cached] = []
+
+def cached(max_entries: int) -> Callable[[Callable], _Cached]:
+    def decorator(fn: Callable) -> _Cached:
+        wrapper = _Cached(fn, max_entries)
+        _CACHED.append(wrapper)
+        return wrapper
+    return decorator
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """更換所有衍生計算的快取後端，既有的快取內容會被捨棄。"""
+    global _CACHE_BACKEND
+    with _CACHE_LOCK:
+        _CACHE_BACKEND = backend
+        for wrapper in _CACHED:
+            wrapper.clear()
+            wrapper._impl = None
+
+# --- Calculation Functions ---
+# 衍生計算以 data_version 作為快取鍵值：開頭底線的 _df 不列入鍵值，
+# 因此快取命中的成本與歷史資料量無關。快取直接回傳同一物件，呼叫端不可就地修改。
+class VelocityTables(NamedTuple):
+    member: pd.DataFrame
+    group: pd.DataFrame
+    alliance: pd.DataFrame
+
+def _daily_last_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """只保留每天最後一次快照的資料列。"""
+    times = np.unique(df['紀錄時間'].to_numpy())
+    days = times.astype('datetime64[D]')
+    is_last = np.append(days[1:] != days[:-1], True)
+    return df[df['紀錄時間'].isin(times[is_last])]
+
+def _member_daily_last_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """每位成員每天自己的最後一筆資料，依 (成員, 紀錄時間) 排序。
+
+    以成員自己的紀錄為準：當天中途離開的成員仍保留離開前最後一次出現的資料。
+    """
+    member = df.sort_values(['成員', '紀錄時間'], kind='stable')
+    codes, _ = pd.factorize(member['成員'])
+    days = member['紀錄時間'].to_numpy().astype('datetime64[D]')
+    is_last = np.append((codes[1:] != codes[:-1]) | (days[1:] != days[:-1]), True)
+    return member[is_last].reset_index(drop=True)
+
+def _add_growth(agged: pd.DataFrame, key: Optional[str]) -> pd.DataFrame:
+    if key:
+        grouped = agged.groupby(key, sort=False, observed=True)
+        agged['time_diff'] = grouped['紀錄時間'].diff().dt.total_seconds() / 86400
+        agged['merit_diff'] = grouped['戰功總量'].diff()
+        agged['power_diff'] = grouped['勢力值'].diff()
+    else:
+        agged['time_diff'] = agged['紀錄時間'].diff().dt.total_seconds() / 86400
+        agged['merit_diff'] = agged['戰功總量'].diff()
+        agged['power_diff'] = agged['勢力值'].diff()
+
+    agged['daily_merit_growth'] = (agged['merit_diff'] / agged['time_diff']).fillna(0)
+    agged['daily_power_growth'] = (agged['power_diff'] / agged['time_diff']).fillna(0)
+    return agged
+
+def _group_velocity(df_daily: pd.DataFrame, group_col: Optional[str]) -> pd.DataFrame:
+    if group_col:
+        agged = df_daily.groupby(['紀錄時間', group_col], observed=True)[['戰功總量', '勢力值']].sum().reset_index()
+        agged = agged.sort_values([group_col, '紀錄時間'], kind='stable')
+    else:
+        agged = df_daily.groupby('紀錄時間')[['戰功總量', '勢力值']].sum().reset_index()
+    return _add_growth(agged, group_col)
+
+def build_velocity_tables(df: pd.DataFrame, member_rows: Optional[pd.DataFrame] = None) -> VelocityTables:
+    """一次產生成員、分組與全盟的日均成長表。
+
+    分組與全盟取全盟每天最後一次快照；成員表取每位成員每天自己的最後一筆，
+    保留原始欄位 (分組、所屬勢力、排行等)，依 (成員, 紀錄時間) 排序，可直接當作個人歷史使用。
+    df 不含完整歷史時 (delta 模式)，由 member_rows 提供已挑好的成員每日最後一筆。
+    """
+    df_daily = _daily_last_rows(df)
+    if member_rows is None:
+        member_rows = _member_daily_last_rows(df)
+    member = _add_growth(member_rows, '成員')
+
+    return VelocityTables(
+        member=member,
+        group=_group_velocity(df_daily, '分組'),
+        alliance=_group_velocity(df_daily, None),
+    )
+
+class MemberIndex:
+    """成員 -> 連續資料列範圍的索引。
+
+    底層資料表依 (成員, 紀錄時間) 排序，每位成員的歷史是一段連續的列，
+    查詢只需一次字典查找加上切片，不必掃描整個資料集。
+    """
+
+    def __init__(self, frame: pd.DataFrame, ranges: Dict[str, Tuple[int, int]]):
+        self.frame = frame
+        self._ranges = ranges
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, presorted: bool = False) -> 'MemberIndex':
+        if not presorted:
+            df = df.sort_values(['成員', '紀錄時間'], kind='stable').reset_index(drop=True)
+        names = df['成員'].to_numpy()
+        if len(names) == 0:
+            return cls(df, {})
+        starts = np.flatnonzero(np.append(True, names[1:] != names[:-1]))
+        ends = np.append(starts[1:], len(names))
+        ranges = {names[s]: (int(s), int(e)) for s, e in zip(starts, ends)}
+        return cls(df, ranges)
+
+    def __contains__(self, member_name: str) -> bool:
+        return member_name in self._ranges
+
+    def __len__(self) -> int:
+        return len(self._ranges)
+
+    def members(self) -> List[str]:
+        return list(self._ranges)
+
+    def history(self, member_name: str) -> pd.DataFrame:
+        start, end = self._ranges.get(member_name, (0, 0))
+        return self.frame.iloc[start:end]
+
+class SqlMemberIndex:
+    """SQLite 模式下的個人歷史查詢，以 (成員, 紀錄時間) 索引在資料庫內篩選。
+
+    介面與 MemberIndex 相同；成員名單在第一次用到時才向資料庫查詢。
+    """
+
+    def __init__(self, db: SqliteHistory):
+        self._db = db
+        self._members: Optional[Dict[str, None]] = None
+
+    def _names(self) -> Dict[str, None]:
+        if self._members is None:
+            self._members = dict.fromkeys(self._db.members())
+        return self._members
+
+    def __contains__(self, member_name: str) -> bool:
+        return member_name in self._names()
+
+    def __len__(self) -> int:
+        return len(self._names())
+
+    def members(self) -> List[str]:
+        return list(self._names())
+
+    def history(self, member_name: str) -> pd.DataFrame:
+        return self._db.daily_velocity('成員', member_name)
+
+@cached(max_entries=8)
+def get_member_index(_df: pd.DataFrame, data_version: str):
+    """以成員日均成長表建立的索引，供個人檔案查詢。"""
+    if data_version == _STORE.version and _STORE.is_sqlite:
+        return SqlMemberIndex(_STORE.sql)
+    return MemberIndex.build(get_velocity_tables(_df, data_version).member, presorted=True)
+
+@cached(max_entries=8)
+def get_velocity_tables(_df: pd.DataFrame, data_version: str) -> VelocityTables:
+    # 只有共用 store 目前版本的資料集才走資料庫；其他 store 或舊版本的資料表一律以傳入的 _df 計算
+    if data_version == _STORE.version and _STORE.is_sqlite:
+        return VelocityTables(
+            member=_STORE.sql.daily_velocity('成員'),
+            group=_STORE.sql.daily_velocity('分組'),
+            alliance=_STORE.sql.daily_velocity(None),
+        )
+    if data_version == _STORE.version and _STORE.is_delta:
+        return build_velocity_tables(_df, _STORE.member_daily_rows())
+    return build_velocity_tables(_df)
+
+@perf.timed()
+def calculate_daily_velocity(_df: pd.DataFrame, data_version: str, group_col: Optional[str] = None) -> pd.DataFrame:
+    tables = get_velocity_tables(_df, data_version)
+    if group_col is None:
+        return tables.alliance
+    if group_col == '成員':
+        return tables.member
+    if group_col == '分組':
+        return tables.group
+    if data_version == _STORE.version and _STORE.is_sqlite:
+        return _STORE.sql.daily_velocity(group_col)
+    return _group_velocity(_daily_last_rows(_df), group_col)
+
+@cached(max_entries=8)
+def get_latest_snapshot(_df: pd.DataFrame, data_version: str) -> pd.DataFrame:
+    return _df[_df['紀錄時間'] == _df['紀錄時間'].max()]
+
+@cached(max_entries=8)
+def get_radar_index(_latest_df: pd.DataFrame, data_version: str) -> RadarIndex:
+    """最新快照的雷達索引，內建預設條件在建立時即算好。"""
+    return RadarIndex(_latest_df, presets=RADAR_CONFIG)
+
+@cached(max_entries=8)
+def get_cube(_df: pd.DataFrame, data_version: str) -> GroupRegionCube:
+    """(分組, 所屬勢力, 紀錄時間) 的預先彙總，KPI、集團軍情報與戰區人數都由此合併。"""
+    return GroupRegionCube(_df)
+
+@cached(max_entries=8)
+def get_sketch_index(_df: pd.DataFrame, data_version: str) -> SketchIndex:
+    """各快照 × 分組的分位數摘要；快照匯入時已建好，這裡只組合，不掃描成員。"""
+    if data_version == _STORE.version:
+        return _STORE.sketch_index()
+    return SketchIndex.from_frame(_df)
+
+@cached(max_entries=8)
+def get_snapshot_times(_df: pd.DataFrame, data_version: str) -> np.ndarray:
+    """所有快照時間 (遞增)；delta/sqlite 模式包含未載入資料集的快照。"""
+    if data_version == _STORE.version:
+        return _STORE.snapshot_times()
+    return np.unique(_df['紀錄時間'].to_numpy()) if not _df.empty else np.array([], dtype='datetime64[us]')
+
+@cached(max_entries=8)
+def get_member_keys(_df: pd.DataFrame, data_version: str) -> MemberKeys:
+    return MemberKeys.from_frame(_df)
+
+@cached(max_entries=16)
+def get_snapshot_diff(_df: pd.DataFrame, data_version: str, t1: pd.Timestamp, t2: pd.Timestamp) -> pd.DataFrame:
+    """兩個快照的成員差異，t1 / t2 須為實際的快照時間 (見 Dataset.as_of)。"""
+    if data_version == _STORE.version:
+        before, after = _STORE.snapshot_at(t1), _STORE.snapshot_at(t2)
+    else:
+        before, after = _df[_df['紀錄時間'] == t1], _df[_df['紀錄時間'] == t2]
+    return diff_snapshots(before, after, get_member_keys(_df, data_version))
+
+@cached(max_entries=8)
+def get_region_stays(_df: pd.DataFrame, data_version: str) -> RegionStays:
+    """每位成員的地區停留區段與各快照的地區人數，戰區監控的歷史都由此查詢。"""
+    if data_version == _STORE.version:
+        return RegionStays.from_runs(*_STORE.history_runs(RUN_COLS))
+    return RegionStays(_df[HISTORY_COLS])
+
+@cached(max_entries=8)
+def get_member_search(_latest_df: pd.DataFrame, data_version: str) -> MemberSearch:
+    """最新快照成員名稱的搜尋索引。"""
+    return MemberSearch.from_frame(_latest_df)
+
+@cached(max_entries=8)
+def get_individual_global_max(_raw_df: pd.DataFrame, data_version: str) -> Tuple[float, float, float]:
+    if data_version == _STORE.version and _STORE.is_sqlite:
+        return _STORE.sql.member_growth_extremes()
+    temp_df = get_velocity_tables(_raw_df, data_version).member
+    g_max_m = temp_df['daily_merit_growth'].max()
+    g_max_p = temp_df['daily_power_growth'].max()
+    g_min_p = temp_df['daily_power_growth'].min()
+    return g_max_m, g_max_p, g_min_p
+# --- Shared Dataset ---
+# 同一資料版本的所有唯讀資料表集中在一個全程序共用的物件：20-40 個同時連線的
+# 瀏覽器拿到的是同一份資料，各 session 只保存篩選條件與選取狀態。
+class Dataset:
+    """某一資料版本的唯讀資料集 (原始歷史、最新快照與衍生表)。
+
+    所有連線共用同一個實例；依分組篩選的結果也以 (版本, 分組) 快取共用，
+    全選時直接回傳最新快照本身。回傳的資料表一律不可就地修改。
+    """
+
+    def __init__(self, raw: pd.DataFrame, version: str):
+        self.version = version
+        self.raw = raw
+        self.latest = get_latest_snapshot(raw, version)
+        self.groups = list(self.latest['分組'].unique())
+        self.velocity = get_velocity_tables(raw, version)
+        self.member_index = get_member_index(raw, version)
+        self.radar_index = get_radar_index(self.latest, version)
+        self.member_search = get_member_search(self.latest, version)
+        self.cube = get_cube(raw, version)
+        self.sketches = get_sketch_index(raw, version)
+        self.snapshot_times = get_snapshot_times(raw, version)
+        self.region_stays = get_region_stays(raw, version)
+        self.global_max = get_individual_global_max(raw, version)
+
+    @property
+    def empty(self) -> bool:
+        return self.raw.empty
+
+    def group_filter(self, groups: List[str]) -> Optional[Tuple[str, ...]]:
+        """全選時回傳 None (不篩選)，否則為排序後的分組 tuple。"""
+        if set(groups) >= set(self.groups):
+            return None
+        return tuple(sorted(groups))
+
+    def as_of(self, when) -> pd.Timestamp:
+        """不晚於 when 的最後一個快照時間 (早於第一個快照時取第一個)。"""
+        sid = int(np.searchsorted(self.snapshot_times, np.datetime64(pd.Timestamp(when)), side='right')) - 1
+        return pd.Timestamp(self.snapshot_times[max(sid, 0)])
+
+    def diff(self, t1, t2) -> pd.DataFrame:
+        """任意兩個時間 (各自對齊到 as-of 快照) 之間每位成員的變化，依快照時間對快取。"""
+        return get_snapshot_diff(self.raw, self.version, self.as_of(t1), self.as_of(t2))
+
+    @perf.timed('Dataset.filtered')
+    def filtered(self, groups: List[str]) -> pd.DataFrame:
+        key = self.group_filter(groups)
+        if key is None:
+            return self.latest
+        return _filtered_snapshot(self.latest, self.version, key)
+
+    def memory_report(self) -> pd.DataFrame:
+        """共用資料表各自佔用的記憶體 (bytes)。"""
+        frames = {
+            '原始歷史': self.raw,
+            '最新快照': self.latest,
+            '成員日均成長': self.velocity.member,
+            '分組日均成長': self.velocity.group,
+            '全盟日均成長': self.velocity.alliance,
+            '雷達索引': self.radar_index.frame,
+        }
+        return pd.DataFrame({
+            '項目': list(frames),
+            'bytes': [int(f.memory_usage(deep=True).sum()) for f in frames.values()],
+        })
+
+@cached(max_entries=32)
+def _filtered_snapshot(_latest_df: pd.DataFrame, data_version: str, groups: Tuple[str, ...]) -> pd.DataFrame:
+    return _latest_df[_latest_df['分組'].isin(groups)]
+
+@cached(max_entries=2)
+def _shared_dataset(_raw: pd.DataFrame, data_version: str) -> Dataset:
+    return Dataset(_raw, data_version)
+
+def get_dataset() -> Dataset:
+    """目前資料版本的共用資料集；資料未變動時每次都回傳同一個物件。"""
+    raw, version = load_dataset()
+    return _shared_dataset(raw, version)
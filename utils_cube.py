@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional, Tuple
+
+import utils_perf as perf
+
+GROUP_COL = '分組'
+REGION_COL = '所屬勢力'
+TIME_COL = '紀錄時間'
+# (量值名稱, 資料欄位)：每個格子保存這些欄位的總和
+MEASURES = (('merit', '戰功總量'), ('power', '勢力值'), ('eff', '戰功效率'))
+
+
+class GroupRegionCube:
+    """(分組, 所屬勢力, 紀錄時間) 的預先彙總，每個資料版本建立一次。
+
+    每個非空格子保存人數與各量值的總和。分位數不在這裡估計，由 utils_sketch.SketchIndex 負責。
+    格子依 (時間, 分組, 地區) 排序，同一快照的格子是連續區段；
+    任意分組/地區組合的查詢只需合併該區段內的格子，成本與成員數無關。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        times = df[TIME_COL].to_numpy()
+        self.times = np.unique(times)
+        t = np.searchsorted(self.times, times)
+        # 依類別/字典順序編號，合併結果的列順序與 groupby 相同 (同分時排序才一致)
+        g, groups = pd.factorize(df[GROUP_COL], sort=True, use_na_sentinel=False)
+        r, regions = pd.factorize(df[REGION_COL], sort=True, use_na_sentinel=False)
+        self.groups: List = list(groups)
+        self.regions: List = list(regions)
+        self._n_groups, self._n_regions = max(len(self.groups), 1), max(len(self.regions), 1)
+
+        cell_ids, inverse = np.unique((t.astype(np.int64) * self._n_groups + g) * self._n_regions + r, return_inverse=True)
+        self._cell_t, rest = np.divmod(cell_ids, self._n_groups * self._n_regions)
+        self._cell_g, self._cell_r = np.divmod(rest, self._n_regions)
+        n_cells = len(cell_ids)
+        self.count = np.bincount(inverse, minlength=n_cells).astype(np.int64)
+        self.sums = {
+            name: np.bincount(inverse, weights=df[col].to_numpy(dtype=np.float64), minlength=n_cells)
+            for name, col in MEASURES if col in df.columns
+        }
+
+    def __len__(self) -> int:
+        return len(self.count)
+
+    # --- Selection ---
+    def _time_range(self, when) -> Tuple[int, int]:
+        """不晚於 when 的最後一個快照 (預設最新) 所屬的格子範圍。"""
+        if len(self.times) == 0:
+            return 0, 0
+        if when is None:
+            tid = len(self.times) - 1
+        else:
+            tid = max(int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(when)), side='right')) - 1, 0)
+        return int(np.searchsorted(self._cell_t, tid, 'left')), int(np.searchsorted(self._cell_t, tid, 'right'))
+
+    @staticmethod
+    def _codes(labels: List, wanted: Iterable) -> np.ndarray:
+        lookup = {label: i for i, label in enumerate(labels)}
+        return np.array([lookup[x] for x in wanted if x in lookup], dtype=np.int64)
+
+    def _select(self, when, groups: Optional[Iterable], regions: Optional[Iterable]) -> np.ndarray:
+        start, end = self._time_range(when)
+        cells = np.arange(start, end)
+        if groups is not None:
+            cells = cells[np.isin(self._cell_g[cells], self._codes(self.groups, groups))]
+        if regions is not None:
+            cells = cells[np.isin(self._cell_r[cells], self._codes(self.regions, regions))]
+        return cells
+
+    # --- Queries ---
+    def totals(self, when=None, groups: Optional[Iterable] = None, regions: Optional[Iterable] = None) -> dict:
+        """人數、戰功/勢力總和與平均效率。groups / regions 為 None 表示不限。"""
+        cells = self._select(when, groups, regions)
+        n = int(self.count[cells].sum())
+        result = {'count': n}
+        for name, values in self.sums.items():
+            result[f'{name}_sum'] = float(values[cells].sum())
+        result['eff_mean'] = result.get('eff_sum', 0.0) / n if n else float('nan')
+        return result
+
+    @perf.timed('GroupRegionCube.by')
+    def by(self, dim: str, when=None, groups: Optional[Iterable] = None, regions: Optional[Iterable] = None) -> pd.DataFrame:
+        """依分組或所屬勢力合併格子：每列為 count 與各量值的 _sum / _mean。
+
+        與 groupby / value_counts 相同，只列出有人的值並略過空值。
+        """
+        cells = self._select(when, groups, regions)
+        codes, labels = (self._cell_g, self.groups) if dim == GROUP_COL else (self._cell_r, self.regions)
+        keys = codes[cells]
+        count = np.bincount(keys, weights=self.count[cells], minlength=len(labels))
+        present = np.flatnonzero((count > 0) & ~pd.isna(np.asarray(labels, dtype=object)))
+        out = pd.DataFrame({dim: [labels[i] for i in present], 'count': count[present].astype(np.int64)})
+        for name, values in self.sums.items():
+            total = np.bincount(keys, weights=values[cells], minlength=len(labels))[present]
+            out[f'{name}_sum'] = total
+            out[f'{name}_mean'] = total / out['count'].to_numpy()
+        return out
@@ -0,0 +1,290 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+KEY_COL = '成員'
+TIME_COL = '紀錄時間'
+SID_COL = '_sid'
+REMOVED_COL = '_removed'
+# runs() 的區段頭尾快照序號 (含)，與 utils_migration 相同
+FIRST_COL, LAST_COL = '_first', '_last'
+
+
+def _daily_last_ids(times: np.ndarray) -> np.ndarray:
+    days = times.astype('datetime64[D]')
+    return np.flatnonzero(np.append(days[1:] != days[:-1], True))
+
+
+def _comparable(values: pd.Series) -> np.ndarray:
+    # 類別欄位共用同一份字典，直接比較 codes 即可
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy()
+    return values.to_numpy()
+
+
+def concat_aligned(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """串接資料表，並讓各表的類別欄位共用同一份字典，避免退化成 object。"""
+    frames = [f for f in frames if not f.empty] or frames
+    for col in frames[0].columns:
+        if not all(col in f.columns and isinstance(f[col].dtype, pd.CategoricalDtype) for f in frames):
+            continue
+        categories = frames[0][col].cat.categories
+        for f in frames[1:]:
+            categories = categories.union(f[col].cat.categories)
+        frames = [f.assign(**{col: f[col].cat.set_categories(categories)}) for f in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def _expand_offsets(counts: np.ndarray) -> np.ndarray:
+    """counts=[2,3] -> [0,1,0,1,2]，用來把每列展開成多個快照。"""
+    total = int(counts.sum())
+    return np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+class DeltaStore:
+    """一個基準快照加上每次快照相對前一次的變動集。
+
+    changes 依 (成員, _sid) 排序：每位成員在第一次出現、任一欄位改變或離開後
+    再次出現時才記錄一列；離開同盟則記錄一列 _removed=True。
+    列數取決於相鄰快照間有多少成員數值不變：戰功與勢力幾乎每次都變的匯出
+    (樣本資料與 gen_synthetic_data 皆是) 變動列數與完整歷史相當，甚至因離開標記略多。
+    """
+
+    def __init__(self, times: np.ndarray, changes: pd.DataFrame):
+        self.times = times
+        self.changes = changes
+        self._index()
+
+    def _index(self) -> None:
+        names = self.changes[KEY_COL].to_numpy()
+        sid = self.changes[SID_COL].to_numpy()
+        n = len(names)
+        if n:
+            starts = np.flatnonzero(np.append(True, names[1:] != names[:-1]))
+        else:
+            starts = np.array([], dtype=np.int64)
+        ends = np.append(starts[1:], n)
+        ordinal = np.repeat(np.arange(len(starts)), ends - starts)
+        width = len(self.times) + 1
+
+        self._starts = starts
+        self._ends = ends
+        # (成員序號, 快照序號) 的單調遞增鍵值，供 as-of 查詢用 searchsorted
+        self._key = ordinal * width + sid
+        self._ranges: Dict[str, Tuple[int, int]] = {names[s]: (int(s), int(e)) for s, e in zip(starts, ends)}
+        # 每列有效到同一成員的下一列 (變動或離開) 為止
+        next_sid = np.append(sid[1:], len(self.times)).astype(np.int64)
+        next_sid[ends - 1] = len(self.times)
+        self._next_sid = next_sid
+
+    # --- Construction ---
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'DeltaStore':
+        times = np.unique(df[TIME_COL].to_numpy())
+        if df.empty:
+            empty = df.drop(columns=[TIME_COL]).assign(**{SID_COL: np.array([], dtype=np.int64), REMOVED_COL: np.array([], dtype=bool)})
+            return cls(times, empty)
+
+        work = df.drop(columns=[TIME_COL])
+        work[SID_COL] = np.searchsorted(times, df[TIME_COL].to_numpy())
+        work = work.drop_duplicates([KEY_COL, SID_COL], keep='last')
+        work = work.sort_values([KEY_COL, SID_COL], kind='stable').reset_index(drop=True)
+
+        names = _comparable(work[KEY_COL])
+        sid = work[SID_COL].to_numpy()
+        same_prev = np.append(False, names[1:] == names[:-1])
+        contiguous_prev = same_prev & (np.append(-2, sid[:-1]) == sid - 1)
+
+        changed = ~contiguous_prev
+        for col in work.columns:
+            if col in (KEY_COL, SID_COL):
+                continue
+            values = _comparable(work[col])
+            differs = values[1:] != values[:-1]
+            if values.dtype.kind == 'f':
+                differs &= ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+            changed |= np.append(True, differs)
+
+        # 下一次快照不在場 (且不是最後一次快照) 的成員補一列離開標記
+        same_next = np.append(names[:-1] == names[1:], False)
+        contiguous_next = same_next & (np.append(sid[1:], -2) == sid + 1)
+        gone = ~contiguous_next & (sid + 1 < len(times))
+
+        kept = work[changed].assign(**{REMOVED_COL: False})
+        markers = work[gone].assign(**{SID_COL: sid[gone] + 1, REMOVED_COL: True})
+        changes = pd.concat([kept, markers], ignore_index=True)
+        changes = changes.sort_values([KEY_COL, SID_COL], kind='stable').reset_index(drop=True)
+        return cls(times, changes)
+
+    def append(self, df: pd.DataFrame) -> 'DeltaStore':
+        """併入新快照，只重算插入點之後的變動集。
+
+        新快照晚於現有最後一次快照時 (一般情況)，成本只與新快照與變動量有關，
+        且原有的變動列完全不變 (見 save_tail)；較早的快照則重算其後的所有快照。
+        """
+        if len(self.times) == 0:
+            return DeltaStore.from_frame(df)
+        # 插入點之前的最後一個快照作為基準，之後的快照連同新快照重新計算變動
+        base = int(np.searchsorted(self.times, df[TIME_COL].min(), side='left')) - 1
+        if base < 0:
+            return DeltaStore.from_frame(concat_aligned([self.to_frame(), df]))
+        later = [self.to_frame(np.arange(base + 1, len(self.times)))] if base + 1 < len(self.times) else []
+        tail = DeltaStore.from_frame(concat_aligned([self.snapshot(base), *later, df]))
+        tail_changes = tail.changes[tail.changes[SID_COL] > 0]
+        tail_changes = tail_changes.assign(**{SID_COL: tail_changes[SID_COL] + base})
+
+        kept = self.changes[self.changes[SID_COL].to_numpy() <= base]
+        changes = concat_aligned([kept, tail_changes])
+        changes = changes.sort_values([KEY_COL, SID_COL], kind='stable').reset_index(drop=True)
+        return DeltaStore(np.concatenate([self.times[:base + 1], tail.times[1:]]), changes)
+
+    # --- Queries ---
+    def snapshot_id(self, when) -> int:
+        """不晚於 when 的最後一次快照序號 (as-of)；早於所有快照時回傳 0。"""
+        when = np.datetime64(pd.Timestamp(when))
+        return max(int(np.searchsorted(self.times, when, side='right')) - 1, 0)
+
+    def daily_snapshot_ids(self) -> np.ndarray:
+        return _daily_last_ids(self.times)
+
+    def snapshot(self, sid: int) -> pd.DataFrame:
+        """重建第 sid 次快照的完整資料。"""
+        width = len(self.times) + 1
+        ordinals = np.arange(len(self._starts))
+        pos = np.searchsorted(self._key, ordinals * width + sid, side='right') - 1
+        rows = pos[pos >= self._starts]
+        rows = rows[~self.changes[REMOVED_COL].to_numpy()[rows]]
+        frame = self.changes.iloc[rows].drop(columns=[SID_COL, REMOVED_COL])
+        frame.insert(len(frame.columns), TIME_COL, self.times[sid])
+        return frame.reset_index(drop=True)
+
+    def _expand(self, rows: np.ndarray, snapshot_ids: Optional[np.ndarray],
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+        target = np.arange(len(self.times)) if snapshot_ids is None else np.asarray(snapshot_ids)
+        rows = rows[~self.changes[REMOVED_COL].to_numpy()[rows]]
+        sid = self.changes[SID_COL].to_numpy()[rows]
+        lo = np.searchsorted(target, sid, side='left')
+        hi = np.searchsorted(target, self._next_sid[rows], side='left')
+        counts = hi - lo
+        tidx = np.repeat(lo, counts) + _expand_offsets(counts)
+        # 先投影到需要的欄位再展開，未用到的欄位不會被複製
+        if columns is None:
+            source = self.changes.drop(columns=[SID_COL, REMOVED_COL])
+        else:
+            source = self.changes[[col for col in columns if col != TIME_COL]]
+        frame = source.iloc[np.repeat(rows, counts)]
+        frame.insert(len(frame.columns), TIME_COL, self.times[target[tidx]])
+        frame = frame.sort_values(TIME_COL, kind='stable').reset_index(drop=True)
+        return frame[columns] if columns is not None else frame
+
+    def to_frame(self, snapshot_ids: Optional[np.ndarray] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """由變動集重建完整歷史 (或只重建指定的快照 / 欄位)。"""
+        return self._expand(np.arange(len(self.changes)), snapshot_ids, columns)
+
+    def runs(self, columns: List[str]) -> pd.DataFrame:
+        """每列變動 (不含離開標記) 的 columns 與有效區間的頭尾快照序號 (FIRST_COL / LAST_COL，含)。
+
+        變動集本身就是 run-length encoding，直接回傳區段而不展開任何快照。
+        """
+        rows = np.flatnonzero(~self.changes[REMOVED_COL].to_numpy())
+        runs = self.changes[columns].iloc[rows].reset_index(drop=True)
+        runs[FIRST_COL] = self.changes[SID_COL].to_numpy()[rows]
+        runs[LAST_COL] = self._next_sid[rows] - 1
+        return runs
+
+    def member_daily_last(self) -> pd.DataFrame:
+        """每位成員每天自己的最後一筆，依 (成員, 紀錄時間) 排序。
+
+        每列變動有效到 _next_sid 為止，期間只可能落在每日最後快照或有效區間的最後一個快照，
+        只展開這些候選再逐 (成員, 日) 保留最後一筆，不必重建完整歷史。
+        """
+        rows = np.flatnonzero(~self.changes[REMOVED_COL].to_numpy())
+        first_sid, next_sid = self.changes[SID_COL].to_numpy()[rows], self._next_sid[rows]
+        daily = _daily_last_ids(self.times)
+        lo = np.searchsorted(daily, first_sid, side='left')
+        counts = np.searchsorted(daily, next_sid, side='left') - lo + 1
+        owner = np.repeat(np.arange(len(rows)), counts)
+        offsets = _expand_offsets(counts)
+        is_end = offsets == counts[owner] - 1
+        target = np.where(is_end, next_sid[owner] - 1, daily[np.minimum(lo[owner] + offsets, len(daily) - 1)])
+
+        names = _comparable(self.changes[KEY_COL])[rows[owner]]
+        days = self.times[target].astype('datetime64[D]')
+        last = np.append((names[1:] != names[:-1]) | (days[1:] != days[:-1]), True)
+        frame = self.changes.iloc[rows[owner[last]]].drop(columns=[SID_COL, REMOVED_COL])
+        frame.insert(len(frame.columns), TIME_COL, self.times[target[last]])
+        return frame.reset_index(drop=True)
+
+    def member_history(self, member_name: str, snapshot_ids: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """只展開單一成員的變動列，不需重建任何完整快照。"""
+        start, end = self._ranges.get(member_name, (0, 0))
+        return self._expand(np.arange(start, end), snapshot_ids)
+
+    def memory_usage(self) -> int:
+        return int(self.changes.memory_usage(deep=True).sum() + self.times.nbytes)
+
+    # --- Persistence ---
+    # 變動集以資料夾內依序編號的 Parquet 區塊保存：save() 寫入整份作為第一個區塊，
+    # 之後每次 append 只以 save_tail() 追加新快照的變動列，不必重寫既有資料。
+    def _write_chunk(self, folder: str, index: int, start_sid: int, attrs: dict) -> None:
+        sid = self.changes[SID_COL].to_numpy()
+        chunk = self.changes[sid >= start_sid].reset_index(drop=True)
+        chunk.attrs = {
+            **attrs,
+            'start_sid': start_sid,
+            'times': [int(t) for t in self.times[start_sid:].astype('int64')],
+            'time_dtype': str(self.times.dtype),
+        }
+        path = os.path.join(folder, f"{index:05d}.parquet")
+        tmp_path = f"{path}.tmp"
+        chunk.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def chunk_paths(folder: str) -> List[str]:
+        if not os.path.isdir(folder):
+            return []
+        return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.parquet')]
+
+    @staticmethod
+    def clear_chunks(folder: str) -> None:
+        for path in DeltaStore.chunk_paths(folder):
+            os.remove(path)
+
+    def save(self, folder: str, **attrs) -> None:
+        """整份變動集重寫為單一區塊 (刪除或插入較早快照之後)；attrs 寫入區塊的 metadata。"""
+        os.makedirs(folder, exist_ok=True)
+        # 先刪除舊區塊：中途失敗時只會少資料 (載入時驗證失敗而重新解析)，不會混入過期的區塊
+        DeltaStore.clear_chunks(folder)
+        self._write_chunk(folder, 0, 0, attrs)
+
+    def save_tail(self, folder: str, start_sid: int, **attrs) -> None:
+        """只把 start_sid 之後 (append 新增) 的變動列追加為新區塊，成本與新快照成正比。"""
+        paths = DeltaStore.chunk_paths(folder)
+        if not paths:
+            self.save(folder, **attrs)
+            return
+        index = int(os.path.basename(paths[-1])[:-len('.parquet')]) + 1
+        self._write_chunk(folder, index, start_sid, attrs)
+
+    @classmethod
+    def load(cls, folder: str) -> Tuple['DeltaStore', List[dict]]:
+        """依序讀回所有區塊，回傳 (變動集, 各區塊的 attrs)。"""
+        times, frames, chunk_attrs = [], [], []
+        n_times = 0
+        for path in DeltaStore.chunk_paths(folder):
+            chunk = pd.read_parquet(path, memory_map=True)
+            attrs = dict(chunk.attrs)
+            if attrs.pop('start_sid', None) != n_times:
+                raise ValueError(f"delta chunk out of sequence: {path}")
+            chunk_times = np.array(attrs.pop('times', []), dtype='int64').astype(attrs.pop('time_dtype', 'datetime64[ns]'))
+            chunk.attrs = {}
+            times.append(chunk_times)
+            frames.append(chunk)
+            chunk_attrs.append(attrs)
+            n_times += len(chunk_times)
+        if not frames:
+            raise FileNotFoundError(folder)
+        changes = concat_aligned(frames).sort_values([KEY_COL, SID_COL], kind='stable').reset_index(drop=True)
+        return cls(np.concatenate(times), changes), chunk_attrs
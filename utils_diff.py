@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from typing import List
+
+import utils_perf as perf
+
+KEY_COL = '成員'
+GROUP_COL = '分組'
+REGION_COL = '所屬勢力'
+RANK_COL = '貢獻排行'
+# (數值欄位, 差值欄位)：差值為 後 - 前
+DELTA_COLS = (('戰功總量', '戰功增加'), ('勢力值', '勢力增加'))
+STATUS_STAY, STATUS_JOINED, STATUS_LEFT = '留任', '新加入', '離開'
+
+
+class MemberKeys:
+    """成員名稱 -> 整數鍵值，每個資料版本建立一次。
+
+    名稱只在建立時雜湊一次；類別欄位只需查詢各類別的鍵值，再以 codes 展開。
+    """
+
+    def __init__(self, names):
+        self.index = pd.Index(pd.unique(np.asarray(names, dtype=object)))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'MemberKeys':
+        if df.empty:
+            return cls([])
+        names = df[KEY_COL]
+        return cls(names.cat.categories if isinstance(names.dtype, pd.CategoricalDtype) else names.unique())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _lookup(self, names: pd.Series) -> np.ndarray:
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            codes = names.cat.codes.to_numpy()
+            lookup = np.append(self.index.get_indexer(names.cat.categories), -1)
+            return lookup[codes]  # codes 為 -1 (空值) 時取到最後的 -1
+        return self.index.get_indexer(names.to_numpy(dtype=object))
+
+    def encode(self, *columns: pd.Series) -> List[np.ndarray]:
+        """各欄名稱的鍵值；不在索引內的名稱 (例如 sqlite 模式只載入最新快照時的舊成員)
+        在所有欄位間一起編號，接在既有鍵值之後。"""
+        keys = [self._lookup(names) for names in columns]
+        missing = [k < 0 for k in keys]
+        if any(m.any() for m in missing):
+            extra_names = np.concatenate([names.to_numpy(dtype=object)[m] for names, m in zip(columns, missing)])
+            extra, _ = pd.factorize(extra_names)
+            offset = 0
+            for k, m in zip(keys, missing):
+                n = int(m.sum())
+                k[m] = len(self.index) + extra[offset:offset + n]
+                offset += n
+        return keys
+
+
+def _positions(n_keys: int, keys: np.ndarray) -> np.ndarray:
+    """鍵值 -> 在快照中的列位置，不在該快照時為 -1。鍵值是連續整數，直接當成陣列索引。"""
+    pos = np.full(n_keys, -1, dtype=np.int64)
+    pos[keys] = np.arange(len(keys))
+    return pos
+
+
+def _take(df: pd.DataFrame, col: str, pos: np.ndarray) -> np.ndarray:
+    """數值欄位依列位置取值，位置為 -1 時為 NaN。"""
+    out = np.full(len(pos), np.nan)
+    if col in df.columns and len(df):
+        found = pos >= 0
+        out[found] = df[col].to_numpy(dtype=np.float64)[pos[found]]
+    return out
+
+
+def _label_codes(before: pd.DataFrame, after: pd.DataFrame, col: str, p1: np.ndarray, p2: np.ndarray):
+    """兩個快照的名稱欄位對齊到同一份類別字典：回傳 (前 codes, 後 codes, categories)，缺少時為 -1。"""
+    cats = [pd.Categorical(df[col]) if col in df.columns else pd.Categorical([]) for df in (before, after)]
+    categories = cats[0].categories.union(cats[1].categories)
+    codes = []
+    for cat, pos in zip(cats, (p1, p2)):
+        recode = np.append(categories.get_indexer(cat.categories), -1)
+        taken = np.full(len(pos), -1, dtype=np.int64)
+        found = pos >= 0
+        taken[found] = recode[cat.codes[pos[found]]]
+        codes.append(taken)
+    return codes[0], codes[1], categories
+
+
+@perf.timed()
+def diff_snapshots(before: pd.DataFrame, after: pd.DataFrame, keys: MemberKeys) -> pd.DataFrame:
+    """以成員鍵值對齊兩個快照，回傳每位成員的前後差異。
+
+    欄位：成員、分組、狀態 (留任/新加入/離開)、原勢力、現勢力、換區，後一個快照的
+    戰功總量/勢力值/貢獻排行，以及戰功增加、勢力增加、排名變化 (正值為排名上升)。
+    只出現在其中一個快照的成員，差值為 NaN；分組與名稱取後一個快照，離開者取前一個。
+    名稱欄位為類別型別，全程只處理整數 codes。
+    """
+    k1, k2 = keys.encode(before[KEY_COL], after[KEY_COL])
+    n_keys = int(max(k1.max(initial=-1), k2.max(initial=-1))) + 1
+    pos1, pos2 = _positions(n_keys, k1), _positions(n_keys, k2)
+    union = np.flatnonzero((pos1 >= 0) | (pos2 >= 0))
+    p1, p2 = pos1[union], pos2[union]
+    in_before, in_after = p1 >= 0, p2 >= 0
+
+    def latest_label(col: str) -> pd.Categorical:
+        c1, c2, categories = _label_codes(before, after, col, p1, p2)
+        return pd.Categorical.from_codes(np.where(in_after, c2, c1), categories)
+
+    r1, r2, regions = _label_codes(before, after, REGION_COL, p1, p2)
+    status = np.where(in_before & in_after, 0, np.where(in_after, 1, 2))
+    out = pd.DataFrame({
+        KEY_COL: latest_label(KEY_COL),
+        GROUP_COL: latest_label(GROUP_COL),
+        '狀態': pd.Categorical.from_codes(status, [STATUS_STAY, STATUS_JOINED, STATUS_LEFT]),
+        '原勢力': pd.Categorical.from_codes(r1, regions),
+        '現勢力': pd.Categorical.from_codes(r2, regions),
+        '換區': in_before & in_after & (r1 != r2),
+    })
+    for col, delta_col in DELTA_COLS:
+        value_after = _take(after, col, p2)
+        out[col] = value_after
+        out[delta_col] = value_after - _take(before, col, p1)
+    rank_after = _take(after, RANK_COL, p2)
+    out[RANK_COL] = rank_after
+    out['排名變化'] = _take(before, RANK_COL, p1) - rank_after
+    return out
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from typing import Iterable, Optional
+
+import utils_perf as perf
+
+MEMBER_COL = '成員'
+TIME_COL = '紀錄時間'
+GROUP_COL = '分組'
+REGION_COL = '所屬勢力'
+HISTORY_COLS = [MEMBER_COL, TIME_COL, GROUP_COL, REGION_COL]
+# 區段的頭尾快照序號 (含)，見 RegionStays.from_runs
+FIRST_COL, LAST_COL = '_first', '_last'
+RUN_COLS = [MEMBER_COL, GROUP_COL, REGION_COL]
+
+
+def _codes(values: pd.Series):
+    """名稱欄位 -> (codes, categories)；類別欄位直接沿用，空值為 -1。"""
+    cat = values.array if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+    return cat.codes.astype(np.int32), cat.categories
+
+
+class RegionStays:
+    """每位成員在各地區的停留區段 (run-length encoding)，每個資料版本建立一次。
+
+    同一成員在相鄰快照間分組與所屬勢力都不變時合併為一段；中途缺席 (離開同盟) 也會切段。
+    stays 每列一段：成員、分組、所屬勢力、來自 (緊接著的前一段所在地區，新加入為空)、
+    進入、最後出現、離開 (下一個快照時間，最新快照仍在時為 NaT) 與快照數。
+    moves 是由各段起訖推得的進出紀錄；每個快照 × 分組 × 地區的人數則以差分陣列
+    由各段起訖累加，查詢人數變化不必再看成員資料。
+    """
+
+    def __init__(self, history: pd.DataFrame):
+        t, times = pd.factorize(history[TIME_COL].to_numpy(), sort=True)
+        t = t.astype(np.int32)
+        self._build(times, history[MEMBER_COL], history[GROUP_COL], history[REGION_COL], t, t)
+
+    @classmethod
+    def from_runs(cls, times: np.ndarray, runs: pd.DataFrame) -> 'RegionStays':
+        """由已壓縮的區段建立，不必展開完整歷史。
+
+        runs 每列為成員在快照序號 FIRST_COL..LAST_COL (含) 之間分組與所屬勢力不變的一段
+        (例如 delta 的變動列或 SQLite 的 gaps-and-islands 查詢)；相鄰且相同的區段會再合併。
+        """
+        stays = cls.__new__(cls)
+        stays._build(np.asarray(times), runs[MEMBER_COL], runs[GROUP_COL], runs[REGION_COL],
+                     runs[FIRST_COL].to_numpy().astype(np.int32), runs[LAST_COL].to_numpy().astype(np.int32))
+        return stays
+
+    def _build(self, times: np.ndarray, members: pd.Series, groups: pd.Series, regions: pd.Series,
+               first: np.ndarray, last: np.ndarray) -> None:
+        self.times = times
+        m, self.members = _codes(members)
+        g, self.groups = _codes(groups)
+        r, self.regions = _codes(regions)
+
+        order = np.lexsort((first, m))
+        m, g, r, first, last = m[order], g[order], r[order], first[order], last[order]
+        # 同一成員在同一快照重複出現時只保留第一列
+        kept = np.ones(len(m), dtype=bool)
+        kept[1:] = (m[1:] != m[:-1]) | (first[1:] != first[:-1])
+        m, g, r, first, last = m[kept], g[kept], r[kept], first[kept], last[kept]
+
+        n = len(m)
+        same_member = np.zeros(n, dtype=bool)
+        same_member[1:] = m[1:] == m[:-1]
+        contiguous = np.zeros(n, dtype=bool)
+        contiguous[1:] = same_member[1:] & (first[1:] == last[:-1] + 1)
+        new_stay = ~contiguous
+        new_stay[1:] |= (g[1:] != g[:-1]) | (r[1:] != r[:-1])
+        starts = np.flatnonzero(new_stay)
+        ends = np.append(starts[1:], n) - 1
+        # 各段涵蓋的快照數：列長度的前綴和相減
+        covered = np.append(0, np.cumsum(last - first + 1))
+
+        # 前一段緊接著這一段 (中間沒有缺席) 時記錄來源地區
+        from_region = np.full(len(starts), -1, dtype=np.int32)
+        linked = contiguous[starts]
+        from_region[linked] = r[starts[linked] - 1]
+        exit_t = last[ends] + 1
+        still_here = exit_t >= len(self.times)
+
+        self.stays = pd.DataFrame({
+            MEMBER_COL: pd.Categorical.from_codes(m[starts], self.members),
+            GROUP_COL: pd.Categorical.from_codes(g[starts], self.groups),
+            REGION_COL: pd.Categorical.from_codes(r[starts], self.regions),
+            '來自': pd.Categorical.from_codes(from_region, self.regions),
+            '進入': self.times[first[starts]],
+            '最後出現': self.times[last[ends]],
+            '離開': pd.Series(self.times[np.minimum(exit_t, len(self.times) - 1)]).where(~still_here).to_numpy(),
+            '快照數': (covered[ends + 1] - covered[starts]).astype(np.int32),
+        })
+
+        # 進出紀錄：第一個快照之後的每次進入 (換區或新加入；只換分組不算)，
+        # 以及離開同盟 (下一段不是緊接著的)
+        m, g, r, t_start = m[starts], g[starts], r[starts], first[starts]
+        entered = (t_start > 0) & ~(linked & (from_region == r))
+        left = ~still_here & ~np.append(linked[1:], False)
+        move_t = np.concatenate([t_start[entered], exit_t[left]])
+        order = np.argsort(-move_t, kind='stable')
+        self._move_t = move_t[order]
+        self.moves = pd.DataFrame({
+            TIME_COL: self.times[self._move_t],
+            MEMBER_COL: pd.Categorical.from_codes(np.concatenate([m[entered], m[left]])[order], self.members),
+            GROUP_COL: pd.Categorical.from_codes(np.concatenate([g[entered], g[left]])[order], self.groups),
+            '從': pd.Categorical.from_codes(np.concatenate([from_region[entered], r[left]])[order], self.regions),
+            '到': pd.Categorical.from_codes(np.concatenate([r[entered], np.full(int(left.sum()), -1, dtype=np.int32)])[order], self.regions),
+        })
+
+        # (快照, 分組, 地區) 的人數：每段在進入時 +1、離開時 -1，再沿時間累加
+        valid = (g >= 0) & (r >= 0)
+        delta = np.zeros((len(self.times) + 1, max(len(self.groups), 1), max(len(self.regions), 1)), dtype=np.int32)
+        np.add.at(delta, (t_start[valid], g[valid], r[valid]), 1)
+        np.add.at(delta, (exit_t[valid], g[valid], r[valid]), -1)
+        self._count = np.cumsum(delta, axis=0, dtype=np.int32)[:-1]
+
+    def __len__(self) -> int:
+        return len(self.stays)
+
+    @staticmethod
+    def _lookup(labels: pd.Index, wanted: Optional[Iterable]) -> np.ndarray:
+        if wanted is None:
+            return np.arange(len(labels))
+        idx = labels.get_indexer(list(wanted))
+        return idx[idx >= 0]
+
+    @perf.timed('RegionStays.headcount')
+    def headcount(self, regions: Iterable[str], groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """每個快照在 regions (前線) 的人數與所選分組的總人數；groups 為 None 表示不限。"""
+        by_group = self._count[:, self._lookup(self.groups, groups), :]
+        front = by_group[:, :, self._lookup(self.regions, regions)].sum(axis=(1, 2))
+        return pd.DataFrame({TIME_COL: self.times, '前線': front, '總人數': by_group.sum(axis=(1, 2))})
+
+    def recent_moves(self, since=None, regions: Optional[Iterable[str]] = None,
+                     groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """since 之後 (預設只看最新快照) 的進出紀錄，依時間由新到舊。
+
+        regions 指定時只保留 從 或 到 在其中的紀錄。
+        """
+        if len(self.times) == 0:
+            return self.moves
+        since_id = len(self.times) - 1 if since is None else int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(since)), 'left'))
+        # moves 依時間由新到舊排序，since 之後的紀錄是開頭的連續區段
+        n_recent = int(np.searchsorted(-self._move_t, -since_id, side='right'))
+        moves = self.moves.iloc[:n_recent]
+        if groups is not None:
+            moves = moves[moves[GROUP_COL].isin(list(groups))]
+        if regions is not None:
+            regions = list(regions)
+            moves = moves[moves['從'].isin(regions) | moves['到'].isin(regions)]
+        return moves
@@ -0,0 +1,173 @@
+"""每次 rerun 的分段計時：資料層函式、快取命中與各卡片的耗時及列數。
+
+以 begin() / end() 包住一次執行，期間的 timer() 會記錄成巢狀的 Span；
+沒有進行中的執行時 timer() 幾乎沒有額外成本，資料核心因此可以無條件加上計時。
+結果可用 log_run() 輸出成一行 JSON (logger 'slg.perf')，或交給介面顯示。
+不依賴 Streamlit。
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+logger = logging.getLogger('slg.perf')
+if os.environ.get('SLG_PERF_LOG') == '1':
+    # 不想調整 logging 設定時，以環境變數直接開啟每次 rerun 的紀錄
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.StreamHandler())
+
+
+class Span:
+    __slots__ = ('name', 'depth', 'seconds', 'rows', 'cache')
+
+    def __init__(self, name: str, depth: int = 0):
+        self.name = name
+        self.depth = depth
+        self.seconds = 0.0
+        self.rows: Optional[int] = None
+        self.cache: Optional[str] = None  # 'hit' / 'miss'，非快取函式為 None
+
+
+class Run:
+    """一次執行 (完整 rerun 或單一卡片 fragment) 的所有 Span，依開始順序排列。"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.spans: List[Span] = []
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+        self._stack: List[Span] = []
+
+    def counts(self) -> dict:
+        hits = sum(1 for s in self.spans if s.cache == 'hit')
+        misses = sum(1 for s in self.spans if s.cache == 'miss')
+        return {'hit': hits, 'miss': misses}
+
+    def rows(self) -> List[dict]:
+        return [
+            {'區段': '· ' * s.depth + s.name, 'ms': round(s.seconds * 1000, 2), '列數': s.rows, '快取': s.cache or ''}
+            for s in self.spans
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            'run': self.label,
+            'total_ms': round(self.seconds * 1000, 2),
+            'cache': self.counts(),
+            'spans': [
+                {'name': s.name, 'depth': s.depth, 'ms': round(s.seconds * 1000, 3), 'rows': s.rows, 'cache': s.cache}
+                for s in self.spans
+            ],
+        }
+
+
+_RUN: contextvars.ContextVar = contextvars.ContextVar('slg_perf_run', default=None)
+_NULL_SPAN = Span('')
+
+
+def begin(label: str = 'rerun') -> Run:
+    """開始記錄一次執行；同一執行緒中尚未結束的舊紀錄直接被取代。"""
+    run = Run(label)
+    _RUN.set(run)
+    return run
+
+
+def end() -> Optional[Run]:
+    run = _RUN.get()
+    if run is None:
+        return None
+    run.seconds = time.perf_counter() - run._start
+    _RUN.set(None)
+    return run
+
+
+def active() -> bool:
+    return _RUN.get() is not None
+
+
+def row_count(obj) -> Optional[int]:
+    """DataFrame / Series / ndarray 的列數；Styler 看底層資料，tuple 加總其中的資料表。"""
+    if hasattr(obj, 'shape'):
+        return int(obj.shape[0]) if obj.shape else None
+    if hasattr(obj, 'data') and hasattr(obj.data, 'shape'):
+        return int(obj.data.shape[0])
+    if isinstance(obj, tuple):
+        counts = [row_count(item) for item in obj]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    frame = getattr(obj, 'frame', None)
+    return row_count(frame) if frame is not None else None
+
+
+@contextmanager
+def timer(name: str) -> Iterator[Span]:
+    """記錄一個區段；沒有進行中的執行時回傳共用的空 Span，不做任何計時。"""
+    run = _RUN.get()
+    if run is None:
+        yield _NULL_SPAN
+        return
+    span = Span(name, len(run._stack))
+    run.spans.append(span)
+    run._stack.append(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.seconds = time.perf_counter() - start
+        run._stack.pop()
+
+
+def mark_miss() -> None:
+    """由快取的計算函式呼叫，把目前的區段標記為未命中。"""
+    run = _RUN.get()
+    if run is not None and run._stack:
+        run._stack[-1].cache = 'miss'
+
+
+def timed(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """函式計時的裝飾器，並記錄回傳值的列數。"""
+    def decorator(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _RUN.get() is None:
+                return fn(*args, **kwargs)
+            with timer(label) as span:
+                result = fn(*args, **kwargs)
+                span.rows = row_count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def section(name: str) -> Iterator[Optional[Run]]:
+    """卡片用的區段：在完整 rerun 中是一般的 timer；fragment 單獨重跑時自成一次執行並輸出紀錄。
+
+    單獨執行時回傳該次的 Run (結束後才有總耗時)，否則回傳 None。
+    """
+    if _RUN.get() is not None:
+        with timer(name):
+            yield None
+        return
+    run = begin(f'fragment:{name}')
+    try:
+        yield run
+    finally:
+        end()
+        log_run(run)
+
+
+def log_run(run: Optional[Run]) -> None:
+    if run is not None and logger.isEnabledFor(logging.INFO):
+        logger.info('perf %s', json.dumps(run.to_dict(), ensure_ascii=False))
+
+
+def summary(run: Run) -> str:
+    counts = run.counts()
+    return f"⏱️ {run.seconds * 1000:.1f} ms | 快取 {counts['hit']} 命中 / {counts['miss']} 未命中 | {len(run.spans)} 區段"
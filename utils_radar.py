@@ -0,0 +1,117 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import utils_perf as perf
+
+GE_OP = '大於 >='
+LE_OP = '小於 <='
+RANK_COL = '貢獻排行'
+GROUP_COL = '分組'
+# (條件欄位前綴, 資料欄位)
+FIELDS = (('merit', '戰功總量'), ('power', '勢力值'), ('eff', '戰功效率'))
+MEMO_SIZE = 64
+
+
+class RadarFilter(NamedTuple):
+    merit_op: str = GE_OP
+    merit_val: float = 0
+    power_op: str = GE_OP
+    power_val: float = 0
+    eff_op: str = GE_OP
+    eff_val: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RadarFilter':
+        """由 RADAR_CONFIG 格式的設定建立 (忽略 desc 等多餘欄位)。"""
+        return cls(**{k: config[k] for k in cls._fields if k in config})
+
+
+class RadarIndex:
+    """最新快照的戰術雷達查詢索引。
+
+    資料列依貢獻排行排序後拆成 numpy 陣列：三組門檻編譯成單一遮罩，
+    排行上限只是前綴切片，分組則比對 factorize 後的整數代碼。
+    同一組門檻的結果 (列位置) 會被記住，預設條件在建立時即算好，
+    因此切換預設、調整排行或分組都不需重新掃描資料。
+    預設與使用者儲存的條件 (prepare) 常駐不淘汰；其他臨時條件共用一份
+    最多 MEMO_SIZE 組的 LRU 快取。
+    """
+
+    def __init__(self, frame: pd.DataFrame, presets: Optional[Dict[str, dict]] = None):
+        frame = frame.sort_values(RANK_COL, kind='stable').reset_index(drop=True)
+        self.frame = frame
+        self._values = {col: frame[col].to_numpy() for _, col in FIELDS}
+        self._rank = frame[RANK_COL].to_numpy()
+        self._group_codes, self._groups = pd.factorize(frame[GROUP_COL])
+        self._names = frame['成員'].to_numpy()
+        self._pinned: Dict[RadarFilter, np.ndarray] = {}
+        self._memo: 'OrderedDict[RadarFilter, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        if presets:
+            self.prepare(presets.values())
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def prepare(self, configs: Iterable[dict]) -> None:
+        """預先計算一批預設條件並常駐 (不受 MEMO_SIZE 淘汰)；已算過的直接沿用。"""
+        for config in configs:
+            radar_filter = RadarFilter.from_config(config)
+            with self._lock:
+                if radar_filter in self._pinned:
+                    continue
+                rows = self._memo.pop(radar_filter, None)
+            if rows is None:
+                rows = self._evaluate(radar_filter)
+            with self._lock:
+                self._pinned[radar_filter] = rows
+
+    def positions(self, radar_filter: RadarFilter) -> np.ndarray:
+        """符合門檻的列位置 (依貢獻排行遞增)。"""
+        with self._lock:
+            rows = self._pinned.get(radar_filter)
+            if rows is None:
+                rows = self._memo.get(radar_filter)
+                if rows is not None:
+                    self._memo.move_to_end(radar_filter)
+        if rows is not None:
+            return rows
+
+        rows = self._evaluate(radar_filter)
+        with self._lock:
+            self._memo[radar_filter] = rows
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return rows
+
+    def _evaluate(self, radar_filter: RadarFilter) -> np.ndarray:
+        mask = np.ones(len(self.frame), dtype=bool)
+        for prefix, col in FIELDS:
+            values = self._values[col]
+            threshold = getattr(radar_filter, f'{prefix}_val')
+            if '大於' in getattr(radar_filter, f'{prefix}_op'):
+                mask &= values >= threshold
+            else:
+                mask &= values <= threshold
+        return np.flatnonzero(mask)
+
+    def _select(self, radar_filter: RadarFilter, rank_cap: Optional[float], groups: Optional[Iterable[str]]) -> np.ndarray:
+        rows = self.positions(radar_filter)
+        if rank_cap is not None:
+            # 依排行排序，排行 <= rank_cap 的列正好是 limit 之前的位置
+            limit = np.searchsorted(self._rank, rank_cap, side='right')
+            rows = rows[:np.searchsorted(rows, limit)]
+        if groups is not None:
+            wanted = self._groups.get_indexer(list(groups))
+            rows = rows[np.isin(self._group_codes[rows], wanted[wanted >= 0])]
+        return rows
+
+    @perf.timed('RadarIndex.query')
+    def query(self, radar_filter: RadarFilter, rank_cap: Optional[float] = None, groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        return self.frame.iloc[self._select(radar_filter, rank_cap, groups)]
+
+    def members(self, radar_filter: RadarFilter, rank_cap: Optional[float] = None, groups: Optional[Iterable[str]] = None) -> List[str]:
+        return list(self._names[self._select(radar_filter, rank_cap, groups)])
@@ -0,0 +1,160 @@
+import bisect
+import unicodedata
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import utils_perf as perf
+
+try:
+    import opencc
+    try:
+        _OPENCC = opencc.OpenCC('t2s')
+    except Exception:
+        _OPENCC = opencc.OpenCC('t2s.json')  # 官方套件的設定檔名稱
+    OPENCC_AVAILABLE = True
+except Exception:
+    _OPENCC = None
+    OPENCC_AVAILABLE = False
+
+# 沒有 OpenCC 時的備用對照：成員、分組與地區名稱常見的繁簡字
+_T2S_PAIRS = (
+    '國国 東东 陳陈 衛卫 鐵铁 夢梦 黃黄 紅红 燒烧 餅饼 賊贼 農农 梟枭 風风 雲云 龍龙 劍剑 鳳凤 華华 麗丽 '
+    '靈灵 戰战 勢势 團团 隊队 員员 組组 長长 門门 關关 開开 會会 過过 來来 時时 說说 話话 語语 學学 書书 '
+    '邊边 遠远 運运 還还 進进 選选 這这 個个 們们 為为 無无 與与 業业 樂乐 歡欢 歲岁 聖圣 馬马 魚鱼 鳥鸟 '
+    '鷹鹰 雞鸡 獅狮 貓猫 豬猪 龜龟 畫画 雙双 飛飞 愛爱 憶忆 貴贵 賢贤 寶宝 貝贝 發发 級级 結结 絕绝 緣缘 '
+    '綠绿 藍蓝 親亲 見见 頭头 顏颜 願愿 廣广 區区 醫医 離离 難难 電电 霧雾 靜静 韓韩 響响 順顺 領领 點点 '
+    '齊齐 聲声 聯联 職职 舊旧 藝艺 蘇苏 號号 術术 軍军 輕轻 輝辉 轉转 遊游 鄭郑 銀银 鋒锋 錢钱 鎮镇 鏡镜 '
+    '閃闪 陣阵 陰阴 陸陆 陽阳 險险 隱隐 鬥斗 騎骑 驚惊 體体 髮发 鹽盐 麥麦 齡龄 歷历 壓压 應应 慶庆 勝胜 '
+    '敗败 殺杀 滅灭 淚泪 鐘钟 鳴鸣 鶴鹤 蓮莲 蘭兰 葉叶 櫻樱 楓枫 張张 劉刘 孫孙 趙赵 楊杨 吳吴 鄧邓 許许 '
+    '蕭萧 韋韦 馮冯 諸诸 漢汉 呂吕 潁颍 內内 魯鲁 傑杰 濤涛 飄飘 曉晓 亞亚 瑪玛 羅罗 瘋疯 蒼苍 剎刹 軼轶'
+)
+_T2S_TABLE = str.maketrans({pair[0]: pair[1] for pair in _T2S_PAIRS.split()})
+# 名稱中常用來分隔「分組丨暱稱」的字元；丨 是 CJK 字元，isalnum() 無法分辨
+SEPARATORS = set('丨｜|')
+SEGMENT_MARK = '\x1f'
+
+
+def fold_variants(text: str) -> str:
+    """繁體轉為簡體，使兩種寫法比對時視為相同。"""
+    if _OPENCC is not None:
+        return _OPENCC.convert(text)
+    return text.translate(_T2S_TABLE)
+
+
+def normalize(text: str, variants: bool = True) -> str:
+    """比對用的鍵值：全形轉半形、忽略大小寫與前後空白，並可選擇統一繁簡字。"""
+    key = unicodedata.normalize('NFKC', str(text)).casefold().strip()
+    return fold_variants(key) if variants else key
+
+
+def _segment_key(key: str) -> str:
+    """把分隔符號統一換成 SEGMENT_MARK，用來找「分隔符號後的開頭」。"""
+    return ''.join(SEGMENT_MARK if c in SEPARATORS or not c.isalnum() else c for c in key)
+
+
+def _grams(key: str) -> Iterable[str]:
+    """單字與相鄰兩字；中文名字短，雙字組已足以大幅縮小候選。"""
+    yield from key
+    for i in range(len(key) - 1):
+        yield key[i:i + 2]
+
+
+class MemberSearch:
+    """成員名稱的搜尋索引，每個資料版本建立一次。
+
+    名稱正規化後建立單字/雙字的倒排索引，查詢時交集各字組的名單，再以 numpy
+    一次確認子字串位置並排序；不使用正規表示式，因此 丨、括號等字元都照字面比對。
+    前綴另以排序後的鍵值二分搜尋，開頭相符的結果已足夠時不必走倒排索引。
+    結果依 完全相同 > 名稱開頭 > 分隔符號後的開頭 > 出現位置 > 名稱長度 排序。
+    variants=True 時繁簡字視為相同 (有安裝 OpenCC 時使用完整對照)。
+    """
+
+    def __init__(self, names: Sequence[str], groups: Optional[Sequence[str]] = None, variants: bool = True):
+        self.variants = variants
+        self.names = np.asarray([str(name) for name in names], dtype=object)
+        self._keys = [normalize(name, variants) for name in self.names]
+        if groups is not None:
+            self._group_codes, self._groups = pd.factorize(pd.Series(list(groups)))
+        else:
+            self._group_codes, self._groups = None, None
+
+        postings: Dict[str, List[int]] = defaultdict(list)
+        for i, key in enumerate(self._keys):
+            for gram in set(_grams(key)):
+                postings[gram].append(i)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+        self._sorted_keys = [self._keys[i] for i in order]
+        self._sorted_ids = np.array(order, dtype=np.int32)
+        self._key_rank = np.empty(len(order), dtype=np.int32)
+        self._key_rank[self._sorted_ids] = np.arange(len(order), dtype=np.int32)
+
+        # 排序時用到的逐名稱陣列 (固定寬度字串讓 np.char.find 不必逐一呼叫 Python)
+        self._key_arr = np.array(self._keys, dtype=str)
+        self._segment_arr = np.array([_segment_key(key) for key in self._keys], dtype=str)
+        self._lengths = np.array([len(key) for key in self._keys], dtype=np.int32)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, variants: bool = True) -> 'MemberSearch':
+        rows = df.drop_duplicates('成員')
+        return cls(rows['成員'].tolist(), rows['分組'].tolist() if '分組' in rows else None, variants)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix(self, key: str) -> np.ndarray:
+        """鍵值以 key 開頭的名稱編號 (key 需已正規化)。"""
+        lo = bisect.bisect_left(self._sorted_keys, key)
+        hi = bisect.bisect_left(self._sorted_keys, key + '\U0010ffff')
+        return self._sorted_ids[lo:hi]
+
+    def _candidates(self, key: str) -> np.ndarray:
+        grams = [key] if len(key) == 1 else sorted({key[i:i + 2] for i in range(len(key) - 1)},
+                                                   key=lambda g: len(self._postings.get(g, ())))
+        ids = self._postings.get(grams[0])
+        if ids is None:
+            return np.empty(0, dtype=np.int32)
+        for gram in grams[1:]:
+            other = self._postings.get(gram)
+            if other is None:
+                return np.empty(0, dtype=np.int32)
+            ids = np.intersect1d(ids, other, assume_unique=True)
+            if len(ids) == 0:
+                break
+        return ids
+
+    def _in_groups(self, ids: np.ndarray, groups: Optional[Iterable[str]]) -> np.ndarray:
+        if groups is None or self._group_codes is None:
+            return ids
+        wanted = self._groups.get_indexer(list(groups))
+        return ids[np.isin(self._group_codes[ids], wanted[wanted >= 0])]
+
+    def _rank(self, ids: np.ndarray, key: str, limit: Optional[int]) -> List[str]:
+        pos = np.char.find(self._key_arr[ids], key)
+        hit = pos >= 0
+        ids, pos = ids[hit], pos[hit]
+        lengths = self._lengths[ids]
+        tier = np.full(len(ids), 3, dtype=np.int8)
+        tier[np.char.find(self._segment_arr[ids], SEGMENT_MARK + key) >= 0] = 2
+        tier[pos == 0] = 1
+        tier[(pos == 0) & (lengths == len(key))] = 0
+        order = np.lexsort((self._key_rank[ids], lengths, pos, tier))
+        if limit is not None:
+            order = order[:limit]
+        return self.names[ids[order]].tolist()
+
+    @perf.timed('MemberSearch.search')
+    def search(self, query: str, limit: Optional[int] = None, groups: Optional[Iterable[str]] = None) -> List[str]:
+        """名稱包含 query 的成員，依相關程度排序；groups 指定時只保留這些分組。"""
+        key = normalize(query, self.variants)
+        if not key or not len(self):
+            return []
+        if limit is not None:
+            # 開頭相符的已經排在最前面，數量足夠時後面的比對可以省略
+            ids = self._in_groups(self.prefix(key), groups)
+            if len(ids) >= limit:
+                return self._rank(ids, key, limit)
+        return self._rank(self._in_groups(self._candidates(key), groups), key, limit)
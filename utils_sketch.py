@@ -0,0 +1,165 @@
+"""可合併的分位數摘要 (DDSketch 式的對數分桶)。
+
+每個值依 |v| 的對數放入寬度比為 GAMMA 的桶，摘要只保存各桶的計數；
+兩份摘要的計數相加就是合併，結果與資料順序無關。因此每個快照 × 分組
+可以在匯入時各算一份，之後任意分組組合的分位數只需合併這幾份摘要。
+
+誤差界：資料同號時 (戰功為非負值)，quantile(q) 與
+pandas Series.quantile(q) (線性內插) 的相對誤差不超過 ALPHA。
+桶的代表值與桶內任何值的相對誤差至多 ALPHA，相鄰兩個名次的估計值
+再以相同比例內插，誤差界不變。絕對值小於 MIN_VALUE 的值視為 0。
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ALPHA = 0.01
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+MIN_VALUE = 1e-9
+_LOG_GAMMA = np.log(GAMMA)
+# slot：0 代表 0，正值從 1 起算，負值取相反數，slot 的大小順序即數值順序
+_KEY_OFFSET = int(np.ceil(np.log(MIN_VALUE) / _LOG_GAMMA)) - 1
+
+# 只有戰功門檻 (MERIT_THRESHOLD_95) 用到分位數；勢力與效率的分級是固定門檻 (utils_style)，不另建摘要
+SKETCH_MEASURES = ('戰功總量',)
+
+
+def to_slots(values) -> np.ndarray:
+    """值 -> slot (值落在 (GAMMA^(k-1), GAMMA^k] 的桶 k)。"""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    slots = np.zeros(len(values), dtype=np.int32)
+    nonzero = magnitude >= MIN_VALUE
+    keys = np.ceil(np.log(magnitude[nonzero]) / _LOG_GAMMA) - _KEY_OFFSET
+    slots[nonzero] = keys.astype(np.int32) * np.sign(values[nonzero]).astype(np.int32)
+    return slots
+
+
+def slot_values(slots) -> np.ndarray:
+    """slot 的代表值 2·GAMMA^k / (GAMMA + 1)，與桶內任何值的相對誤差不超過 ALPHA。"""
+    slots = np.asarray(slots, dtype=np.int64)
+    magnitude = 2 * GAMMA ** (np.abs(slots) + _KEY_OFFSET).astype(np.float64) / (GAMMA + 1)
+    return np.where(slots == 0, 0.0, np.sign(slots) * magnitude)
+
+
+class QuantileSketch:
+    """一組數值的分位數摘要：排序後的 slot 與各自的計數。建立後不再修改，可安全共用。"""
+
+    __slots__ = ('slots', 'counts')
+
+    def __init__(self, slots=None, counts=None):
+        self.slots = np.asarray(slots if slots is not None else [], dtype=np.int32)
+        self.counts = np.asarray(counts if counts is not None else [], dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values) -> 'QuantileSketch':
+        """由原始數值建立；與 pandas 相同略過 NaN。"""
+        values = np.asarray(values, dtype=np.float64)
+        slots, counts = np.unique(to_slots(values[~np.isnan(values)]), return_counts=True)
+        return cls(slots, counts)
+
+    @classmethod
+    def merge(cls, sketches: Iterable['QuantileSketch']) -> 'QuantileSketch':
+        sketches = [s for s in sketches if len(s.slots)]
+        if not sketches:
+            return cls()
+        if len(sketches) == 1:
+            return sketches[0]
+        slots, inverse = np.unique(np.concatenate([s.slots for s in sketches]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([s.counts for s in sketches]), minlength=len(slots))
+        return cls(slots, counts.astype(np.int64))
+
+    def __add__(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        return QuantileSketch.merge([self, other])
+
+    def __len__(self) -> int:
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        """與 pandas 預設相同取第 q*(n-1) 名並在相鄰名次間線性內插；沒有資料時為 NaN。"""
+        n = len(self)
+        if n == 0:
+            return float('nan')
+        rank = q * (n - 1)
+        lo = int(np.floor(rank))
+        idx = np.searchsorted(np.cumsum(self.counts), [lo, min(lo + 1, n - 1)], side='right')
+        v_lo, v_hi = slot_values(self.slots[idx])
+        return float(v_lo + (rank - lo) * (v_hi - v_lo))
+
+
+def sketch_snapshot(df: pd.DataFrame, group_col: str = '分組',
+                    measures: Iterable[str] = SKETCH_MEASURES) -> Dict[str, Dict[str, QuantileSketch]]:
+    """單一快照每個量值、每個分組一份摘要：{量值: {分組: sketch}}。"""
+    measures = [col for col in measures if col in df.columns]
+    if df.empty or group_col not in df.columns:
+        return {col: {} for col in measures}
+    groups = df.groupby(group_col, observed=True, sort=False).indices
+    return {
+        col: {group: QuantileSketch.from_values(values[idx]) for group, idx in groups.items()}
+        for col, values in ((col, df[col].to_numpy(dtype=np.float64)) for col in measures)
+    }
+
+
+class SketchIndex:
+    """各快照 × 分組 × 量值的摘要，依快照時間排序；每個資料版本組合一次。
+
+    snapshots 為 (紀錄時間, sketch_snapshot 的結果)；同一時間出現多次 (例如重複的檔案)
+    時合併。查詢以 as-of 取快照，再合併所選分組的摘要。
+    """
+
+    def __init__(self, snapshots: Iterable[Tuple[object, Dict[str, Dict[str, QuantileSketch]]]]):
+        by_time: Dict[pd.Timestamp, List[Dict[str, Dict[str, QuantileSketch]]]] = {}
+        for when, sketches in snapshots:
+            if not pd.isna(when):
+                by_time.setdefault(pd.Timestamp(when), []).append(sketches)
+        ordered = sorted(by_time)
+        self.times = pd.DatetimeIndex(ordered).to_numpy()
+        self._snapshots = [self._combine(by_time[when]) for when in ordered]
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, time_col: str = '紀錄時間') -> 'SketchIndex':
+        """由完整歷史一次建立 (沒有匯入時預先算好的摘要時使用)。"""
+        if df.empty:
+            return cls([])
+        return cls((when, sketch_snapshot(part)) for when, part in df.groupby(time_col, sort=True))
+
+    @staticmethod
+    def _combine(parts: List[Dict[str, Dict[str, QuantileSketch]]]) -> Dict[str, Dict[str, QuantileSketch]]:
+        if len(parts) == 1:
+            return parts[0]
+        combined: Dict[str, Dict[str, List[QuantileSketch]]] = {}
+        for sketches in parts:
+            for col, by_group in sketches.items():
+                for group, sketch in by_group.items():
+                    combined.setdefault(col, {}).setdefault(group, []).append(sketch)
+        return {col: {group: QuantileSketch.merge(s) for group, s in by_group.items()} for col, by_group in combined.items()}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _snapshot_id(self, when) -> int:
+        if when is None:
+            return len(self.times) - 1
+        return max(int(np.searchsorted(self.times, np.datetime64(pd.Timestamp(when)), side='right')) - 1, 0)
+
+    def _merged_at(self, sid: int, measure: str, groups: Optional[Tuple[str, ...]]) -> QuantileSketch:
+        by_group = self._snapshots[sid].get(measure, {})
+        if groups is None:
+            return QuantileSketch.merge(by_group.values())
+        return QuantileSketch.merge(by_group[g] for g in groups if g in by_group)
+
+    def sketch(self, measure: str = '戰功總量', when=None, groups: Optional[Iterable[str]] = None) -> QuantileSketch:
+        """不晚於 when 的最後一個快照 (預設最新) 中所選分組合併後的摘要。groups 為 None 表示不限。"""
+        if len(self.times) == 0:
+            return QuantileSketch()
+        return self._merged_at(self._snapshot_id(when), measure, tuple(groups) if groups is not None else None)
+
+    def quantile(self, q: float, measure: str = '戰功總量', when=None, groups: Optional[Iterable[str]] = None) -> float:
+        """所選分組在某個快照的分位數估計，相對誤差不超過 ALPHA。"""
+        return self.sketch(measure, when, groups).quantile(q)
+
+    def history(self, q: float, measure: str = '戰功總量', groups: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """每個快照的分位數，欄位為 紀錄時間 與 measure。"""
+        groups = tuple(groups) if groups is not None else None
+        values = [self._merged_at(sid, measure, groups).quantile(q) for sid in range(len(self.times))]
+        return pd.DataFrame({'紀錄時間': self.times, measure: values})
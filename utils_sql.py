@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+TABLE = 'snapshots'
+FILES_TABLE = 'snapshot_files'
+INDEXES = {
+    'idx_member_time': ('成員', '紀錄時間'),
+    'idx_group_time': ('分組', '紀錄時間'),
+    'idx_time': ('紀錄時間',),
+}
+
+# 每天最後一次快照的時間 (與 utils_core._daily_last_rows 相同的規則)
+DAILY_CTE = f"""daily AS (
+    SELECT MAX("紀錄時間") AS t FROM (SELECT DISTINCT "紀錄時間" FROM {TABLE})
+    GROUP BY substr("紀錄時間", 1, 10)
+)"""
+
+# 每位成員每天自己的最後一筆 (與 utils_core._member_daily_last_rows 相同的規則)
+MEMBER_DAILY_RANK = """ROW_NUMBER() OVER (
+    PARTITION BY s."成員", substr(s."紀錄時間", 1, 10) ORDER BY s."紀錄時間" DESC, s.rowid DESC
+) AS _rn"""
+
+GROWTH_COLS = """
+    (julianday("紀錄時間") - julianday(LAG("紀錄時間") OVER w)) AS time_diff,
+    "戰功總量" - LAG("戰功總量") OVER w AS merit_diff,
+    "勢力值" - LAG("勢力值") OVER w AS power_diff"""
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(dtype) -> str:
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+class SqliteHistory:
+    """以 SQLite 檔案保存所有快照，查詢與彙總直接在資料庫內完成。
+
+    (成員, 紀錄時間) 與 (分組, 紀錄時間) 皆有索引，個人歷史與分組彙總
+    不需要把整季資料載入記憶體。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {FILES_TABLE} ('
+            'name TEXT PRIMARY KEY, cache_key TEXT, "紀錄時間" TEXT, "編碼" TEXT, "筆數" INTEGER)'
+        )
+        self._conn.commit()
+
+    # --- Schema ---
+    def _columns(self) -> List[str]:
+        return [row[1] for row in self._conn.execute(f'PRAGMA table_info({TABLE})')]
+
+    def _ensure_table(self, df: pd.DataFrame) -> None:
+        existing = self._columns()
+        if not existing:
+            cols = ', '.join(f'{_q(col)} {_sql_type(df[col].dtype)}' for col in df.columns)
+            self._conn.execute(f'CREATE TABLE {TABLE} (file TEXT, {cols})')
+            for name, cols in INDEXES.items():
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {TABLE} ({", ".join(_q(c) for c in cols)})')
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_file ON {TABLE} (file)')
+            return
+        for col in df.columns:
+            if col not in existing:
+                self._conn.execute(f'ALTER TABLE {TABLE} ADD COLUMN {_q(col)} {_sql_type(df[col].dtype)}')
+
+    # --- Writes ---
+    def replace_file(self, name: str, cache_key: str, df: pd.DataFrame, meta: dict) -> None:
+        rows = df.copy()
+        rows['紀錄時間'] = rows['紀錄時間'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        for col in rows.columns:
+            if isinstance(rows[col].dtype, pd.CategoricalDtype):
+                rows[col] = rows[col].astype(str)
+        rows.insert(0, 'file', name)
+        with self._lock:
+            self._ensure_table(df)
+            self._conn.execute(f'DELETE FROM {TABLE} WHERE file = ?', (name,))
+            cols = ', '.join(_q(col) for col in rows.columns)
+            marks = ', '.join('?' for _ in rows.columns)
+            self._conn.executemany(f'INSERT INTO {TABLE} ({cols}) VALUES ({marks})', rows.itertuples(index=False, name=None))
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO {FILES_TABLE} VALUES (?, ?, ?, ?, ?)',
+                (name, cache_key, str(meta.get('紀錄時間', '')), meta.get('編碼', ''), int(meta.get('筆數', len(df)))),
+            )
+            self._conn.commit()
+
+    def delete_file(self, name: str) -> None:
+        with self._lock:
+            if self._columns():
+                self._conn.execute(f'DELETE FROM {TABLE} WHERE file = ?', (name,))
+            self._conn.execute(f'DELETE FROM {FILES_TABLE} WHERE name = ?', (name,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f'DROP TABLE IF EXISTS {TABLE}')
+            self._conn.execute(f'DELETE FROM {FILES_TABLE}')
+            self._conn.commit()
+
+    # --- Reads ---
+    def _read(self, sql: str, params: Tuple = ()) -> pd.DataFrame:
+        with self._lock:
+            if not self._columns():
+                return pd.DataFrame()
+            df = pd.read_sql_query(sql, self._conn, params=params)
+        if '紀錄時間' in df.columns:
+            df['紀錄時間'] = pd.to_datetime(df['紀錄時間'])
+        return df.drop(columns=['file', '_rn'], errors='ignore')
+
+    def files(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(f'SELECT name, cache_key, "紀錄時間", "編碼", "筆數" FROM {FILES_TABLE}').fetchall()
+        return {
+            name: {'cache_key': key, '紀錄時間': pd.Timestamp(ts) if ts else pd.NaT, '編碼': enc, '筆數': n}
+            for name, key, ts, enc, n in rows
+        }
+
+    def snapshot_times(self) -> pd.Series:
+        df = self._read(f'SELECT DISTINCT "紀錄時間" FROM {TABLE} ORDER BY "紀錄時間"')
+        return df['紀錄時間'] if not df.empty else pd.Series([], dtype='datetime64[us]')
+
+    def snapshot(self, when: pd.Timestamp) -> pd.DataFrame:
+        """不晚於 when 的最後一次快照 (as-of)。"""
+        ts = pd.Timestamp(when).strftime('%Y-%m-%d %H:%M:%S')
+        return self._read(
+            f'SELECT * FROM {TABLE} WHERE "紀錄時間" = '
+            f'COALESCE((SELECT MAX("紀錄時間") FROM {TABLE} WHERE "紀錄時間" <= ?), (SELECT MIN("紀錄時間") FROM {TABLE}))',
+            (ts,),
+        )
+
+    def latest_snapshot(self) -> pd.DataFrame:
+        return self._read(f'SELECT * FROM {TABLE} WHERE "紀錄時間" = (SELECT MAX("紀錄時間") FROM {TABLE})')
+
+    def members(self) -> List[str]:
+        """所有出現過的成員名稱，依名稱排序 (走 idx_member_time 索引)。"""
+        df = self._read(f'SELECT DISTINCT "成員" FROM {TABLE} ORDER BY "成員"')
+        return df['成員'].tolist() if not df.empty else []
+
+    def member_history(self, member_name: str) -> pd.DataFrame:
+        return self._read(f'SELECT * FROM {TABLE} WHERE "成員" = ? ORDER BY "紀錄時間"', (member_name,))
+
+    def history(self, columns: List[str]) -> pd.DataFrame:
+        """所有快照的指定欄位，依 (成員, 紀錄時間) 排序 (走 idx_member_time 索引)。"""
+        return self._read(f'SELECT {", ".join(_q(col) for col in columns)} FROM {TABLE} ORDER BY "成員", "紀錄時間"')
+
+    def runs(self, columns: List[str]) -> pd.DataFrame:
+        """成員在相鄰快照間 columns 都不變的區段 (gaps-and-islands)，只取回區段而非逐列資料。
+
+        _first / _last 為區段頭尾的快照序號 (依 snapshot_times() 的順序，含)。
+        """
+        values = [col for col in columns if col != '成員']
+        unchanged = ''.join(f' AND LAG(s.{_q(col)}) OVER w IS s.{_q(col)}' for col in values)
+        selected = ''.join(f', {_q(col)}' for col in values)
+        sql = f"""WITH times AS (
+            SELECT "紀錄時間", ROW_NUMBER() OVER (ORDER BY "紀錄時間") - 1 AS sid FROM (SELECT DISTINCT "紀錄時間" FROM {TABLE})
+        ),
+        flagged AS (
+            SELECT s."成員"{''.join(f', s.{_q(col)}' for col in values)}, t.sid,
+                   CASE WHEN LAG(t.sid) OVER w = t.sid - 1{unchanged} THEN 0 ELSE 1 END AS is_new
+            FROM {TABLE} s JOIN times t ON s."紀錄時間" = t."紀錄時間"
+            WINDOW w AS (PARTITION BY s."成員" ORDER BY t.sid)
+        ),
+        numbered AS (
+            SELECT *, SUM(is_new) OVER (PARTITION BY "成員" ORDER BY sid ROWS UNBOUNDED PRECEDING) AS run FROM flagged
+        )
+        SELECT "成員"{selected}, MIN(sid) AS _first, MAX(sid) AS _last FROM numbered GROUP BY "成員", run"""
+        return self._read(sql)
+
+    def _velocity_sql(self, group_col: Optional[str], member_name: Optional[str] = None) -> Tuple[str, Tuple]:
+        if group_col == '成員':
+            where, params = ('WHERE s."成員" = ?', (member_name,)) if member_name is not None else ('', ())
+            sql = f"""WITH ranked AS (SELECT s.*, {MEMBER_DAILY_RANK} FROM {TABLE} s {where}),
+            agg AS (SELECT * FROM ranked WHERE _rn = 1)
+            SELECT *, {GROWTH_COLS} FROM agg
+            WINDOW w AS (PARTITION BY "成員" ORDER BY "紀錄時間") ORDER BY "成員", "紀錄時間" """
+            return sql, params
+        if group_col:
+            sql = f"""WITH {DAILY_CTE},
+            agg AS (SELECT s."紀錄時間", s.{_q(group_col)}, SUM(s."戰功總量") AS "戰功總量", SUM(s."勢力值") AS "勢力值"
+                    FROM {TABLE} s JOIN daily d ON s."紀錄時間" = d.t GROUP BY s."紀錄時間", s.{_q(group_col)})
+            SELECT *, {GROWTH_COLS} FROM agg
+            WINDOW w AS (PARTITION BY {_q(group_col)} ORDER BY "紀錄時間") ORDER BY {_q(group_col)}, "紀錄時間" """
+            return sql, ()
+        sql = f"""WITH {DAILY_CTE},
+        agg AS (SELECT s."紀錄時間", SUM(s."戰功總量") AS "戰功總量", SUM(s."勢力值") AS "勢力值"
+                FROM {TABLE} s JOIN daily d ON s."紀錄時間" = d.t GROUP BY s."紀錄時間")
+        SELECT *, {GROWTH_COLS} FROM agg WINDOW w AS (ORDER BY "紀錄時間") ORDER BY "紀錄時間" """
+        return sql, ()
+
+    def daily_velocity(self, group_col: Optional[str] = None, member_name: Optional[str] = None) -> pd.DataFrame:
+        """每日最後快照的日均成長，彙總與差分都在 SQLite 內以視窗函數完成。"""
+        df = self._read(*self._velocity_sql(group_col, member_name))
+        if df.empty:
+            return df
+        df['daily_merit_growth'] = (df['merit_diff'] / df['time_diff']).fillna(0)
+        df['daily_power_growth'] = (df['power_diff'] / df['time_diff']).fillna(0)
+        return df
+
+    def member_growth_extremes(self) -> Tuple[float, float, float]:
+        """所有成員日均成長的 (戰功最大, 勢力最大, 勢力最小)，不必取回逐列資料。"""
+        sql, params = self._velocity_sql('成員')
+        sql = f"""SELECT MAX(COALESCE(merit_diff / time_diff, 0)), MAX(COALESCE(power_diff / time_diff, 0)),
+                  MIN(COALESCE(power_diff / time_diff, 0)) FROM ({sql})"""
+        with self._lock:
+            if not self._columns():
+                return 0.0, 0.0, 0.0
+            row = self._conn.execute(sql, params).fetchone()
+        return tuple(float(v or 0) for v in row)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,6 +1,10 @@
+import html
+import numpy as np
 import pandas as pd
 import streamlit as st
-from typing import Any
+from typing import Any, Optional, Sequence, Tuple
+
+import utils_perf as perf
 
 # --- Constants & Configuration ---
 COLORS = {
@@ -18,6 +22,10 @@ COLORS = {
     'border': '#333333'
 }
 
+# 門檻由高到低 (門檻, 顏色)，未達任何門檻時使用 text 色
+EFF_TIERS = ((10, COLORS['success']), (5, COLORS['info']))
+POWER_TIERS = ((30000, COLORS['success']), (15000, COLORS['info']))
+
 # --- CSS Definitions ---
 MAIN_CSS = f"""
 <style>
@@ -93,12 +101,15 @@ def format_k(num: Any) -> str:
     if num >= 1_000: return f"{num/1_000:.1f}K"
     return f"{int(num)}"
 
-def get_eff_style(val: float) -> str:
+def _tier_style(val: float, tiers: Sequence[Tuple[float, str]]) -> str:
     if pd.isna(val): return f"color: {COLORS['text']}"
-    if val >= 10: return f"color: {COLORS['success']}"
-    if val >= 5: return f"color: {COLORS['info']}"
+    for threshold, color in tiers:
+        if val >= threshold: return f"color: {color}"
     return f"color: {COLORS['text']}"
 
+def get_eff_style(val: float) -> str:
+    return _tier_style(val, EFF_TIERS)
+
 def get_eff_class(val: float) -> str:
     if pd.isna(val): return "tier-b"
     if val >= 10: return "tier-s"
@@ -106,36 +117,174 @@ def get_eff_class(val: float) -> str:
     return "tier-b"
 
 def get_merit_style(val: float, threshold: float) -> str:
-    if pd.isna(val): return f"color: {COLORS['text']}"
-    if val >= threshold: return f"color: {COLORS['success']}"
-    return f"color: {COLORS['text']}"
+    return _tier_style(val, ((threshold, COLORS['success']),))
 
 def get_power_style(val: float) -> str:
-    if pd.isna(val): return f"color: {COLORS['text']}"
-    if val >= 30000: return f"color: {COLORS['success']}"
-    if val >= 15000: return f"color: {COLORS['info']}"
-    return f"color: {COLORS['text']}"
+    return _tier_style(val, POWER_TIERS)
 
-def style_df_full(df: pd.DataFrame, merit_threshold: float) -> Any:
-    fmt = {}
-    if '戰功總量' in df.columns: fmt['戰功總量'] = format_k
-    if '勢力值' in df.columns: fmt['勢力值'] = format_k
-    if '戰功效率' in df.columns: fmt['戰功效率'] = "{:.2f}"
-    
+# --- Column-wise Styling ---
+# 分級顏色整欄一次算出，Styler 不再對每一格呼叫判斷函式。
+def _as_float(values: Any) -> np.ndarray:
+    values = pd.Series(values) if not isinstance(values, pd.Series) else values
+    if not pd.api.types.is_numeric_dtype(values.dtype):
+        values = pd.to_numeric(values, errors='coerce')
+    return values.to_numpy(dtype=float, na_value=np.nan)
+
+def format_k_array(values: Any) -> np.ndarray:
+    """format_k 的整欄版本，結果與逐格呼叫 format_k 相同。"""
+    v = _as_float(values)
+    out = np.full(len(v), "0", dtype=object)
+    big = v >= 1_000_000
+    mid = (v >= 1_000) & ~big
+    small = ~(big | mid | np.isnan(v))
+    out[big] = np.char.add(np.char.mod("%.1f", v[big] / 1_000_000), "M")
+    out[mid] = np.char.add(np.char.mod("%.1f", v[mid] / 1_000), "K")
+    out[small] = np.trunc(v[small]).astype(np.int64).astype(str)
+    return out
+
+def tier_style_array(values: Any, tiers: Sequence[Tuple[float, str]]) -> np.ndarray:
+    """_tier_style 的整欄版本 (NaN 與未達門檻皆為 text 色)。"""
+    v = _as_float(values)
+    return np.select([v >= threshold for threshold, _ in tiers],
+                     [f"color: {color}" for _, color in tiers],
+                     default=f"color: {COLORS['text']}").astype(object)
+
+# 分級顏色在無法逐格上色的大表格中改以標記呈現
+TIER_MARKS = {COLORS['success']: '🟢', COLORS['info']: '🔵'}
+
+def tier_mark_array(values: Any, tiers: Sequence[Tuple[float, str]]) -> np.ndarray:
+    """tier_style_array 的標記版本：達到門檻的格子為該顏色的圓點，其餘為空字串。"""
+    v = _as_float(values)
+    return np.select([v >= threshold for threshold, _ in tiers],
+                     [TIER_MARKS.get(color, '') for _, color in tiers], default='').astype(object)
+
+class _DisplayLookup(dict):
+    """值 → 整欄預先算好的顯示字串，Styler 逐格只做一次字典查找；查不到的值 (NaN) 顯示 na_rep。"""
+
+    def __init__(self, values: Any, format_array, na_rep: str = "0"):
+        uniques = pd.unique(pd.Series(values).dropna().to_numpy())
+        super().__init__(zip(uniques, format_array(uniques)))
+        self.na_rep = na_rep
+
+    def __missing__(self, key) -> str:
+        return self.na_rep
+
+def format_2f_array(values: Any) -> np.ndarray:
+    v = _as_float(values)
+    return np.char.mod("%.2f", v).astype(object)
+
+# 各欄的整欄格式化函式
+COLUMN_FORMATS = {'戰功總量': format_k_array, '勢力值': format_k_array, '戰功效率': format_2f_array}
+
+def _tier_columns(df: pd.DataFrame, merit_threshold: Optional[float]) -> dict:
+    """{欄位: 分級門檻}；merit_threshold 為 None 時戰功不分級。"""
+    tiers = {'勢力值': POWER_TIERS, '戰功效率': EFF_TIERS}
+    if merit_threshold is not None:
+        tiers = {'戰功總量': ((merit_threshold, COLORS['success']),), **tiers}
+    return {col: t for col, t in tiers.items() if col in df.columns}
+
+def _tier_styles(df: pd.DataFrame, tiers: dict) -> pd.DataFrame:
+    return pd.DataFrame({col: tier_style_array(df[col], tiers[col]) for col in df.columns}, index=df.index)
+
+# 表格中缺少的數值 (例如已離開成員的現勢力) 顯示為破折號，不與 0 混淆
+TABLE_NA_REP = "—"
+
+@perf.timed()
+def style_df_full(df: pd.DataFrame, merit_threshold: Optional[float] = None) -> Any:
+    """顯示字串與 CSS 都整欄預先算好再交給 Styler；merit_threshold 為 None 時戰功不上色。"""
+    tiers = _tier_columns(df, merit_threshold)
+    fmt = {col: _DisplayLookup(df[col], fn, TABLE_NA_REP).__getitem__ for col, fn in COLUMN_FORMATS.items() if col in df.columns}
     s = df.style.format(fmt)
-    
-    if '戰功總量' in df.columns:
-        s = s.map(lambda x: get_merit_style(x, merit_threshold), subset=pd.IndexSlice[:, ['戰功總量']])
-    if '勢力值' in df.columns:
-        s = s.map(get_power_style, subset=pd.IndexSlice[:, ['勢力值']])
-    if '戰功效率' in df.columns:
-        s = s.map(get_eff_style, subset=pd.IndexSlice[:, ['戰功效率']])
+    if tiers:
+        # 所有分級欄位一次 apply，顏色陣列整欄計算
+        s = s.apply(_tier_styles, axis=None, subset=list(tiers), tiers=tiers)
     return s
 
+# Styler 的固定成本是 pandas 與 st.dataframe 逐格產生所有欄位的顯示值與 CSS (_compute/_translate)，
+# 與格數成正比，超過 styler.render.max_elements 格時 st.dataframe 甚至會直接報錯。
+# 超過此列數的表格改送原始數值，由前端依 column_config 格式化，分級顏色改以緊鄰的標記欄呈現。
+STYLER_MAX_ROWS = 500
+TIER_MARK_SUFFIX = '分級'
+
+@perf.timed()
+def table_view(df: pd.DataFrame, merit_threshold: Optional[float] = None) -> dict:
+    """st.dataframe 的 data 與 column_config：小表格為分級上色的 Styler，大表格為原始資料表加分級標記欄。
+
+    標記欄只新增欄位、不改列順序，選取事件的列位置仍對應 df。缺少的數值兩種路徑都不顯示為 0
+    (Styler 顯示 TABLE_NA_REP，column_config 留白)。
+    """
+    if len(df) <= STYLER_MAX_ROWS:
+        return {'data': style_df_full(df, merit_threshold)}
+    tiers = _tier_columns(df, merit_threshold)
+    columns, config = {}, {}
+    for col in df.columns:
+        columns[col] = df[col]
+        if col in ('戰功總量', '勢力值'):
+            config[col] = st.column_config.NumberColumn(format='compact')
+        elif col == '戰功效率':
+            config[col] = st.column_config.NumberColumn(format='%.2f')
+        if col in tiers:
+            mark = col + TIER_MARK_SUFFIX
+            columns[mark] = tier_mark_array(df[col], tiers[col])
+            config[mark] = st.column_config.TextColumn(' ', width=28, help=f"{col}{TIER_MARK_SUFFIX}")
+    return {'data': pd.DataFrame(columns, index=df.index), 'column_config': config}
+
+# --- HTML Tables ---
+GROUP_TABLE_HEADERS = ['分組', '人數', '總戰功', '平均戰功', '總勢力', '平均勢力']
+
+def render_html_table(df: pd.DataFrame, css_class: str = 'clean-table', headers: Optional[Sequence[str]] = None,
+                      formats: Optional[dict] = None, td_classes: Optional[dict] = None,
+                      cell_styles: Optional[dict] = None, font_size: Optional[int] = None) -> str:
+    """把資料表轉成 HTML 表格，各欄整批格式化後才逐列拼接。
+
+    formats: {欄位: 整欄格式化函式 (如 format_k_array)}，其餘欄位以 str 輸出並跳脫
+    td_classes: {欄位: class}；cell_styles: {欄位: 逐列的 CSS 字串}
+    headers 為 None 時不輸出表頭。
+    """
+    formats = formats or {}
+    td_classes = td_classes or {}
+    cell_styles = cell_styles or {}
+
+    cells = []
+    for col in df.columns:
+        if col in formats:
+            values = np.asarray(formats[col](df[col]), dtype=object)
+        else:
+            values = df[col].astype(str).map(html.escape).to_numpy(dtype=object)
+        cls = f' class="{td_classes[col]}"' if col in td_classes else ''
+        if col in cell_styles:
+            opens = np.array([f'<td{cls} style="{style}">' for style in cell_styles[col]], dtype=object)
+        else:
+            opens = f'<td{cls}>'
+        cells.append(opens + values + '</td>')
+    body = ''.join('<tr>' + ''.join(row) + '</tr>' for row in zip(*cells))
+
+    style = f"<style>.{css_class} td, .{css_class} th {{ font-size: {font_size}px; }}</style>" if font_size else ''
+    head = '<thead><tr>' + ''.join(f'<th>{h}</th>' for h in headers) + '</tr></thead>' if headers else ''
+    return f"{style}<table class='{css_class}'>{head}<tbody>{body}</tbody></table>"
+
+@perf.timed()
+@st.cache_data(max_entries=32)
+def get_group_table_html(_cube, data_version: str, groups: Tuple[str, ...], font_size: int) -> str:
+    """集團軍情報表；由 GroupRegionCube 合併所選分組的格子，依 (資料版本, 分組, 字體) 快取。"""
+    _by_group = _cube.by('分組', groups=groups)
+    group_stats = pd.DataFrame({
+        '分組': _by_group['分組'],
+        'n': _by_group['count'],
+        'wm': _by_group['merit_sum'].astype('int64'),
+        'awm': _by_group['merit_mean'],
+        'p': _by_group['power_sum'].astype('int64'),
+        'ap': _by_group['power_mean'],
+    }).sort_values('wm', ascending=False)
+    k = format_k_array
+    return render_html_table(group_stats, headers=GROUP_TABLE_HEADERS, font_size=font_size,
+                             formats={'wm': k, 'awm': k, 'p': k, 'ap': k})
+
 def generate_ace_table_html(curr: pd.Series, s_merit: str, s_power: str, s_eff: str) -> str:
-    return f"""<table class="ace-table">
-            <tr><td class="ace-label-col">⚔️ 戰功</td><td class="ace-value-col" style="{s_merit}">{format_k(curr['戰功總量'])}</td></tr>
-            <tr><td class="ace-label-col">🏰 勢力</td><td class="ace-value-col" style="{s_power}">{format_k(curr['勢力值'])}</td></tr>
-            <tr><td class="ace-label-col">⚡ 效率</td><td class="ace-value-col" style="{s_eff}">{curr['戰功效率']}</td></tr>
-            <tr><td class="ace-label-col">🏅 排名</td><td class="ace-value-col" style="color: {COLORS['text']};">#{curr['貢獻排行']}</td></tr>
-        </table>"""
\ No newline at end of file
+    rows = pd.DataFrame({
+        'label': ['⚔️ 戰功', '🏰 勢力', '⚡ 效率', '🏅 排名'],
+        'value': [format_k(curr['戰功總量']), format_k(curr['勢力值']), str(curr['戰功效率']), f"#{curr['貢獻排行']}"],
+    })
+    return render_html_table(rows, css_class='ace-table',
+                             td_classes={'label': 'ace-label-col', 'value': 'ace-value-col'},
+                             cell_styles={'value': [s_merit, s_power, s_eff, f"color: {COLORS['text']};"]})
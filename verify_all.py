@@ -1,5 +1,6 @@
 import sys
 import os
+import pandas as pd
 
 # Add current directory to sys.path
 sys.path.append(os.getcwd())
@@ -43,12 +44,454 @@ try:
 except Exception as e:
     print(f"[FAIL] load_data_from_folder failed: {e}")
 
+print("\n--- Verifying Encoding Detection ---")
+try:
+    import tempfile
+    import utils_core as core
+    from gen_synthetic_data import ENCODINGS, GROUPS, REGIONS, generate
+    # 模擬資料依序輪替 utf-8-sig / Big5 / GBK，並混入簡體與英文標題；大檔會截在多位元組字元中間
+    detected = {}
+    for n_members in (40, 1500):
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, path in enumerate(generate(tmp, n_members, 2 * len(ENCODINGS))):
+                expected = ENCODINGS[i % len(ENCODINGS)]
+                got = core.detect_encoding(path)
+                assert got == expected, (os.path.basename(path), os.path.getsize(path), got, expected)
+                snap = core.load_snapshot(path, ud.DASHBOARD_COLUMNS)
+                # 解錯編碼時分組與地區名稱會變成亂碼
+                assert set(snap['分組'].astype(str).str.strip()) <= set(GROUPS) and set(snap['所屬勢力'].astype(str).str.strip()) <= set(REGIONS), path
+                detected[expected] = detected.get(expected, 0) + 1
+    print(f"   {detected}")
+    print("[OK] encoding sniffing picks utf-8-sig / Big5 / GBK")
+except Exception as e:
+    print(f"[FAIL] Encoding detection check failed: {e!r}")
+
+print("\n--- Verifying Memory Footprint ---")
+try:
+    if not df.empty:
+        report = ud.memory_report(df)
+        print(report.to_string(index=False))
+        print(f"[OK] memory_report executed. Reduction: {report['倍數'].iloc[-1]}x")
+except Exception as e:
+    print(f"[FAIL] memory_report failed: {e}")
+
+print("\n--- Verifying Shared Dataset ---")
+try:
+    ds = ud.get_dataset()
+    assert ud.get_dataset() is ds, "sessions should share one Dataset"
+    assert ds.filtered(ds.groups) is ds.latest, "selecting every group should not copy"
+    if len(ds.groups) > 1:
+        subset = ds.groups[:1]
+        assert ds.filtered(subset) is ds.filtered(list(subset)), "identical filters should be shared"
+    shared = ds.memory_report()['bytes'].sum()
+    per_session = ud.session_memory_bytes({'q_rank': 300, 'q_merit_val': 0, 'frontline_regions': [], 'font_size': 18})
+    print(f"   shared {shared / 1e6:.2f} MB | per extra session ~{per_session / 1e3:.2f} KB")
+    print("[OK] Dataset is shared across sessions")
+except Exception as e:
+    print(f"[FAIL] Shared dataset check failed: {e}")
+
+print("\n--- Verifying Headless Core ---")
+try:
+    import subprocess
+    probe = (
+        "import sys, time; t0 = time.perf_counter(); import utils_core as core; "
+        "elapsed = time.perf_counter() - t0; assert 'streamlit' not in sys.modules, 'utils_core imported streamlit'; "
+        "df, version = core.load_dataset(); core.get_velocity_tables(df, version); "
+        "assert core.get_velocity_tables(df, version) is core.get_velocity_tables(df, version); "
+        "print(f'{elapsed * 1000:.0f} ms|{len(df)}|{len(core.drain_diagnostics())}')"
+    )
+    out = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True).stdout.strip()
+    elapsed, rows, n_diag = out.splitlines()[-1].split('|')
+    print(f"   import {elapsed} (incl. pandas) | {rows} rows | {n_diag} diagnostics")
+    print("[OK] utils_core runs without streamlit")
+except Exception as e:
+    print(f"[FAIL] Headless core check failed: {e}")
+
+print("\n--- Verifying Velocity Tables ---")
+try:
+    member = ds.velocity.member
+    # 成員表取每位成員每天自己的最後一筆 (與舊版個人檔案相同)，不是全盟每日最後快照
+    # delta/sqlite 模式的 ds.raw 不是完整歷史，改由 store 取所有快照
+    full = ud.get_store().history(['成員', '紀錄時間'])
+    full_days = full.assign(_day=full['紀錄時間'].dt.normalize(), 成員=full['成員'].astype(str))
+    expected = full_days.sort_values(['成員', '紀錄時間'], kind='stable').groupby(['成員', '_day']).tail(1)
+    assert len(member) == len(expected), (len(member), len(expected))
+    mine = member.assign(成員=member['成員'].astype(str)).sort_values(['成員', '紀錄時間'], kind='stable')
+    assert (mine['紀錄時間'].to_numpy() == expected['紀錄時間'].to_numpy()).all()
+    alliance_days = full.groupby(full['紀錄時間'].dt.date)['紀錄時間'].max()
+    assert ds.velocity.alliance['紀錄時間'].tolist() == alliance_days.tolist()
+    print(f"   {len(member)} member-days | {len(ds.velocity.alliance)} alliance days")
+    print("[OK] member table keeps each member's own last row per day")
+except Exception as e:
+    print(f"[FAIL] Velocity table check failed: {e}")
+
+print("\n--- Verifying Chart Downsampling ---")
+try:
+    import numpy as np
+    rng = np.random.default_rng(0)
+    for n in (1, 2, 5, 50, 401, 1000, 12_345):
+        x = np.sort(rng.uniform(0, 1e6, n))
+        y = np.cumsum(rng.normal(size=n))
+        if n > 2:
+            y[n // 3] += 1e6  # 單一尖峰應被保留
+        for n_out in (1, 3, 4, 10, 400, n - 1, n, n + 5):
+            idx = uc.lttb_indices(x, y, n_out)
+            assert len(idx) == n or len(idx) <= n_out, (n, n_out, len(idx))
+            assert idx[0] == 0 and idx[-1] == n - 1 and (np.diff(idx) > 0).all(), (n, n_out)
+            if n > 2 and n_out >= 3:
+                assert n // 3 in idx, (n, n_out)
+    # 兩條序列取聯集，點數不超過兩倍預算且保留首尾時間
+    times = pd.date_range('2025-01-01', periods=5000, freq='h')
+    data = pd.DataFrame({'紀錄時間': times, 'daily_power_growth': rng.normal(size=5000), 'daily_merit_growth': rng.normal(size=5000)})
+    small = uc.downsample(data, uc.MAX_CHART_POINTS)
+    assert len(small) <= 2 * uc.MAX_CHART_POINTS and small['紀錄時間'].iloc[0] == times[0] and small['紀錄時間'].iloc[-1] == times[-1]
+    assert small['紀錄時間'].is_monotonic_increasing
+    print(f"   5000 points -> {len(small)} (budget {uc.MAX_CHART_POINTS} per series)")
+    print("[OK] LTTB keeps endpoints, stays within budget, returns increasing indices")
+except Exception as e:
+    print(f"[FAIL] Chart downsampling check failed: {e!r}")
+
+print("\n--- Verifying Member Search ---")
+try:
+    from utils_search import MemberSearch
+    search = MemberSearch(['速農丨燒餅', '燒餅王', '小燒餅', '七劍l萬', '括號(測試)'], ['速農', '速農', '梟', '七劍', '梟'])
+    assert search.search('燒餅') == ['燒餅王', '速農丨燒餅', '小燒餅'], search.search('燒餅')
+    assert search.search('烧饼', groups=['速農']) == ['燒餅王', '速農丨燒餅']
+    assert search.search('(測') == ['括號(測試)'] and search.search('[') == []
+    names = ds.latest['成員'].astype(str)
+    keyword = names.iloc[0][-2:]
+    expected = set(names[names.str.contains(keyword, regex=False)])
+    assert set(ds.member_search.search(keyword)) >= expected, keyword
+    print("[OK] member search ranks prefix, segment and literal matches")
+except Exception as e:
+    print(f"[FAIL] Member search check failed: {e}")
+
+print("\n--- Verifying Radar Index ---")
+try:
+    import itertools
+    from utils_radar import MEMO_SIZE
+    radar = ud.RadarIndex(ds.latest, presets=ud.RADAR_CONFIG)
+    filters = [ud.RadarFilter.from_config(config) for config in ud.RADAR_CONFIG.values()]
+    for merit_val, power_val in itertools.product([0, 1e5, 5e5, 1e6, 5e6], [0, 5e4, 1e5, 2e5]):
+        for ops in itertools.product(['大於 >=', '小於 <='], repeat=3):
+            filters.append(ud.RadarFilter(ops[0], merit_val, ops[1], power_val, ops[2], 50.0))
+    for radar_filter in filters:
+        for rank_cap, groups in [(None, None), (100, None), (300, ds.groups[:2])]:
+            # 舊版介面的逐欄布林遮罩
+            expected = ds.latest
+            for col, op, val in (('戰功總量', radar_filter.merit_op, radar_filter.merit_val),
+                                 ('勢力值', radar_filter.power_op, radar_filter.power_val),
+                                 ('戰功效率', radar_filter.eff_op, radar_filter.eff_val)):
+                expected = expected[expected[col] >= val] if '大於' in op else expected[expected[col] <= val]
+            if rank_cap is not None:
+                expected = expected[expected['貢獻排行'] <= rank_cap]
+            if groups is not None:
+                expected = expected[expected['分組'].isin(groups)]
+            expected = expected.sort_values('貢獻排行', kind='stable')
+            assert radar.members(radar_filter, rank_cap, groups) == list(expected['成員']), (radar_filter, rank_cap, groups)
+    # 大量臨時條件之後，內建預設仍常駐
+    assert len(filters) > 2 * MEMO_SIZE and all(f in radar._pinned for f in filters[:len(ud.RADAR_CONFIG)])
+    print(f"   {len(filters)} filters x 3 rank/group slices")
+    print("[OK] radar index matches the boolean-mask filters and keeps presets")
+except Exception as e:
+    print(f"[FAIL] Radar index check failed: {e!r}")
+
+print("\n--- Verifying Group/Region Cube ---")
+try:
+    cube = ds.cube
+    for groups in [ds.groups, ds.groups[:1], ds.groups[1:3]]:
+        sub = ds.filtered(groups)
+        totals = cube.totals(groups=ds.group_filter(groups))
+        assert totals['count'] == len(sub) and totals['merit_sum'] == sub['戰功總量'].sum(), groups
+        by_region = cube.by('所屬勢力', groups=ds.group_filter(groups)).set_index('所屬勢力')['count']
+        counts = sub['所屬勢力'].value_counts()
+        assert by_region.to_dict() == counts[counts > 0].to_dict(), groups
+    by_group = cube.by('分組')
+    expected = ds.latest.groupby('分組', observed=True)['戰功總量'].sum()
+    assert by_group.set_index('分組')['merit_sum'].to_dict() == expected.astype(float).to_dict()
+    print(f"   {len(cube)} cells for {len(ds.raw)} rows")
+    print("[OK] cube slices match groupby / value_counts")
+except Exception as e:
+    print(f"[FAIL] Cube check failed: {e}")
+
+print("\n--- Verifying Quantile Sketches ---")
+try:
+    import shutil, tempfile
+    from utils_sketch import ALPHA, SKETCH_MEASURES, SketchIndex
+    worst = 0.0
+    # delta/sqlite 模式的 ds.raw 不是完整歷史，改由 store 取所有快照
+    sketch_history = ud.get_store().history(['紀錄時間', '分組', *SKETCH_MEASURES])
+    for when, snap in sketch_history.groupby('紀錄時間'):
+        for groups in [None] + [(g,) for g in snap['分組'].unique()]:
+            sub = snap if groups is None else snap[snap['分組'].isin(groups)]
+            for col in SKETCH_MEASURES:
+                for q in (0.5, 0.95):
+                    exact = sub[col].astype(float).quantile(q)
+                    estimate = ds.sketches.quantile(q, col, when=when, groups=groups)
+                    worst = max(worst, abs(estimate - exact) / exact if exact else abs(estimate))
+    assert worst <= ALPHA + 1e-9, f"relative error {worst:.4f} > {ALPHA}"
+
+    # 逐檔匯入的摘要應與一次由完整歷史建立的相同
+    files = sorted(f for f in os.listdir(ud.DATA_FOLDER) if f.endswith('.csv'))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS)
+        try:
+            for name in files:
+                shutil.copy(os.path.join(ud.DATA_FOLDER, name), tmp)
+                store.sync(force=True)
+            incremental, rebuilt = store.sketch_index(), SketchIndex.from_frame(store.history(list(store.df.columns)))
+            assert len(incremental) == len(rebuilt)
+            assert all(incremental.quantile(0.95, col) == rebuilt.quantile(0.95, col) for col in SKETCH_MEASURES)
+            # 只保留用得到的量值的摘要
+            assert all(set(snap) == set(SKETCH_MEASURES) for snap in incremental._snapshots)
+        finally:
+            store.reset()
+    print(f"   worst relative error {worst:.4f} (bound {ALPHA}) over {len(ds.sketches)} snapshots")
+    print("[OK] merged sketches stay within the error bound")
+except Exception as e:
+    print(f"[FAIL] Quantile sketch check failed: {e!r}")
+
+print("\n--- Verifying Snapshot Diff ---")
+try:
+    t1, t2 = ds.snapshot_times[0], ds.snapshot_times[-1]
+    diff = ds.diff(t1, t2)
+    assert ds.diff(pd.Timestamp(t1) + pd.Timedelta(seconds=1), pd.Timestamp('2100-01-01')) is diff, "as-of times should share the cached diff"
+    # delta/sqlite 模式的 ds.raw 不含所有快照，改由 store 取出兩端的快照
+    before, after = (ud.get_store().snapshot_at(when) for when in (t1, t2))
+    merged = before.merge(after, on='成員', how='outer', suffixes=('_前', '_後'))
+    merged.index = merged['成員'].astype(str)
+    expected = (merged['戰功總量_後'].astype(float) - merged['戰功總量_前'].astype(float)).sort_index()
+    assert diff.set_index('成員')['戰功增加'].sort_index().equals(expected.rename('戰功增加')), "merit deltas differ from merge"
+    moved = (merged['所屬勢力_前'].astype(object) != merged['所屬勢力_後'].astype(object)) & merged['所屬勢力_前'].notna() & merged['所屬勢力_後'].notna()
+    assert int(diff['換區'].sum()) == int(moved.sum())
+    counts = diff['狀態'].value_counts().to_dict()
+    # 對比表的每一列都可點開個人檔案，任兩個快照間出現的成員都必須有歷史
+    selectable = set()
+    for i, before_time in enumerate(ds.snapshot_times):
+        for after_time in ds.snapshot_times[i + 1:]:
+            selectable.update(ds.diff(before_time, after_time)['成員'].astype(str))
+    no_history = [name for name in selectable if ds.member_index.history(name).empty]
+    assert not no_history, f"diff members without history: {no_history[:5]}"
+    print(f"   {pd.Timestamp(t1):%m/%d %H:%M} -> {pd.Timestamp(t2):%m/%d %H:%M}: {counts} | 換區 {int(diff['換區'].sum())}")
+    print("[OK] snapshot diff matches an outer merge")
+except Exception as e:
+    print(f"[FAIL] Snapshot diff check failed: {e}")
+
+print("\n--- Verifying Region Stays ---")
+try:
+    from utils_delta import DeltaStore
+    from utils_migration import HISTORY_COLS, RUN_COLS, RegionStays
+    # delta/sqlite 模式的 ds.raw 不是完整歷史，改由 store 取所有快照
+    history = ud.get_store().history(HISTORY_COLS)
+    stays = ds.region_stays
+    frontline = list(stays.regions[:2])
+    headcount = stays.headcount(frontline).set_index('紀錄時間')
+    expected = history.groupby('紀錄時間')['所屬勢力'].agg(lambda s: int(s.isin(frontline).sum()))
+    assert (headcount['前線'] == expected).all(), "headcount differs from per-snapshot counts"
+    times = ds.snapshot_times
+    for prev, curr, nxt in zip(times[:-1], times[1:], list(times[2:]) + [None]):
+        diff = ds.diff(prev, curr)
+        moves = stays.recent_moves(since=curr)
+        n_moves = len(moves) - (len(stays.recent_moves(since=nxt)) if nxt is not None else 0)
+        assert n_moves == int(diff['換區'].sum() + (diff['狀態'] != '留任').sum()), pd.Timestamp(curr)
+    # delta 變動集與逐列歷史建立的結果應與 store 的區段相同
+    delta = DeltaStore.from_frame(history)
+    for other in (RegionStays(history), RegionStays.from_runs(delta.times, delta.runs(RUN_COLS))):
+        pd.testing.assert_frame_equal(other.stays, stays.stays)
+        pd.testing.assert_frame_equal(other.moves, stays.moves)
+        assert (other.headcount(frontline) == stays.headcount(frontline)).all().all()
+    print(f"   {len(stays)} stays | {len(stays.moves)} moves over {len(times)} snapshots")
+    print("[OK] region stays agree with snapshot counts and diffs")
+except Exception as e:
+    print(f"[FAIL] Region stays check failed: {e}")
+
+def same_rows(a, b, keys=('成員', '紀錄時間')):
+    """兩份資料表的內容相同 (忽略列順序與類別字典)。"""
+    def normalize(df):
+        df = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        return df[sorted(df.columns)].sort_values(list(keys), kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(normalize(a), normalize(b), check_dtype=False)
+    return True
+
+print("\n--- Verifying Delta Storage ---")
+try:
+    import shutil, tempfile
+    from utils_delta import DeltaStore
+    files = sorted(f for f in os.listdir(ud.DATA_FOLDER) if f.endswith('.csv'))
+    with tempfile.TemporaryDirectory() as tmp:
+        full_store = ud.SnapshotStore(ud.DATA_FOLDER, columns=ud.DASHBOARD_COLUMNS, storage_mode='full')
+        full = full_store.sync(force=True)
+        times = full_store.snapshot_times()
+        delta = DeltaStore.from_frame(full)
+        assert same_rows(delta.to_frame(), full)
+        for sid, when in enumerate(times):
+            assert same_rows(delta.snapshot(sid), full[full['紀錄時間'] == when]), pd.Timestamp(when)
+        for name in full['成員'].unique():
+            assert same_rows(delta.member_history(name), full[full['成員'] == name]), name
+
+        # 逐一併入新快照的結果應與一次建立的相同
+        appended = DeltaStore.from_frame(full[full['紀錄時間'] == times[0]])
+        for when in times[1:]:
+            appended = appended.append(full[full['紀錄時間'] == when])
+        assert same_rows(appended.to_frame(), full) and len(appended.changes) == len(delta.changes)
+
+        # delta 模式的 SnapshotStore：逐檔 sync 只追加變動集區塊，不寫單檔快取
+        import utils_core as core
+        cols = list(full.columns)
+        store = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode='delta')
+        try:
+            for name in files[:-1]:
+                shutil.copy(os.path.join(ud.DATA_FOLDER, name), tmp)
+                store.sync(force=True)
+            assert len(DeltaStore.chunk_paths(store._delta_path())) == len(files) - 1
+            file_keys = [core._snapshot_cache_key(name, os.stat(os.path.join(tmp, name))) for name in files[:-1]]
+            assert not any(os.path.exists(os.path.join(core.CACHE_FOLDER, f"{key}.parquet")) for key in file_keys)
+
+            # 停機期間新增的檔案：冷啟動沿用磁碟上的變動集，只再追加一個區塊
+            shutil.copy(os.path.join(ud.DATA_FOLDER, files[-1]), tmp)
+            restored = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode='delta')
+            restored.sync()
+            assert len(DeltaStore.chunk_paths(restored._delta_path())) == len(files)
+            assert same_rows(restored.history(cols), full)
+            assert same_rows(restored.df, full[full['紀錄時間'].isin(times[delta.daily_snapshot_ids()])])
+            assert same_rows(restored.snapshot_at(times[-1]), full[full['紀錄時間'] == times[-1]])
+
+            # 刪除檔案與較早的快照晚到：由現有變動集重建，不重新解析其他檔案
+            first_time = restored._meta[files[0]]['紀錄時間']
+            os.remove(os.path.join(tmp, files[0]))
+            restored.sync(force=True)
+            assert same_rows(restored.history(cols), full[full['紀錄時間'] != first_time])
+            shutil.copy(os.path.join(ud.DATA_FOLDER, files[0]), tmp)
+            restored.sync(force=True)
+            assert same_rows(restored.history(cols), full)
+            cold = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode='delta')
+            cold.sync()
+            assert cold.version == restored.version and same_rows(cold.history(cols), full)
+        finally:
+            store.reset()
+    print(f"   {len(delta.changes)} change rows for {len(full)} rows ({len(full) / max(len(delta.changes), 1):.1f}x)")
+    print("[OK] delta storage reproduces full mode")
+except Exception as e:
+    print(f"[FAIL] Delta storage check failed: {e!r}")
+
+print("\n--- Verifying SQLite Backend ---")
+try:
+    import numpy as np
+    import utils_core as core
+    tables = core.build_velocity_tables(full)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in files:
+            shutil.copy(os.path.join(ud.DATA_FOLDER, name), tmp)
+        store = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode='sqlite')
+        try:
+            store.sync(force=True)
+            for key, expected in (('成員', tables.member), ('分組', tables.group), (None, tables.alliance)):
+                by = [key, '紀錄時間'] if key else ['紀錄時間']
+                got = store.sql.daily_velocity(key)
+                if key:
+                    expected = expected.assign(**{key: expected[key].astype(str)})
+                expected, got = (f.sort_values(by, kind='stable').reset_index(drop=True) for f in (expected, got))
+                assert len(got) == len(expected) and (got['紀錄時間'].to_numpy() == expected['紀錄時間'].to_numpy()).all(), key
+                for col in ('戰功總量', '勢力值', 'daily_merit_growth', 'daily_power_growth'):
+                    # julianday 的時間差有浮點誤差，成長率以相對誤差比較
+                    assert np.allclose(got[col].astype(float), expected[col].astype(float), rtol=1e-6), (key, col)
+            member = tables.member
+            exact = (member['daily_merit_growth'].max(), member['daily_power_growth'].max(), member['daily_power_growth'].min())
+            assert np.allclose(store.sql.member_growth_extremes(), exact, rtol=1e-6)
+            # SqlMemberIndex 與 MemberIndex 介面相同
+            sql_index, frame_index = core.SqlMemberIndex(store.sql), core.MemberIndex.build(tables.member, presorted=True)
+            assert len(sql_index) == len(frame_index) and sorted(sql_index.members()) == sorted(map(str, frame_index.members()))
+            assert all(name in sql_index for name in frame_index.members())
+        finally:
+            store.reset()
+    # 其他 store 的資料集 (bench、工作執行緒自建的 store) 以傳入的資料表計算，不走共用 store 的資料庫
+    index = core.get_member_index(full, full_store.version)
+    assert len(index) == len(frame_index) and len(core.get_velocity_tables(full, full_store.version).member) == len(tables.member)
+    assert np.allclose(core.get_individual_global_max(full, full_store.version), exact, rtol=1e-6)
+    assert not core.calculate_daily_velocity(full, full_store.version, '所屬勢力').empty
+    print(f"   member/group/alliance: {len(tables.member)}/{len(tables.group)}/{len(tables.alliance)} rows")
+    print("[OK] SQL daily velocity matches build_velocity_tables")
+except Exception as e:
+    print(f"[FAIL] SQLite backend check failed: {e!r}")
+
+print("\n--- Verifying Upload Ingest ---")
+try:
+    import io
+    # ingest_uploaded_files 即 SnapshotStore.ingest；在各儲存模式下，上傳後的結果應與重新 sync 相同
+    cols = list(full.columns)
+    half = len(files) // 2
+    for mode in ('full', 'delta', 'sqlite'):
+        with tempfile.TemporaryDirectory() as tmp, tempfile.TemporaryDirectory() as fresh_tmp:
+            for name in files[:half]:
+                shutil.copy(os.path.join(ud.DATA_FOLDER, name), tmp)
+            for name in files:
+                shutil.copy(os.path.join(ud.DATA_FOLDER, name), fresh_tmp)
+            store = ud.SnapshotStore(tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode=mode)
+            fresh = ud.SnapshotStore(fresh_tmp, columns=ud.DASHBOARD_COLUMNS, storage_mode=mode)
+            try:
+                store.sync(force=True)
+                uploads = []
+                # 連同一個已存在的檔案重新上傳，走取代舊快照的路徑
+                for name in files[half - 1:]:
+                    with open(os.path.join(ud.DATA_FOLDER, name), 'rb') as f:
+                        upload = io.BytesIO(f.read())
+                    upload.name = name
+                    uploads.append(upload)
+                version = store.version
+                assert store.ingest(uploads) == len(uploads) and store.version != version, mode
+                fresh.sync(force=True)
+                assert same_rows(store.history(cols), fresh.history(cols)) and same_rows(store.history(cols), full), mode
+                assert same_rows(store.df, fresh.df), mode
+                assert list(store.snapshot_times()) == list(fresh.snapshot_times()), mode
+            finally:
+                for s in (store, fresh):
+                    s.reset()
+    print(f"   {len(files) - half + 1} uploads onto {half} synced files in full/delta/sqlite")
+    print("[OK] ingest matches a fresh sync in every storage mode")
+except Exception as e:
+    print(f"[FAIL] Upload ingest check failed: {e!r}")
+
+print("\n--- Verifying Perf Instrumentation ---")
+try:
+    import utils_perf as perf
+    import utils_core as core
+    perf.begin('verify')
+    df_core, version_core = core.load_dataset()
+    core.get_velocity_tables(df_core, version_core)
+    core.get_velocity_tables(df_core, version_core)
+    run = perf.end()
+    names = [s.name for s in run.spans]
+    assert names[0] == 'load_dataset' and run.spans[0].rows == len(df_core), names
+    assert [s.cache for s in run.spans if s.name == 'get_velocity_tables'][-1] == 'hit'
+    assert not perf.active()
+    print(f"   {perf.summary(run)}")
+    print("[OK] perf spans recorded")
+except Exception as e:
+    print(f"[FAIL] Perf instrumentation check failed: {e}")
+
 print("\n--- Verifying utils_style Functionality ---")
 try:
     # Test color constants
     print(f"   Background Color: {us.COLORS['background']}")
     # Test formatting
     print(f"   Format 1000: {us.format_k(1000)}")
+    values = pd.Series([0, 999, 1000, 12_345, 1_500_000, float('nan')])
+    assert list(us.format_k_array(values)) == [us.format_k(v) for v in values]
+    # 大表格不經 Styler，改由 column_config 格式化
+    big = pd.DataFrame({'成員': ['x'] * (us.STYLER_MAX_ROWS + 1), '戰功總量': [1.0, 2e6] * (us.STYLER_MAX_ROWS // 2) + [np.nan],
+                        '勢力值': 20_000})
+    view = us.table_view(big, merit_threshold=1e6)
+    assert '戰功總量' in view['column_config'] and view['data'].index.equals(big.index)
+    # 分級顏色以緊鄰的標記欄保留，列順序不變
+    assert list(view['data'].columns) == ['成員', '戰功總量', '戰功總量分級', '勢力值', '勢力值分級']
+    assert list(view['data']['戰功總量分級'][:3]) == ['', '🟢', ''] and set(view['data']['勢力值分級']) == {'🔵'}
+    assert not isinstance(us.table_view(big.head(10))['data'], pd.DataFrame)
+    # 未給戰功門檻時不替戰功上色，其餘欄位照常
+    html_out = us.style_df_full(big.head(10)).to_html()
+    assert '2.0M' in html_out and us.COLORS['info'] in html_out
+    # 缺少的數值 (快照對比中已離開的成員) 顯示破折號而不是 0
+    left = us.style_df_full(pd.DataFrame({'成員': ['a', 'b'], '勢力值': [np.nan, 20_000.0]})).to_html()
+    assert us.TABLE_NA_REP in left and '>0</td>' not in left
     print("[OK] utils_style basic checks passed")
 except Exception as e:
-    print(f"[FAIL] utils_style checks failed: {e}")
+    print(f"[FAIL] utils_style checks failed: {e!r}")